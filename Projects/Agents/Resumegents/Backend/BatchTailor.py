@@ -0,0 +1,287 @@
+# Offline batch tailoring: every resume in a manifest against its job description.
+#
+# The manifest is JSONL, one pair per line:
+#   {"id": "jane-acme", "resume_pdf": "resumes/jane.pdf", "job_description": "..."}
+# "job_description_file" may be given instead of "job_description", "instructions"
+# is optional, and "id" defaults to a hash of the PDF and job description. Relative
+# paths are resolved against the manifest's directory.
+#
+#   python BatchTailor.py manifest.jsonl --output-dir batch_output --concurrency 8
+#
+# Each unique PDF is parsed once, tailoring calls run on a bounded pool, and every
+# LaTeX result is handed to the compile workers as soon as it arrives. Finished pairs
+# are appended to <output-dir>/results.jsonl; re-running the same command skips
+# pairs that already succeeded.
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional, Set
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from Caching import content_hash
+from LatexCompiler import LatexCompileService
+from ResumeAgent import ResumeAgent
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchItem:
+    id: str
+    resume_pdf: str
+    job_description: str
+    instructions: str = ''
+
+
+@dataclass
+class BatchResult:
+    id: str
+    status: str
+    message: str = ''
+    tex_path: Optional[str] = None
+    pdf_path: Optional[str] = None
+    seconds: float = 0.0
+
+
+def load_manifest(path: str) -> List[BatchItem]:
+    """Read a JSONL manifest into batch items, resolving paths relative to the manifest"""
+    base = os.path.dirname(os.path.abspath(path))
+    items = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            resume_pdf = os.path.join(base, entry['resume_pdf'])
+            job_description = entry.get('job_description')
+            if job_description is None:
+                with open(os.path.join(base, entry['job_description_file']), 'r', encoding='utf-8') as jd:
+                    job_description = jd.read()
+            item_id = entry.get('id') or content_hash(entry['resume_pdf'], job_description, entry.get('instructions', ''))[:16]
+            items.append(BatchItem(
+                id=str(item_id),
+                resume_pdf=resume_pdf,
+                job_description=job_description,
+                instructions=entry.get('instructions', '')
+            ))
+    ids = [item.id for item in items]
+    duplicates = {item_id for item_id in ids if ids.count(item_id) > 1}
+    if duplicates:
+        raise ValueError(f"Duplicate ids in manifest {path}: {sorted(duplicates)}")
+    return items
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    """Ids of pairs that already succeeded in an earlier run"""
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A crash can leave a partial last line
+                continue
+            if record.get('status') == 'success':
+                completed.add(record['id'])
+    return completed
+
+
+class _BatchRun:
+    """State of one BatchTailor.run call, so a tailor can run several batches"""
+
+    def __init__(self, tailor: 'BatchTailor', output_dir: str, model_pool: ThreadPoolExecutor, compile_pool: ThreadPoolExecutor):
+        self.tailor = tailor
+        self.output_dir = output_dir
+        self.model_pool = model_pool
+        self.compile_pool = compile_pool
+        self.results: "queue.Queue[BatchResult]" = queue.Queue()
+        self.started = time.monotonic()
+        self._reported: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def submit(self, pool: ThreadPoolExecutor, items: List[BatchItem], task: Callable[..., None], *args: Any) -> None:
+        """Run a task that reports every one of its items, even if it fails unexpectedly"""
+        def guarded() -> None:
+            try:
+                task(*args)
+            except BaseException as e:
+                logger.exception(f"Batch task failed unexpectedly for {[item.id for item in items]}")
+                for item in items:
+                    self.finish(item, 'error', f"Unexpected failure: {str(e)}")
+        try:
+            pool.submit(guarded)
+        except RuntimeError as e:
+            # The pool was shut down after a stall
+            for item in items:
+                self.finish(item, 'error', str(e))
+
+    def finish(self, item: BatchItem, status: str, message: str = '', **paths: Any) -> None:
+        """Report an item's result; later reports for the same item are ignored"""
+        with self._lock:
+            if item.id in self._reported:
+                return
+            self._reported.add(item.id)
+        self.results.put(BatchResult(
+            id=item.id,
+            status=status,
+            message=message,
+            seconds=round(time.monotonic() - self.started, 3),
+            **paths
+        ))
+
+    def parse(self, pdf_path: str, items: List[BatchItem]) -> None:
+        try:
+            with open(pdf_path, 'rb') as f:
+                parsed = self.tailor.agent.parse_resume_bytes(f.read())
+            if isinstance(parsed, dict) and parsed.get('status') == 'error':
+                raise Exception(parsed['message'])
+        except Exception as e:
+            for item in items:
+                self.finish(item, 'error', f"Parse failed: {str(e)}")
+            return
+        for item in items:
+            self.submit(self.model_pool, [item], self.tailor_item, item, parsed)
+
+    def tailor_item(self, item: BatchItem, parsed: Any) -> None:
+        try:
+            result = self.tailor.agent.generate_tailored_latex(parsed, {}, item.job_description, item.instructions, save=False)
+            if result.get('status') != 'success':
+                raise Exception(result.get('message', 'LaTeX generation failed'))
+            tex_path = os.path.join(self.output_dir, f"{item.id}.tex")
+            with open(tex_path, 'w', encoding='utf-8') as f:
+                f.write(result['latex_code'])
+        except Exception as e:
+            self.finish(item, 'error', str(e))
+            return
+        if self.tailor.compile_pdf:
+            self.submit(self.compile_pool, [item], self.compile, item, result['latex_code'], tex_path)
+        else:
+            self.finish(item, 'success', tex_path=tex_path)
+
+    def compile(self, item: BatchItem, latex_code: str, tex_path: str) -> None:
+        try:
+            pdf_bytes = self.tailor.compile_service.compile(latex_code)
+            pdf_path = os.path.join(self.output_dir, f"{item.id}.pdf")
+            with open(pdf_path, 'wb') as f:
+                f.write(pdf_bytes)
+        except Exception as e:
+            self.finish(item, 'error', f"Compile failed: {str(e)}", tex_path=tex_path)
+            return
+        self.finish(item, 'success', tex_path=tex_path, pdf_path=pdf_path)
+
+
+class BatchTailor:
+    """Tailor many resume/job description pairs with bounded concurrency and checkpointing"""
+
+    def __init__(self,
+                 agent: Optional[ResumeAgent] = None,
+                 compile_service: Optional[LatexCompileService] = None,
+                 concurrency: Optional[int] = None,
+                 compile_pdf: bool = True,
+                 stall_timeout: Optional[float] = None):
+        self.agent = agent or ResumeAgent()
+        self.concurrency = concurrency or int(os.getenv('BATCH_CONCURRENCY', '8'))
+        self.compile_pdf = compile_pdf
+        self.compile_service = compile_service if compile_service or not compile_pdf else LatexCompileService()
+        # Give up on the remaining pairs after this long without any pair finishing
+        self.stall_timeout = stall_timeout or float(os.getenv('BATCH_STALL_TIMEOUT', '1800'))
+
+    def run(self, items: List[BatchItem], output_dir: str) -> List[BatchResult]:
+        """Process every item not already recorded as successful in output_dir/results.jsonl"""
+        os.makedirs(output_dir, exist_ok=True)
+        checkpoint_path = os.path.join(output_dir, 'results.jsonl')
+        completed = load_checkpoint(checkpoint_path)
+        pending = [item for item in items if item.id not in completed]
+        logger.info(f"Batch: {len(items)} pairs, {len(items) - len(pending)} already done, {len(pending)} to run")
+        if not pending:
+            return []
+
+        # Group pairs by PDF content so each resume is parsed once
+        by_pdf: Dict[str, List[BatchItem]] = {}
+        pdf_paths: Dict[str, str] = {}
+        for item in pending:
+            with open(item.resume_pdf, 'rb') as f:
+                key = content_hash(f.read())
+            by_pdf.setdefault(key, []).append(item)
+            pdf_paths.setdefault(key, item.resume_pdf)
+
+        compile_workers = self.compile_service.workers if self.compile_pdf else 1
+        # Compile feeders never outnumber the compile workers, so the service queue cannot overflow
+        model_pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='batch-model')
+        compile_pool = ThreadPoolExecutor(max_workers=compile_workers, thread_name_prefix='batch-compile')
+        batch = _BatchRun(self, output_dir, model_pool, compile_pool)
+        stalled = False
+        results = []
+        try:
+            for key, pdf_items in by_pdf.items():
+                batch.submit(model_pool, pdf_items, batch.parse, pdf_paths[key], pdf_items)
+
+            with open(checkpoint_path, 'a', encoding='utf-8') as checkpoint:
+                for done in range(1, len(pending) + 1):
+                    try:
+                        result = batch.results.get(timeout=self.stall_timeout)
+                    except queue.Empty:
+                        stalled = True
+                        break
+                    self._record(checkpoint, result)
+                    results.append(result)
+                    if done % 10 == 0 or done == len(pending):
+                        elapsed = time.monotonic() - batch.started
+                        logger.info(f"Batch: {done}/{len(pending)} pairs done ({done / elapsed:.2f}/s)")
+
+                if stalled:
+                    reported = {result.id for result in results}
+                    logger.error(f"Batch: no pair finished in {self.stall_timeout:.0f}s; giving up on the remaining pairs")
+                    for item in pending:
+                        if item.id not in reported:
+                            batch.finish(item, 'error', f"Timed out: no progress in {self.stall_timeout:.0f}s")
+                    while not batch.results.empty():
+                        result = batch.results.get()
+                        self._record(checkpoint, result)
+                        results.append(result)
+        finally:
+            # Stuck calls are left to finish in the background instead of blocking the caller
+            model_pool.shutdown(wait=not stalled, cancel_futures=stalled)
+            compile_pool.shutdown(wait=not stalled, cancel_futures=stalled)
+        return results
+
+    @staticmethod
+    def _record(checkpoint, result: BatchResult) -> None:
+        checkpoint.write(json.dumps(asdict(result)) + "\n")
+        checkpoint.flush()
+        os.fsync(checkpoint.fileno())
+
+
+def tailor_batch(manifest_path: str,
+                 output_dir: str = 'batch_output',
+                 concurrency: Optional[int] = None,
+                 compile_pdf: bool = True) -> List[BatchResult]:
+    """Library entry point: run a manifest and return the results of this run"""
+    return BatchTailor(concurrency=concurrency, compile_pdf=compile_pdf).run(load_manifest(manifest_path), output_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tailor resumes to job descriptions in bulk")
+    parser.add_argument('manifest', help="JSONL file of resume_pdf/job_description pairs")
+    parser.add_argument('--output-dir', default='batch_output')
+    parser.add_argument('--concurrency', type=int, default=None, help="concurrent model calls (BATCH_CONCURRENCY)")
+    parser.add_argument('--no-pdf', action='store_true', help="write LaTeX only, skip compiling")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    results = tailor_batch(args.manifest, args.output_dir, args.concurrency, not args.no_pdf)
+    failed = [result for result in results if result.status != 'success']
+    print(f"{len(results) - len(failed)} succeeded, {len(failed)} failed; results in {args.output_dir}/results.jsonl")
+    for result in failed:
+        print(f"  {result.id}: {result.message}")
+
+
+if __name__ == '__main__':
+    main()
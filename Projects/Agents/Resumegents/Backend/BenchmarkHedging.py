@@ -0,0 +1,96 @@
+# Tail latency with and without hedged model calls, and circuit breaker behaviour,
+# against an in-process FakeModelServer with injected slow responses and errors.
+# Run from the Backend directory:  python BenchmarkHedging.py --calls 200 --percentile 95
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+# Keep the rate limiter out of the measurement
+os.environ.setdefault('MODEL_RPM', '100000')
+os.environ.setdefault('MODEL_TPM', '100000000')
+
+import anthropic
+
+import Resilience
+from FakeModelServer import FakeModelHandler
+from ModelRequests import create_message
+from Resilience import CircuitBreaker, CircuitOpenError, Hedger, LatencyTracker
+
+REQUEST = {
+    'model': 'claude-3-5-sonnet-20241022',
+    'max_tokens': 256,
+    'system': 'You are an expert resume consultant.',
+    'messages': [{'role': 'user', 'content': 'Tighten my experience bullets'}]
+}
+
+
+def run_calls(client, calls, concurrency):
+    latencies = LatencyTracker(window=calls)
+
+    def one_call(_):
+        started = time.perf_counter()
+        create_message(client, 'benchmark', **REQUEST)
+        latencies.record(time.perf_counter() - started)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_call, range(calls)))
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hedged requests and circuit breaker against a fake model server")
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.05, help="normal response time (s)")
+    parser.add_argument('--slow-rate', type=float, default=0.05, help="fraction of slow responses")
+    parser.add_argument('--slow-latency', type=float, default=2.0, help="slow response time (s)")
+    parser.add_argument('--percentile', type=float, default=95, help="hedge after this latency percentile")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeModelHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = anthropic.Anthropic(api_key='benchmark', base_url=f"http://127.0.0.1:{server.server_port}", max_retries=0)
+    state = FakeModelHandler.state
+    state.configure(latency=args.latency, slow_rate=args.slow_rate, slow_latency=args.slow_latency)
+
+    print(f"{'mode':>10} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'hedged':>7} {'won':>5}")
+    for mode, percentile in (('plain', 0), ('hedged', args.percentile)):
+        Resilience._hedger = Hedger(percentile=percentile, min_delay=args.latency * 2)
+        # Warm the latency window so hedging has a percentile to work from
+        run_calls(client, 40, args.concurrency)
+        Resilience._hedger.counts.update(calls=0, hedged=0, hedge_wins=0)
+        latencies = run_calls(client, args.calls, args.concurrency)
+        counts = Resilience._hedger.counts
+        print(f"{mode:>10} " + " ".join(f"{latencies.percentile(p) * 1000:>6.0f}ms" for p in (50, 95, 99, 100))
+              + f" {counts['hedged']:>7} {counts['hedge_wins']:>5}")
+
+    # Upstream starts failing: the breaker should open and then reject without calling it
+    Resilience._hedger = Hedger(percentile=0)
+    Resilience._breaker = CircuitBreaker(error_threshold=0.5, min_calls=10, reset_timeout=1.0)
+    state.configure(slow_rate=0.0, error_rate=1.0, error_status=500)
+    before = state.stats()['requests']
+    rejected_after = None
+    for i in range(50):
+        try:
+            create_message(client, 'benchmark', **REQUEST)
+        except CircuitOpenError:
+            rejected_after = rejected_after or i
+        except anthropic.APIStatusError:
+            pass
+    upstream_calls = state.stats()['requests'] - before
+    print(f"\nerror rate 100%: circuit opened after {rejected_after} calls; "
+          f"{upstream_calls} of 50 reached the server, breaker {Resilience._breaker.stats()}")
+
+    # Upstream recovers: after the reset timeout one trial call closes the circuit
+    state.configure(error_rate=0.0)
+    time.sleep(1.1)
+    create_message(client, 'benchmark', **REQUEST)
+    print(f"after recovery: breaker {Resilience._breaker.stats()['state']}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# Benchmark pdflatex compiles with and without a precompiled preamble format.
+# Run from the Backend directory:  python BenchmarkLatexFormat.py [runs]
+import statistics
+import sys
+import tempfile
+import time
+
+from LatexCompiler import LatexCompileService, PreambleFormatCache, split_preamble
+
+SAMPLE_RESUME = r"""\documentclass[11pt]{article}
+\usepackage[margin=0.5in]{geometry}
+\usepackage{setspace}
+\usepackage{titlesec}
+\usepackage{enumitem}
+\usepackage[hidelinks]{hyperref}
+\usepackage{xcolor}
+\setstretch{1.0}
+\pagestyle{empty}
+\titleformat{\section}{\large\bfseries}{}{0em}{}[\titlerule]
+\setlist[itemize]{leftmargin=*, nosep}
+
+\begin{document}
+\begin{center}
+{\LARGE \textbf{Jane Doe}} \\
+jane@example.com \textbar{} (555) 123-4567 \textbar{} \href{https://linkedin.com/in/janedoe}{linkedin.com/in/janedoe}
+\end{center}
+
+\section*{Experience}
+\textbf{Senior Product Manager}, Example Corp \hfill 01/2020 -- Present
+\begin{itemize}
+  \item Led a cross-functional team of 12 to ship an ML-driven recommendation feature.
+  \item Defined product vision and roadmap using large-scale usage data.
+\end{itemize}
+
+\section*{Education}
+\textbf{B.Sc. Computer Science}, Example University \hfill 05/2015
+
+\section*{Skills}
+Python, SQL, Machine Learning, Product Strategy, Roadmapping
+\end{document}
+"""
+
+
+def time_compiles(service, runs):
+    timings = []
+    for i in range(runs):
+        # Vary the body so the rendered-PDF cache never answers
+        latex_code = SAMPLE_RESUME.replace('Jane Doe', f'Jane Doe {i}')
+        start = time.perf_counter()
+        service.compile(latex_code)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(label, timings):
+    print(f"{label:<24} mean {statistics.mean(timings) * 1000:8.1f} ms   "
+          f"median {statistics.median(timings) * 1000:8.1f} ms")
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    plain = LatexCompileService(workers=1, precompiled_preamble=False)
+    baseline = time_compiles(plain, runs)
+
+    format_cache = PreambleFormatCache(directory=tempfile.mkdtemp(prefix='latex_formats_'))
+    preamble, _ = split_preamble(SAMPLE_RESUME)
+    if not format_cache.build(preamble):
+        print("Could not build a preamble format; is pdflatex installed?")
+        return
+    precompiled = LatexCompileService(workers=1, format_cache=format_cache, precompiled_preamble=True)
+    with_format = time_compiles(precompiled, runs)
+
+    report("normal compile", baseline)
+    report("precompiled preamble", with_format)
+    print(f"speedup: {statistics.mean(baseline) / statistics.mean(with_format):.2f}x")
+
+
+if __name__ == '__main__':
+    main()
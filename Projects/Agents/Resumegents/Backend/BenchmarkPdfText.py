@@ -0,0 +1,149 @@
+# Compare resume parse input cost with and without local PDF text extraction.
+# Run from the Backend directory:
+#   python BenchmarkPdfText.py [pdf or directory ...]          # offline estimates
+#   python BenchmarkPdfText.py AzPM.pdf resumes/ --live --runs 3  # real token counts and parse latency
+# A document block is billed as the page text plus an image of every page, so offline the
+# document cost is estimated as the extracted text plus PAGE_IMAGE_TOKENS per page (or
+# PDF_TOKENS_PER_PAGE per page when no text could be extracted); --live asks the API to
+# count tokens, times real parse calls (needs ANTHROPIC_API_KEY) and checks that the text
+# parse agrees with the document parse ('agree': share of parsed field values the two have in common).
+import argparse
+import base64
+import glob
+import os
+import re
+import statistics
+import time
+
+from PdfText import PARSE_INSTRUCTION, build_parse_content, extract_pdf_text
+from RateLimiter import PDF_TOKENS_PER_PAGE, estimate_request_tokens
+from ResumeSchema import RESUME_TOOL, RESUME_TOOL_CHOICE, read_resume, response_output
+
+MODEL = "claude-3-5-sonnet-20241022"
+
+# Image tokens for one rendered page at the API's maximum image size (about 1092x1092 / 750)
+PAGE_IMAGE_TOKENS = 1600
+
+
+def document_content(pdf_base64):
+    return [
+        {"type": "document", "source": {"type": "base64", "media_type": "application/pdf", "data": pdf_base64}},
+        {"type": "text", "text": PARSE_INSTRUCTION}
+    ]
+
+
+def collect_pdfs(paths):
+    pdfs = []
+    for path in paths:
+        if os.path.isdir(path):
+            pdfs.extend(sorted(glob.glob(os.path.join(path, '*.pdf'))))
+        else:
+            pdfs.append(path)
+    return pdfs
+
+
+def count_tokens(client, system, content):
+    return client.messages.count_tokens(
+        model=MODEL,
+        system=system,
+        messages=[{"role": "user", "content": content}]
+    ).input_tokens
+
+
+def time_parse(client, system, content, runs):
+    """Median parse latency and the resume parsed by the last run"""
+    from ModelRequests import create_message
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        response = create_message(client, "resume_parser", model=MODEL, max_tokens=8192, system=system,
+                                  messages=[{"role": "user", "content": content}],
+                                  tools=[RESUME_TOOL], tool_choice=RESUME_TOOL_CHOICE)
+        latencies.append(time.perf_counter() - start)
+    resume, _ = read_resume(*response_output(response))
+    return statistics.median(latencies), resume
+
+
+def field_values(value):
+    """Every leaf value of a parsed resume, normalised for comparison"""
+    if isinstance(value, dict):
+        return {item for child in value.values() for item in field_values(child)}
+    if isinstance(value, list):
+        return {item for child in value for item in field_values(child)}
+    if value is None or value == '':
+        return set()
+    return {re.sub(r'\s+', ' ', str(value)).strip().lower()}
+
+
+def parse_agreement(document_resume, text_resume):
+    document_values, text_values = field_values(document_resume), field_values(text_resume)
+    return len(document_values & text_values) / max(1, len(document_values | text_values))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF text extraction vs document blocks for resume parsing")
+    parser.add_argument('paths', nargs='*', default=['AzPM.pdf'], help="PDF files or directories of PDFs")
+    parser.add_argument('--live', action='store_true', help="count tokens and time parses against the API")
+    parser.add_argument('--runs', type=int, default=1, help="parse calls per mode with --live")
+    args = parser.parse_args()
+
+    client = system = None
+    if args.live:
+        from ModelClient import get_model_client
+        from PromptRegistry import get_prompt_registry
+        client = get_model_client()
+        system = get_prompt_registry().text('ResumeParser')
+
+    print(f"{'pdf':<28} {'pages':>5} {'chars/pg':>8} {'merged':>6} {'mode':>8} {'extract':>8} {'doc tok':>8} {'text tok':>8} {'saved':>6}"
+          + (f" {'doc s':>7} {'text s':>7} {'agree':>6}" if args.live else ''))
+    totals = {'document': 0, 'sent': 0}
+    agreements = []
+    for path in collect_pdfs(args.paths):
+        with open(path, 'rb') as f:
+            pdf_bytes = f.read()
+        pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
+
+        start = time.perf_counter()
+        content, mode = build_parse_content(pdf_bytes, pdf_base64)
+        extract_ms = (time.perf_counter() - start) * 1000
+        extracted = extract_pdf_text(pdf_bytes)
+        pages = extracted.pages if extracted else 0
+
+        if args.live:
+            document_tokens = count_tokens(client, system, document_content(pdf_base64))
+            sent_tokens = count_tokens(client, system, content)
+        else:
+            sent_tokens = estimate_request_tokens({'messages': [{'role': 'user', 'content': content}]})
+            if mode == 'text':
+                document_tokens = sent_tokens + pages * PAGE_IMAGE_TOKENS
+            else:
+                document_tokens = max(1, pages) * (PDF_TOKENS_PER_PAGE + PAGE_IMAGE_TOKENS)
+                sent_tokens = document_tokens
+        totals['document'] += document_tokens
+        totals['sent'] += sent_tokens
+
+        density = extracted.chars_per_page if extracted else 0
+        merged = extracted.merged_ratio if extracted else 0
+        saved = 1 - sent_tokens / max(1, document_tokens)
+        line = (f"{os.path.basename(path)[:28]:<28} {pages:>5} {density:>8.0f} {merged:>6.1%} {mode:>8} {extract_ms:>6.0f}ms "
+                f"{document_tokens:>8} {sent_tokens:>8} {saved:>6.0%}")
+        if args.live:
+            document_seconds, document_resume = time_parse(client, system, document_content(pdf_base64), args.runs)
+            line += f" {document_seconds:>6.2f}s"
+            if mode == 'text':
+                text_seconds, text_resume = time_parse(client, system, content, args.runs)
+                agreement = parse_agreement(document_resume, text_resume)
+                agreements.append(agreement)
+                line += f" {text_seconds:>6.2f}s {agreement:>6.0%}"
+        print(line)
+
+    print(f"\nTotal input tokens: {totals['document']} as documents, {totals['sent']} with extraction "
+          f"({1 - totals['sent'] / max(1, totals['document']):.0%} fewer)"
+          + ("" if args.live else " - offline estimates; use --live for exact counts"))
+    if agreements:
+        print(f"Text parses agree with document parses on {statistics.mean(agreements):.0%} of field values "
+              f"(worst {min(agreements):.0%})")
+
+
+if __name__ == '__main__':
+    main()
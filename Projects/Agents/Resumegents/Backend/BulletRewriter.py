@@ -0,0 +1,147 @@
+from typing import Callable, Dict, List, Optional, Tuple
+import copy
+import json
+import logging
+import re
+
+from Caching import FragmentCache, content_hash
+from JobKeywords import JOB_CONTEXT_MODE, MAX_REWRITE_BULLETS, get_job_index, job_context
+from ModelRequests import SystemPrompt, cached_system_prompt
+from PromptRegistry import PromptRegistry, get_prompt_registry
+from ResumeHistory import apply_patch
+from SectionGenerator import get_fragment_cache
+from Telemetry import timed
+
+logger = logging.getLogger(__name__)
+
+REWRITER_TEMPLATE = 'BulletRewriter'
+
+# Free-text fields the model may rewrite, per section and per entry
+REWRITABLE_FIELDS = {
+    'experience': ('responsibilities', 'achievements'),
+    'projects': ('description', 'achievements'),
+    'volunteer_experience': ('description', 'impact')
+}
+
+
+def collect_bullets(resume: Dict) -> Dict[str, str]:
+    """Rewritable text in a parsed resume, keyed by JSON pointer"""
+    bullets = {}
+    personal = resume.get('personal_info') or {}
+    for key in ('summary', 'objective'):
+        if isinstance(personal.get(key), str) and personal[key].strip():
+            bullets[f"/personal_info/{key}"] = personal[key]
+    for section, fields in REWRITABLE_FIELDS.items():
+        for i, entry in enumerate(resume.get(section) or []):
+            if not isinstance(entry, dict):
+                continue
+            for field in fields:
+                value = entry.get(field)
+                if isinstance(value, str) and value.strip():
+                    bullets[f"/{section}/{i}/{field}"] = value
+                elif isinstance(value, list):
+                    for j, item in enumerate(value):
+                        if isinstance(item, str) and item.strip():
+                            bullets[f"/{section}/{i}/{field}/{j}"] = item
+    return bullets
+
+
+def parse_rewrites(text: str, allowed: Dict[str, str]) -> Dict[str, str]:
+    """Model reply as {pointer: new text}, keeping only pointers that were offered"""
+    text = re.sub(r'^```[a-zA-Z]*\s*|\s*```$', '', text.strip())
+    rewrites = json.loads(text[text.find('{'):text.rfind('}') + 1])
+    if not isinstance(rewrites, dict):
+        raise ValueError("Bullet rewrite reply is not a JSON object")
+    unknown = [key for key in rewrites if key not in allowed]
+    if unknown:
+        logger.warning(f"Ignoring rewrites for unknown fields: {unknown}")
+    return {
+        key: value.strip()
+        for key, value in rewrites.items()
+        if key in allowed and isinstance(value, str) and value.strip()
+    }
+
+
+def apply_rewrites(resume: Dict, rewrites: Dict[str, str]) -> Dict:
+    """Copy of resume with each rewritten field replaced"""
+    return apply_patch(copy.deepcopy(resume), [
+        {'op': 'replace', 'path': pointer, 'value': text} for pointer, text in rewrites.items()
+    ])
+
+
+class BulletRewriter:
+    """Tailor the wording of a resume's bullets while the layout comes from LatexTemplates
+
+    The model sees the rewritable fields keyed by JSON pointer and returns only the
+    ones it changed, so output tokens scale with the edits rather than the document.
+    Replies are cached under the bullets, the job description, the guidance and the
+    prompt version.
+    """
+
+    def __init__(self,
+                 call_model: Callable[[SystemPrompt, List[Dict]], str],
+                 cache: Optional[FragmentCache] = None,
+                 prompt_registry: Optional[PromptRegistry] = None):
+        self.call_model = call_model
+        self.cache = cache or get_fragment_cache()
+        self.prompt_registry = prompt_registry or get_prompt_registry()
+
+    @timed('bullet_rewrite')
+    def rewrite(self,
+                resume: Dict,
+                job_description: str,
+                guidance: Optional[Dict[str, str]] = None) -> Tuple[Dict, Dict[str, int]]:
+        """Return (tailored_resume, stats); guidance maps a section (or '*') to feedback text"""
+        bullets = self._select_bullets(collect_bullets(resume), job_description)
+        stats = {'bullets': len(bullets), 'rewritten': 0, 'cached': 0}
+        if not bullets:
+            return copy.deepcopy(resume), stats
+
+        template = self.prompt_registry.get(REWRITER_TEMPLATE)
+        guidance = {section: text for section, text in (guidance or {}).items() if text}
+        key = content_hash(
+            'bullets',
+            json.dumps(bullets, sort_keys=True),
+            content_hash(JOB_CONTEXT_MODE, job_description or ''),
+            json.dumps(guidance, sort_keys=True),
+            template.version_id
+        )
+        rewrites = self.cache.get(key)
+        if rewrites is not None:
+            stats['cached'] = 1
+        else:
+            rewrites = self._request_rewrites(template.text, bullets, job_description, guidance)
+            self.cache.put(key, rewrites)
+
+        stats['rewritten'] = len(rewrites)
+        logger.info(f"Bullet rewrite: {stats['rewritten']} of {stats['bullets']} fields changed"
+                    f"{' (cached)' if stats['cached'] else ''}")
+        return apply_rewrites(resume, rewrites), stats
+
+    @staticmethod
+    def _select_bullets(bullets: Dict[str, str], job_description: str) -> Dict[str, str]:
+        """Only the bullets that best match the posting are offered for rewriting; the rest stay verbatim"""
+        if JOB_CONTEXT_MODE == 'full' or len(bullets) <= MAX_REWRITE_BULLETS:
+            return bullets
+        scores = get_job_index(job_description).score_texts(bullets)
+        chosen = set(sorted(bullets, key=lambda pointer: -scores[pointer])[:MAX_REWRITE_BULLETS])
+        # The summary is always worth tailoring
+        chosen.update(pointer for pointer in bullets if pointer.startswith('/personal_info/'))
+        return {pointer: text for pointer, text in bullets.items() if pointer in chosen}
+
+    def _request_rewrites(self,
+                          instructions: str,
+                          bullets: Dict[str, str],
+                          job_description: str,
+                          guidance: Dict[str, str]) -> Dict[str, str]:
+        system_prompt = cached_system_prompt(instructions, f"Job description:\n\n{job_context(job_description)}")
+        content = f"Resume text:\n{json.dumps(bullets, indent=2)}"
+        if guidance:
+            content += f"\n\nGuidance by section ('*' applies to all):\n{json.dumps(guidance, indent=2)}"
+        messages = [{"role": "user", "content": content}]
+        try:
+            return parse_rewrites(self.call_model(system_prompt, messages), bullets)
+        except ValueError as e:
+            # One retry for a reply that is not a JSON object before failing the document
+            logger.warning(f"Retrying malformed bullet rewrite: {str(e)}")
+            return parse_rewrites(self.call_model(system_prompt, messages), bullets)
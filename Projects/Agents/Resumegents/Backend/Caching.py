@@ -0,0 +1,254 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(*parts: Any) -> str:
+    """Build a stable sha256 hex digest from bytes/str parts"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache bounded by entry count and/or total size"""
+
+    def __init__(self,
+                 max_entries: Optional[int] = 128,
+                 max_bytes: Optional[int] = None,
+                 sizeof: Callable[[Any], int] = len):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, key: str, value: Any) -> None:
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            if self.max_bytes is not None and size > self.max_bytes:
+                # Never let one oversized value flush the whole cache
+                return
+            if key in self._entries:
+                self._total_bytes -= self._sizes.pop(key)
+                del self._entries[key]
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._total_bytes += size
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._entries and (
+            (self.max_entries is not None and len(self._entries) > self.max_entries)
+            or (self.max_bytes is not None and self._total_bytes > self.max_bytes)
+        ):
+            key, _ = self._entries.popitem(last=False)
+            self._total_bytes -= self._sizes.pop(key)
+            self.evictions += 1
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self._total_bytes
+        }
+
+
+class DiskCache:
+    """Directory-backed JSON cache with size-based, least-recently-used eviction"""
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Dropping unreadable cache entry {path}: {str(e)}")
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        # Touch the file so eviction treats it as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        # Write atomically so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        self._evict()
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.directory):
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+            entries.sort()
+            while entries and total > self.max_bytes:
+                _, size, path = entries.pop(0)
+                self._remove(path)
+                total -= size
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+class TieredCache:
+    """Two-tier cache: an in-memory LRU in front of a DiskCache"""
+
+    def __init__(self, directory: str, max_memory_entries: int = 256, max_disk_bytes: int = 64 * 1024 * 1024):
+        self.memory = LRUCache(max_entries=max_memory_entries)
+        self.disk = DiskCache(directory, max_bytes=max_disk_bytes)
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        value = self.disk.get(key)
+        if value is not None:
+            # Promote to the memory tier for the next lookup
+            self.memory.put(key, value)
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        self.memory.put(key, value)
+        try:
+            self.disk.put(key, value)
+        except Exception as e:
+            logger.warning(f"Could not persist cache entry to {self.disk.directory}: {str(e)}")
+
+    @property
+    def hits(self) -> int:
+        return self.memory.hits + self.disk.hits
+
+    @property
+    def misses(self) -> int:
+        # A memory miss that hits disk is not a miss overall
+        return self.disk.misses
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'memory': self.memory.stats(),
+            'disk': self.disk.stats()
+        }
+
+
+class ParseCache(TieredCache):
+    """Parsed resumes keyed by PDF content and parser prompt version"""
+
+    def __init__(self,
+                 directory: Optional[str] = None,
+                 max_memory_entries: int = 256,
+                 max_disk_bytes: Optional[int] = None):
+        super().__init__(
+            directory or os.getenv('RESUME_PARSE_CACHE_DIR', os.path.join('cache', 'parsed_resumes')),
+            max_memory_entries,
+            max_disk_bytes or int(os.getenv('RESUME_PARSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+        )
+
+    @staticmethod
+    def make_key(pdf_bytes: bytes, prompt_version: str) -> str:
+        return content_hash(pdf_bytes, prompt_version)
+
+
+class FragmentCache(TieredCache):
+    """Generated LaTeX fragments keyed by section source, job description and prompt version"""
+
+    def __init__(self,
+                 directory: Optional[str] = None,
+                 max_memory_entries: int = 1024,
+                 max_disk_bytes: Optional[int] = None):
+        super().__init__(
+            directory or os.getenv('SECTION_CACHE_DIR', os.path.join('cache', 'latex_fragments')),
+            max_memory_entries,
+            max_disk_bytes or int(os.getenv('SECTION_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+        )
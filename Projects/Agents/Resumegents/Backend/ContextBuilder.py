@@ -0,0 +1,182 @@
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import os
+import re
+
+# Rough chars-per-token ratio for English prose and JSON; close enough for budgeting
+CHARS_PER_TOKEN = 4
+
+# Words in a user message that point the conversation at a resume section
+SECTION_KEYWORDS = {
+    'experience': ['experience', 'work history', 'job', 'role', 'position', 'employment', 'bullet'],
+    'education': ['education', 'degree', 'university', 'college', 'school', 'gpa', 'coursework'],
+    'skills': ['skill', 'technolog', 'tools', 'frameworks', 'languages', 'certification'],
+    'projects': ['project'],
+    'personal_info': ['summary', 'objective', 'contact', 'header', 'linkedin', 'email', 'phone'],
+    'volunteer_experience': ['volunteer'],
+    'awards': ['award', 'honor'],
+    'publications': ['publication', 'paper']
+}
+
+CHAT_INSTRUCTIONS = """You are an expert resume consultant.
+
+Provide specific, actionable advice for improving the resume based on the conversation history.
+If suggesting changes, be specific about what should be modified and why."""
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN) if text else 0
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max(0, max_chars - 3)] + "..."
+
+
+def detect_focus(message: str, resume: Optional[Dict]) -> Optional[str]:
+    """Return the resume section a message is about, if it names one"""
+    lowered = message.lower()
+    for section, keywords in SECTION_KEYWORDS.items():
+        if resume is not None and section not in resume:
+            continue
+        if any(keyword in lowered for keyword in keywords):
+            return section
+    return None
+
+
+def summarize_turn(role: str, content: str, max_chars: int = 240) -> str:
+    """Compress one turn to its first sentence or two for the rolling summary"""
+    text = re.sub(r'\s+', ' ', content).strip()
+    sentences = re.split(r'(?<=[.!?])\s', text)
+    summary = sentences[0]
+    if len(sentences) > 1 and len(summary) + len(sentences[1]) < max_chars:
+        summary += ' ' + sentences[1]
+    if len(summary) > max_chars:
+        summary = summary[:max_chars - 3] + '...'
+    return f"{role}: {summary}"
+
+
+class ContextBuilder:
+    """Fit the chat prompt into a token budget: recent turns verbatim, older turns summarized,
+    and only the resume sections relevant to the current focus"""
+
+    def __init__(self,
+                 token_budget: Optional[int] = None,
+                 recent_turns: Optional[int] = None,
+                 summary_budget: Optional[int] = None):
+        self.token_budget = token_budget or int(os.getenv('CHAT_CONTEXT_TOKEN_BUDGET', '6000'))
+        self.recent_turns = recent_turns or int(os.getenv('CHAT_RECENT_TURNS', '4'))
+        self.summary_budget = summary_budget or max(200, self.token_budget // 8)
+
+    def update_summary(self, summary_lines: List[str], history: List[Any], checkpoint: int) -> Tuple[List[str], int]:
+        """Fold turns that have aged out of the verbatim window into the rolling summary
+
+        Returns the new summary lines and the index of the first message not summarized.
+        """
+        dialogue = [i for i, msg in enumerate(history) if msg.role in ('user', 'assistant')]
+        # Everything before the verbatim window (which includes the pending user message)
+        window_start = dialogue[-(self.recent_turns * 2 + 1)] if len(dialogue) > self.recent_turns * 2 else 0
+        lines = list(summary_lines)
+        for i in range(checkpoint, window_start):
+            msg = history[i]
+            if msg.role in ('user', 'assistant'):
+                lines.append(summarize_turn(msg.role, msg.content))
+
+        # Keep the newest summary lines that fit the summary budget
+        while lines and estimate_tokens("\n".join(lines)) > self.summary_budget:
+            lines.pop(0)
+        return lines, max(checkpoint, window_start)
+
+    def recent_messages(self, history: List[Any]) -> List[Dict]:
+        """Last N turns as alternating user/assistant messages, ending with the newest user message"""
+        dialogue = [msg for msg in history if msg.role in ('user', 'assistant')]
+        window = dialogue[-(self.recent_turns * 2 + 1):]
+
+        messages: List[Dict] = []
+        for msg in window:
+            if messages and messages[-1]['role'] == msg.role:
+                # A failed turn leaves two user messages in a row; the API needs alternation
+                messages[-1]['content'] += "\n\n" + msg.content
+            else:
+                messages.append({'role': msg.role, 'content': msg.content})
+        while messages and messages[0]['role'] != 'user':
+            messages.pop(0)
+        return messages
+
+    def resume_context(self, resume: Optional[Dict], focus: Optional[str], max_tokens: int) -> Dict:
+        """The focused section in full plus an outline of the rest, trimmed to the budget"""
+        if not resume:
+            return {}
+        outline = {
+            section: (len(value) if isinstance(value, list) else sorted(value.keys()) if isinstance(value, dict) else value)
+            for section, value in resume.items()
+            if section != 'personal_info'
+        }
+        name = (resume.get('personal_info') or {}).get('name') if isinstance(resume.get('personal_info'), dict) else None
+
+        if focus and focus in resume:
+            context = {'name': name, 'focus_section': {focus: resume[focus]}, 'outline': outline}
+        else:
+            context = {'resume': resume}
+
+        if estimate_tokens(json.dumps(context, separators=(',', ':'))) > max_tokens:
+            # Fall back to the outline and trimmed focus section
+            focused = json.dumps(resume.get(focus), separators=(',', ':')) if focus else ""
+            context = {
+                'name': name,
+                'outline': outline,
+                'focus_section': truncate_to_tokens(focused, max_tokens // 2) if focused else None
+            }
+        return context
+
+    def build(self,
+              history: List[Any],
+              summary_lines: List[str],
+              resume: Optional[Dict],
+              resume_version: Optional[int],
+              total_versions: int,
+              job_description: Optional[str],
+              current_focus: Optional[str]) -> Tuple[str, List[Dict]]:
+        """Build (system_prompt, messages) for a chat turn within the token budget"""
+        messages = self.recent_messages(history)
+
+        # The newest user message is always sent; older verbatim turns go first if over budget
+        def message_tokens() -> int:
+            return sum(estimate_tokens(m['content']) for m in messages)
+
+        base_tokens = estimate_tokens(CHAT_INSTRUCTIONS)
+        context_budget = max(0, self.token_budget - base_tokens)
+        summary_lines = list(summary_lines)
+        while len(messages) > 1 and message_tokens() > context_budget // 2:
+            # Dropped turns stay in the summary until update_summary folds them in for good
+            summary_lines.extend(summarize_turn(m['role'], m['content']) for m in messages[:2])
+            messages = messages[2:]
+        while summary_lines and estimate_tokens("\n".join(summary_lines)) > self.summary_budget:
+            summary_lines.pop(0)
+        if messages and message_tokens() > context_budget // 2:
+            # A single user message over budget is cut down rather than sent whole
+            messages[-1]['content'] = truncate_to_tokens(messages[-1]['content'], context_budget // 2)
+
+        remaining = max(0, context_budget - message_tokens())
+        context = {
+            "resume_version": resume_version,
+            "total_versions": total_versions,
+            "current_focus": current_focus,
+            "job_description": truncate_to_tokens(job_description or "", remaining // 4) or None
+        }
+        remaining -= estimate_tokens(json.dumps(context))
+        summary = "\n".join(summary_lines)
+        remaining -= estimate_tokens(summary)
+        context["resume"] = self.resume_context(resume, current_focus, max(0, remaining))
+
+        system_prompt = f"""{CHAT_INSTRUCTIONS}
+
+Current context: {json.dumps(context, separators=(',', ':'))}"""
+        if summary:
+            system_prompt += f"""
+
+Summary of earlier conversation:
+{summary}"""
+        return system_prompt, messages
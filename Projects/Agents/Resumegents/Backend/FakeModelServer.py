@@ -0,0 +1,226 @@
+# Local stand-in for the Anthropic Messages API, for exercising the agents without
+# network access or token spend. It mimics prompt caching: system blocks up to the
+# last cache_control marker are remembered, and repeat prefixes are reported as
+# cache reads in the usage block. Slow responses and upstream errors can be injected
+# to exercise hedging and the circuit breaker, at start-up or at runtime via /config.
+#
+#   python FakeModelServer.py --port 8089 --slow-rate 0.05 --slow-latency 10
+#   curl -X POST http://127.0.0.1:8089/config -d '{"error_rate": 1.0}'
+#   ANTHROPIC_BASE_URL=http://127.0.0.1:8089 python ResumeAppBuilder.py
+#   curl http://127.0.0.1:8089/stats
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+
+FAKE_LATEX = "\\documentclass{article}\n\\begin{document}\nFake resume\n\\end{document}"
+FAKE_FRAGMENT = "\\textbf{Fake section}"
+FAKE_RESUME = {
+    "personal_info": {"name": "Fake Candidate", "email": "fake@example.com"},
+    "experience": [{"company": "Example Corp", "title": "Engineer", "responsibilities": ["Built things"]}],
+    "skills": {"technical": ["Python"]}
+}
+
+
+def fake_rewrites(content: str) -> str:
+    """Bullet rewrite reply that changes the first field offered"""
+    bullets = json.loads(content[content.find('{'):content.find('\n}') + 2])
+    return json.dumps({pointer: f"Fake rewrite: {text}" for pointer, text in list(bullets.items())[:1]})
+
+
+CACHE_TTL_SECONDS = 300
+
+
+def estimate_tokens(value):
+    return max(1, len(json.dumps(value)) // 4)
+
+
+class FakeModelState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cached_prefixes = {}
+        self.requests = 0
+        self.cache_reads = 0
+        self.cache_writes = 0
+        self.slow_responses = 0
+        self.injected_errors = 0
+        # Fault injection: every response takes `latency` seconds, a `slow_rate` fraction
+        # take `slow_latency` instead, and an `error_rate` fraction fail with `error_status`
+        self.config = {'latency': 0.0, 'slow_rate': 0.0, 'slow_latency': 0.0, 'error_rate': 0.0, 'error_status': 529}
+
+    def configure(self, **settings):
+        with self.lock:
+            self.config.update({key: value for key, value in settings.items() if key in self.config})
+            return dict(self.config)
+
+    def inject(self):
+        """Return (delay_seconds, error_status or None) for the next request"""
+        with self.lock:
+            config = dict(self.config)
+            delay = config['latency']
+            if random.random() < config['slow_rate']:
+                self.slow_responses += 1
+                delay = config['slow_latency']
+            if random.random() < config['error_rate']:
+                self.injected_errors += 1
+                return delay, int(config['error_status'])
+            return delay, None
+
+    def account_cache(self, system):
+        """Return (cache_read, cache_creation, uncached) token counts for the system prompt"""
+        if not isinstance(system, list):
+            return 0, 0, estimate_tokens(system or "")
+        marker = max((i for i, block in enumerate(system) if block.get('cache_control')), default=-1)
+        prefix, rest = system[:marker + 1], system[marker + 1:]
+        uncached = estimate_tokens(rest) if rest else 0
+        if not prefix:
+            return 0, 0, uncached
+
+        key = hashlib.sha256(json.dumps(prefix, sort_keys=True).encode('utf-8')).hexdigest()
+        now = time.time()
+        with self.lock:
+            expires = self.cached_prefixes.get(key)
+            self.cached_prefixes[key] = now + CACHE_TTL_SECONDS
+            if expires and expires > now:
+                self.cache_reads += 1
+                return estimate_tokens(prefix), 0, uncached
+            self.cache_writes += 1
+            return 0, estimate_tokens(prefix), uncached
+
+    def stats(self):
+        with self.lock:
+            hit_rate = self.cache_reads / (self.cache_reads + self.cache_writes) if self.cache_reads + self.cache_writes else 0.0
+            return {
+                'requests': self.requests,
+                'cache_reads': self.cache_reads,
+                'cache_writes': self.cache_writes,
+                'cache_hit_rate': hit_rate,
+                'slow_responses': self.slow_responses,
+                'injected_errors': self.injected_errors,
+                'config': dict(self.config)
+            }
+
+
+class FakeModelHandler(BaseHTTPRequestHandler):
+    state = FakeModelState()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._send_json(200, self.state.stats())
+        else:
+            self._send_json(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': self.path}})
+
+    def do_POST(self):
+        if self.path == '/config':
+            length = int(self.headers.get('Content-Length', 0))
+            self._send_json(200, self.state.configure(**json.loads(self.rfile.read(length) or b'{}')))
+            return
+        if not self.path.startswith('/v1/messages'):
+            self._send_json(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': self.path}})
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        with self.state.lock:
+            self.state.requests += 1
+
+        delay, error_status = self.state.inject()
+        time.sleep(delay)
+        if error_status:
+            error_type = 'overloaded_error' if error_status == 529 else 'api_error'
+            self._send_json(error_status, {'type': 'error', 'error': {'type': error_type, 'message': 'Injected failure'}})
+            return
+
+        system = body.get('system')
+        cache_read, cache_creation, uncached = self.state.account_cache(system)
+        messages_text = json.dumps(body.get('messages', []))
+        if 'Section data:' in messages_text:
+            reply = FAKE_FRAGMENT
+        elif 'Resume text:' in messages_text:
+            reply = fake_rewrites(body['messages'][-1]['content'])
+        else:
+            reply = FAKE_LATEX if 'LaTeX' in json.dumps(system) else '{}'
+        content = [{'type': 'text', 'text': reply}]
+        if body.get('tools'):
+            # Forced tool calls answer with the tool's arguments instead of text
+            reply = json.dumps(FAKE_RESUME)
+            content = [{'type': 'tool_use', 'id': f"toolu_fake_{uuid.uuid4().hex[:24]}",
+                        'name': body['tools'][0]['name'], 'input': FAKE_RESUME}]
+        usage = {
+            'input_tokens': uncached + estimate_tokens(body.get('messages', [])),
+            'output_tokens': estimate_tokens(reply),
+            'cache_read_input_tokens': cache_read,
+            'cache_creation_input_tokens': cache_creation
+        }
+        message = {
+            'id': f"msg_fake_{uuid.uuid4().hex[:24]}",
+            'type': 'message',
+            'role': 'assistant',
+            'model': body.get('model', 'fake-model'),
+            'content': content,
+            'stop_reason': 'tool_use' if body.get('tools') else 'end_turn',
+            'stop_sequence': None,
+            'usage': usage
+        }
+        if body.get('stream'):
+            self._send_stream(message, reply)
+        else:
+            self._send_json(200, message)
+
+    def _send_stream(self, message, reply):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+
+        def event(name, data):
+            self.wfile.write(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        start = dict(message, content=[], stop_reason=None)
+        event('message_start', {'type': 'message_start', 'message': start})
+        event('content_block_start', {'type': 'content_block_start', 'index': 0, 'content_block': {'type': 'text', 'text': ''}})
+        for i in range(0, len(reply), 16):
+            event('content_block_delta', {'type': 'content_block_delta', 'index': 0,
+                                          'delta': {'type': 'text_delta', 'text': reply[i:i + 16]}})
+        event('content_block_stop', {'type': 'content_block_stop', 'index': 0})
+        event('message_delta', {'type': 'message_delta', 'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+                                'usage': {'output_tokens': message['usage']['output_tokens']}})
+        event('message_stop', {'type': 'message_stop'})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Anthropic Messages API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--slow-rate', type=float, default=0.0, help="fraction of responses that are slow")
+    parser.add_argument('--slow-latency', type=float, default=0.0, help="seconds a slow response takes")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument('--error-status', type=int, default=529, help="HTTP status of injected failures")
+    args = parser.parse_args()
+
+    FakeModelHandler.state.configure(
+        latency=args.latency, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+        error_rate=args.error_rate, error_status=args.error_status
+    )
+    server = ThreadingHTTPServer((args.host, args.port), FakeModelHandler)
+    print(f"Fake model server listening on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+import copy
+import json
+import math
+import os
+import re
+
+from Caching import LRUCache, content_hash
+
+# 'keywords' sends a compact keyword/requirement summary of the job description in
+# tailoring prompts; 'full' sends the whole text as before
+JOB_CONTEXT_MODE = os.getenv('JOB_CONTEXT_MODE', 'keywords')
+
+MAX_KEYWORDS = int(os.getenv('JOB_MAX_KEYWORDS', '30'))
+MAX_REQUIREMENTS = int(os.getenv('JOB_MAX_REQUIREMENTS', '10'))
+BULLETS_PER_ROLE = int(os.getenv('JOB_BULLETS_PER_ROLE', '5'))
+MAX_SKILLS = int(os.getenv('JOB_MAX_SKILLS', '20'))
+MAX_REWRITE_BULLETS = int(os.getenv('JOB_MAX_REWRITE_BULLETS', '30'))
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+STOPWORDS = frozenset("""
+a about above after all also an and any are as at be been being both but by can could do does doing
+each etc for from had has have having he her here how i if in into is it its just may me more most
+must my no not of on or other our ours out over own per please same she should so some such than that
+the their them then there these they this those through to too under until up us very was we were what
+when where which while who whom why will with within without would you your yours
+ability able across actively along among apply applicant applicants candidate candidates including
+new role position join looking opportunity opportunities plus preferred required requirement
+requirements responsibilities responsibility qualification qualifications related strong well work
+working year years ideal ideally company job jobs team teams environment day help make use using
+experience experienced knowledge background skill skills excellent nice have good great
+benefit benefits competitive culture salary remote hybrid office equal employer
+""".split())
+
+# Generic postings across fields: words common to all of them ("experience",
+# "communication", "team") get a low IDF, words specific to the target posting a high one
+BACKGROUND_CORPUS = [
+    "Software engineer to design, build and maintain scalable backend services and APIs. Experience with Python, Java or Go, cloud platforms, code reviews and agile delivery. Strong communication skills.",
+    "Frontend developer building responsive web applications with JavaScript, TypeScript and React. Collaborate with designers and product managers. Experience with testing and accessibility.",
+    "Data scientist to develop machine learning models, run experiments and analyse large datasets with Python and SQL. Communicate insights to stakeholders and drive product decisions.",
+    "Data analyst producing dashboards and reports in SQL, Excel and Tableau. Partner with business teams to define metrics and deliver insights. Attention to detail.",
+    "Product manager owning the roadmap, gathering customer requirements, prioritising features and working with engineering and design to launch products. Excellent communication and leadership.",
+    "DevOps engineer managing CI/CD pipelines, Kubernetes clusters, infrastructure as code with Terraform and monitoring on AWS. On-call rotation and incident response.",
+    "Security analyst monitoring threats, responding to incidents, performing vulnerability assessments and maintaining compliance with security standards and policies.",
+    "Marketing manager planning campaigns across digital channels, managing budgets, analysing performance metrics and growing brand awareness. Strong writing and communication skills.",
+    "Sales representative generating leads, managing the pipeline in a CRM, negotiating contracts and exceeding quarterly targets. Excellent interpersonal skills.",
+    "Registered nurse providing patient care, administering medication, maintaining records and collaborating with physicians in a fast-paced hospital environment.",
+    "Financial analyst building forecasts and financial models, preparing budgets and variance reports, and supporting leadership with investment analysis. Advanced Excel.",
+    "Accountant handling general ledger, reconciliations, month-end close, tax filings and audits in compliance with accounting standards.",
+    "UX designer conducting user research, creating wireframes and prototypes in Figma and iterating on designs with product and engineering teams.",
+    "Operations manager improving processes, managing vendors and logistics, tracking KPIs and leading a team to deliver on time and on budget.",
+    "Human resources generalist supporting recruiting, onboarding, employee relations, benefits administration and HR policies.",
+    "Customer support specialist resolving customer issues by phone, email and chat, documenting tickets and improving customer satisfaction.",
+    "Teacher planning lessons, assessing student progress, managing the classroom and communicating with parents and colleagues.",
+    "Mechanical engineer designing components in CAD, running simulations, testing prototypes and working with manufacturing on production.",
+    "Project manager coordinating cross-functional teams, managing scope, schedules, risks and stakeholders, and reporting project status.",
+    "Research scientist publishing papers, designing experiments, securing grants and presenting results at conferences."
+]
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#./-]*[a-z0-9+#]|[a-z0-9]", re.IGNORECASE)
+# Bigrams never span punctuation ("machine learning, learning to rank")
+_PHRASE_BREAK_RE = re.compile(r"[,;:!?()\[\]|\n]|\.(?:\s|$)|\s[-–—]\s")
+_NUMBER_RE = re.compile(r"^[\d.,/%+-]+$")
+_REQUIREMENT_RE = re.compile(r"\b(must|required|requires?|proficien\w*|experience (with|in)|knowledge of|familiar\w* with|"
+                             r"degree|years|expert\w*|strong|ability to)\b", re.IGNORECASE)
+
+
+def _token_forms(text: str) -> List[Tuple[str, str]]:
+    """(matching form, surface form) of each content token"""
+    forms = []
+    for surface in _TOKEN_RE.findall(text or ''):
+        token = surface.lower()
+        if token in STOPWORDS or _NUMBER_RE.match(token):
+            continue
+        # Light plural folding so "APIs" matches "API"; only used for matching, since it
+        # also clips words like "analysis" and "Kubernetes"
+        if len(token) > 3 and token.isalpha() and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        forms.append((token, surface))
+    return forms
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased content tokens keeping terms like c++, c#, node.js and ci/cd intact"""
+    return [token for token, _ in _token_forms(text)]
+
+
+def term_forms(text: str) -> List[Tuple[str, str]]:
+    """(term, surface form) of content unigrams plus bigrams of content words adjacent within one phrase"""
+    unigrams, bigrams = [], []
+    for phrase in _PHRASE_BREAK_RE.split(text or ''):
+        words = _TOKEN_RE.findall(phrase)
+        for first, second in zip(words, words[1:]):
+            pair = _token_forms(f"{first} {second}")
+            if len(pair) == 2:
+                bigrams.append((" ".join(token for token, _ in pair), f"{first} {second}"))
+        unigrams.extend(_token_forms(phrase))
+    return unigrams + bigrams
+
+
+def terms(text: str) -> List[str]:
+    """Content unigrams plus bigrams of content words adjacent within one phrase"""
+    return [term for term, _ in term_forms(text)]
+
+
+_background_terms = [set(terms(document)) for document in BACKGROUND_CORPUS]
+_background_avg_length = sum(len(terms(document)) for document in BACKGROUND_CORPUS) / len(BACKGROUND_CORPUS)
+
+
+def _idf(term: str) -> float:
+    # The target posting counts as one more document in the collection
+    n = len(_background_terms) + 1
+    df = 1 + sum(1 for document in _background_terms if term in document)
+    return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+
+def _saturate(tf: int, length: int, avg_length: float) -> float:
+    return tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / max(avg_length, 1.0)))
+
+
+@dataclass
+class Keyword:
+    term: str  # Matching form, possibly plural-folded ("kubernete")
+    weight: float
+    display: str  # The form the posting uses most often ("Kubernetes"), for prompts and clients
+
+
+class JobKeywordIndex:
+    """Weighted keywords and requirement lines of one job description, used to rank resume content
+
+    Keyword weights are BM25 term weights of the posting against BACKGROUND_CORPUS;
+    resume bullets and skills are scored as BM25 documents for the keyword query.
+    """
+
+    def __init__(self, job_description: str, max_keywords: int = MAX_KEYWORDS):
+        self.job_description = job_description or ''
+        job_forms = term_forms(self.job_description)
+        job_terms = [term for term, _ in job_forms]
+        counts = Counter(job_terms)
+        surface_counts = Counter(job_forms)
+        displays: Dict[str, str] = {}
+        for (term, surface), _ in surface_counts.most_common():
+            displays.setdefault(term, surface)
+        # Terms in requirement lines matter more than company boilerplate
+        requirement_terms = Counter(term for line in self._requirement_lines() for term in terms(line))
+        weights = {
+            term: _idf(term) * _saturate(tf, len(job_terms), _background_avg_length) * (1.5 if term in requirement_terms else 1.0)
+            for term, tf in counts.items()
+        }
+        ranked = sorted(weights.items(), key=lambda item: (-item[1], item[0]))
+        self.keywords: List[Keyword] = [
+            Keyword(term, round(weight, 3), displays[term]) for term, weight in ranked[:max_keywords]
+        ]
+        self._weights = {keyword.term: keyword.weight for keyword in self.keywords}
+        self.requirements: List[str] = self._rank_requirements()
+
+    def _lines(self) -> List[str]:
+        lines = re.split(r'[\n\r]+|(?<=[.;])\s+(?=[A-Z])', self.job_description)
+        return [re.sub(r'^[\s\-*•·▪●◦]+', '', line).strip() for line in lines if len(line.split()) >= 3]
+
+    def _requirement_lines(self) -> List[str]:
+        return [line for line in self._lines() if _REQUIREMENT_RE.search(line)]
+
+    def _rank_requirements(self) -> List[str]:
+        scored = [(self.score(line), i, line) for i, line in enumerate(self._requirement_lines())]
+        top = sorted(scored, key=lambda item: -item[0])[:MAX_REQUIREMENTS]
+        # Keep the posting's own order among the chosen lines
+        return [line for _, _, line in sorted(top, key=lambda item: item[1])]
+
+    def matched_terms(self, text: str) -> List[str]:
+        """Display forms of the keywords that occur in text"""
+        text_terms = set(terms(text))
+        return [keyword.display for keyword in self.keywords if keyword.term in text_terms]
+
+    def score(self, text: str, avg_length: float = 12.0) -> float:
+        """BM25 score of text for the keyword query; avg_length is the typical bullet length in terms"""
+        text_terms = terms(text)
+        counts = Counter(text_terms)
+        return round(sum(
+            weight * _saturate(counts[term], len(text_terms), avg_length)
+            for term, weight in self._weights.items()
+            if term in counts
+        ), 3)
+
+    def score_texts(self, texts: Dict[str, str]) -> Dict[str, float]:
+        """Scores for a set of texts, length-normalised against their own average length"""
+        if not texts:
+            return {}
+        avg_length = sum(len(terms(text)) for text in texts.values()) / len(texts)
+        return {key: self.score(text, avg_length) for key, text in texts.items()}
+
+    def summary(self) -> str:
+        """Compact stand-in for the full job description in prompts"""
+        lines = ["Keywords (most important first): " + ", ".join(keyword.display for keyword in self.keywords)]
+        if self.requirements:
+            lines.append("Key requirements:")
+            lines.extend(f"- {line}" for line in self.requirements)
+        return "\n".join(lines)
+
+    def relevance(self, resume: Dict) -> Dict[str, Any]:
+        """Keyword weights and per-bullet/per-skill scores, for returning to the client"""
+        bullets = resume_bullets(resume)
+        skills = resume_skills(resume)
+        return {
+            'keywords': [{'term': keyword.display, 'weight': keyword.weight} for keyword in self.keywords],
+            'requirements': self.requirements,
+            'bullets': {
+                pointer: {'score': score, 'matched': self.matched_terms(bullets[pointer])}
+                for pointer, score in self.score_texts(bullets).items()
+            },
+            'skills': {
+                pointer: {'skill': skills[pointer], 'score': score}
+                for pointer, score in self.score_texts(skills).items()
+            }
+        }
+
+
+def resume_bullets(resume: Dict) -> Dict[str, str]:
+    """Experience, project and volunteer bullets keyed by JSON pointer"""
+    bullets = {}
+    for section, fields in (('experience', ('responsibilities', 'achievements')),
+                            ('projects', ('description', 'achievements')),
+                            ('volunteer_experience', ('description', 'impact'))):
+        for i, entry in enumerate(resume.get(section) or []):
+            if not isinstance(entry, dict):
+                continue
+            for field in fields:
+                value = entry.get(field)
+                if isinstance(value, str) and value.strip():
+                    bullets[f"/{section}/{i}/{field}"] = value
+                elif isinstance(value, list):
+                    bullets.update({
+                        f"/{section}/{i}/{field}/{j}": item
+                        for j, item in enumerate(value)
+                        if isinstance(item, str) and item.strip()
+                    })
+    return bullets
+
+
+def resume_skills(resume: Dict) -> Dict[str, str]:
+    skills = resume.get('skills') or {}
+    if not isinstance(skills, dict):
+        return {f"/skills/{i}": skill for i, skill in enumerate(skills) if isinstance(skill, str)}
+    return {
+        f"/skills/{group}/{i}": skill
+        for group, items in skills.items() if isinstance(items, list)
+        for i, skill in enumerate(items) if isinstance(skill, str)
+    }
+
+
+def _top(items: List[Tuple[int, float]], limit: int) -> List[int]:
+    """Indexes of the limit best-scoring items, in their original order"""
+    return sorted(i for i, _ in sorted(items, key=lambda item: -item[1])[:limit])
+
+
+def focus_resume(resume: Dict,
+                 index: JobKeywordIndex,
+                 bullets_per_role: int = BULLETS_PER_ROLE,
+                 max_skills: int = MAX_SKILLS) -> Dict:
+    """Copy of resume keeping only each role's top-ranked bullets and the most relevant skills"""
+    focused = copy.deepcopy(resume)
+    for section, fields in (('experience', ('responsibilities', 'achievements')), ('projects', ('achievements',))):
+        for entry in focused.get(section) or []:
+            if not isinstance(entry, dict):
+                continue
+            pool = [(field, i, text) for field in fields for i, text in enumerate(entry.get(field) or [])
+                    if isinstance(entry.get(field), list) and isinstance(text, str)]
+            if len(pool) <= bullets_per_role:
+                continue
+            scores = index.score_texts({str(n): text for n, (_, _, text) in enumerate(pool)})
+            keep = set(_top([(n, scores[str(n)]) for n in range(len(pool))], bullets_per_role))
+            for field in fields:
+                if isinstance(entry.get(field), list):
+                    entry[field] = [text for n, (f, _, text) in enumerate(pool) if f == field and n in keep]
+
+    skills = focused.get('skills')
+    if isinstance(skills, dict):
+        flat = [(group, skill) for group, items in skills.items() if isinstance(items, list) for skill in items]
+        if len(flat) > max_skills:
+            scores = index.score_texts({str(n): str(skill) for n, (_, skill) in enumerate(flat)})
+            keep = set(_top([(n, scores[str(n)]) for n in range(len(flat))], max_skills))
+            focused['skills'] = {
+                group: [skill for n, (g, skill) in enumerate(flat) if g == group and n in keep]
+                for group in skills
+            }
+            focused['skills'] = {group: items for group, items in focused['skills'].items() if items}
+    return focused
+
+
+_index_cache = LRUCache(max_entries=256)
+
+
+def get_job_index(job_description: str) -> JobKeywordIndex:
+    """Keyword index for a job description, built once per distinct posting"""
+    key = content_hash(job_description or '')
+    index = _index_cache.get(key)
+    if index is None:
+        index = JobKeywordIndex(job_description)
+        _index_cache.put(key, index)
+    return index
+
+
+def job_context(job_description: str) -> str:
+    """The job description as sent in tailoring prompts, per JOB_CONTEXT_MODE"""
+    if JOB_CONTEXT_MODE == 'full':
+        return job_description or ''
+    return get_job_index(job_description).summary()
+
+
+def resume_context(resume: Any, job_description: str) -> str:
+    """Resume JSON as sent in tailoring prompts: focused and compact unless JOB_CONTEXT_MODE is 'full'"""
+    if JOB_CONTEXT_MODE == 'full' or not isinstance(resume, dict):
+        return json.dumps(resume, indent=2)
+    return json.dumps(focus_resume(resume, get_job_index(job_description)), separators=(',', ':'))
@@ -0,0 +1,259 @@
+from contextvars import copy_context
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import functools
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Lower numbers run first; within a priority jobs run in submission order
+PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobQueueFull(Exception):
+    """Raised when the job queue is at capacity and cannot accept more work"""
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once it has been cancelled"""
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    priority: int
+    key: Optional[str] = None
+    status: str = QUEUED
+    result: Any = None
+    error: Optional[str] = None
+    error_type: Optional[str] = None
+    stage: Optional[str] = None
+    # Bumped on every change so waiters can tell a new state from one they have seen
+    version: int = 0
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    cancel_requested: bool = False
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def raise_if_cancelled(self) -> None:
+        """Cancellation checkpoint for running work; call it between stages"""
+        if self.cancel_requested:
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Status fields for clients; the result is served separately"""
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'stage': self.stage,
+            'priority': next((name for name, value in PRIORITIES.items() if value == self.priority), self.priority),
+            'error': self.error,
+            'error_type': self.error_type,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'queue_seconds': round((self.started_at or time.time()) - self.submitted_at, 3),
+            'run_seconds': round((self.finished_at or time.time()) - self.started_at, 3) if self.started_at else None
+        }
+
+
+class JobQueue:
+    """Priority queue of long-running jobs served by a local pool of worker threads
+
+    Submitting work that is identical (same key) to a queued or running job returns
+    that job instead of starting another. Queued jobs cancel immediately; running
+    ones stop at their next raise_if_cancelled() checkpoint. Finished jobs and their
+    results are kept for `retention` seconds (and at most `max_retained` of them) so
+    clients can poll for them.
+    """
+
+    def __init__(self,
+                 workers: Optional[int] = None,
+                 max_queued: Optional[int] = None,
+                 retention: Optional[float] = None,
+                 max_retained: Optional[int] = None):
+        self.workers = workers or int(os.getenv('RESUME_JOB_WORKERS', '4'))
+        self.max_queued = max_queued or int(os.getenv('RESUME_JOB_QUEUE_SIZE', '100'))
+        self.retention = retention or float(os.getenv('RESUME_JOB_RETENTION_SECONDS', '3600'))
+        self.max_retained = max_retained or int(os.getenv('RESUME_JOB_MAX_RETAINED', '1000'))
+        self._jobs: Dict[str, Job] = {}
+        self._functions: Dict[str, Callable[[Job], Any]] = {}
+        self._inflight: Dict[str, str] = {}
+        self._heap: List[Tuple[int, int, str]] = []
+        self._sequence = itertools.count()
+        self._changed = threading.Condition()
+        self._closed = False
+        self.counts = {'submitted': 0, 'deduplicated': 0, 'rejected': 0, SUCCEEDED: 0, FAILED: 0, CANCELLED: 0}
+        self._threads: List[threading.Thread] = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"resume-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self,
+               kind: str,
+               function: Callable[[Job], Any],
+               key: Optional[str] = None,
+               priority: str = 'normal') -> Tuple[Job, bool]:
+        """Queue function(job); returns (job, created), where created is False for a duplicate"""
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}'; choose one of {list(PRIORITIES)}")
+        with self._changed:
+            self._sweep()
+            if key is not None and key in self._inflight:
+                self.counts['deduplicated'] += 1
+                return self._jobs[self._inflight[key]], False
+            if self.queue_depth >= self.max_queued:
+                self.counts['rejected'] += 1
+                raise JobQueueFull(f"Job queue is full ({self.max_queued} jobs waiting)")
+            job = Job(id=uuid.uuid4().hex, kind=kind, priority=PRIORITIES[priority], key=key)
+            self._jobs[job.id] = job
+            # Run in the submitter's context so trace spans link the job to the request
+            self._functions[job.id] = functools.partial(copy_context().run, function)
+            if key is not None:
+                self._inflight[key] = job.id
+            heapq.heappush(self._heap, (job.priority, next(self._sequence), job.id))
+            self.counts['submitted'] += 1
+            self._changed.notify_all()
+            return job, True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._changed:
+            self._sweep()
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued job now, or ask a running one to stop; finished jobs are left as they are"""
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return job
+            job.cancel_requested = True
+            if job.status == QUEUED:
+                # Its heap entry is skipped when a worker reaches it
+                self._finish(job, CANCELLED)
+            else:
+                job.version += 1
+                self._changed.notify_all()
+            return job
+
+    def wait(self, job_id: str, version: int, timeout: float) -> Optional[Job]:
+        """Block until the job changes past `version`, finishes or the timeout passes"""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None or job.finished or job.version > version:
+                    return job
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return job
+                self._changed.wait(remaining)
+
+    def set_stage(self, job: Job, stage: str) -> None:
+        """Record progress through a job's pipeline for status polls and event streams"""
+        with self._changed:
+            job.stage = stage
+            job.version += 1
+            self._changed.notify_all()
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.status == QUEUED)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._changed:
+            statuses = [job.status for job in self._jobs.values()]
+            return {
+                'workers': self.workers,
+                'queued': statuses.count(QUEUED),
+                'running': statuses.count(RUNNING),
+                'retained': sum(1 for status in statuses if status in FINISHED_STATES),
+                **self.counts
+            }
+
+    def shutdown(self) -> None:
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def _next_job(self) -> Optional[Tuple[Job, Callable[[Job], Any]]]:
+        with self._changed:
+            while True:
+                while self._heap:
+                    _, _, job_id = heapq.heappop(self._heap)
+                    job = self._jobs.get(job_id)
+                    if job is not None and job.status == QUEUED:
+                        job.status = RUNNING
+                        job.started_at = time.time()
+                        job.version += 1
+                        self._changed.notify_all()
+                        return job, self._functions.pop(job_id)
+                if self._closed:
+                    return None
+                self._changed.wait()
+
+    def _worker(self) -> None:
+        while True:
+            item = self._next_job()
+            if item is None:
+                return
+            job, function = item
+            try:
+                result = function(job)
+            except JobCancelled:
+                with self._changed:
+                    self._finish(job, CANCELLED)
+            except Exception as e:
+                logger.warning(f"Job {job.id} ({job.kind}) failed: {str(e)}")
+                with self._changed:
+                    self._finish(job, FAILED, error=e)
+            else:
+                with self._changed:
+                    self._finish(job, CANCELLED if job.cancel_requested else SUCCEEDED, result=result)
+
+    def _finish(self, job: Job, status: str, result: Any = None, error: Optional[Exception] = None) -> None:
+        # Caller holds self._changed
+        job.status = status
+        job.result = result if status == SUCCEEDED else None
+        if error is not None:
+            job.error = str(error)
+            job.error_type = type(error).__name__
+        job.finished_at = time.time()
+        job.version += 1
+        self._functions.pop(job.id, None)
+        if job.key is not None and self._inflight.get(job.key) == job.id:
+            del self._inflight[job.key]
+        self.counts[status] += 1
+        self._changed.notify_all()
+
+    def _sweep(self) -> None:
+        """Drop finished jobs past their retention, then the oldest beyond max_retained"""
+        # Caller holds self._changed
+        cutoff = time.time() - self.retention
+        finished = sorted((job for job in self._jobs.values() if job.finished), key=lambda job: job.finished_at)
+        excess = len(finished) - self.max_retained
+        for i, job in enumerate(finished):
+            if i < excess or job.finished_at < cutoff:
+                del self._jobs[job.id]
@@ -0,0 +1,346 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional, Set, Tuple
+from contextvars import Context, copy_context
+from functools import lru_cache
+import hashlib
+import logging
+import os
+import queue
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from Caching import LRUCache, content_hash
+from Telemetry import STAGE_SECONDS, stage
+
+logger = logging.getLogger(__name__)
+
+# Lines in the .aux file that change what the next pass typesets
+AUX_REFERENCE_PREFIXES = ('\\newlabel', '\\bibcite')
+# Table of contents entries (and hyperref's .out bookmarks) are only read back
+# by documents that print a table of contents or list
+AUX_CONTENTS_PREFIXES = ('\\@writefile', '\\contentsline')
+CONTENTS_COMMANDS = ('\\tableofcontents', '\\listoffigures', '\\listoftables')
+
+# Log messages LaTeX and its packages emit when another pass is required
+RERUN_MARKERS = ('Rerun to get', 'Label(s) may have changed', 'has changed. Rerun')
+# hyperref asks for a rerun whenever its PDF bookmarks change; only documents with a
+# table of contents are rerun for them
+OUTLINE_RERUN_MARKER = 'Rerun to get outlines right'
+UNDEFINED_REFERENCES = 'There were undefined references'
+
+BEGIN_DOCUMENT = '\\begin{document}'
+
+# Macros that print the compile date (or time), so the same source compiles differently over time
+DATE_MACROS_RE = re.compile(r'\\(?:today|year|month|day|DTMtoday)(?![A-Za-z@])')
+TIME_MACROS_RE = re.compile(r'\\(?:time|currenttime|DTMnow|DTMcurrenttime)(?![A-Za-z@])')
+
+
+class CompileQueueFull(Exception):
+    """Raised when the compile queue is at capacity and cannot accept more work"""
+
+
+class LatexCompileError(Exception):
+    """Raised when pdflatex fails, times out or produces no PDF"""
+
+
+class LatexCompileTimeout(LatexCompileError):
+    """Raised when a compile job runs past its deadline"""
+
+
+@lru_cache(maxsize=None)
+def toolchain_version(pdflatex: str = 'pdflatex') -> str:
+    """First line of `pdflatex --version`, used to key compiled output"""
+    try:
+        process = subprocess.run([pdflatex, '--version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=10)
+        lines = process.stdout.decode('utf-8', errors='replace').splitlines()
+        return lines[0].strip() if lines else 'unknown'
+    except (OSError, subprocess.TimeoutExpired):
+        return 'unknown'
+
+
+def split_preamble(latex_code: str) -> Tuple[Optional[str], str]:
+    """Split a document into (preamble, body starting at \\begin{document})"""
+    index = latex_code.find(BEGIN_DOCUMENT)
+    if index <= 0:
+        return None, latex_code
+    return latex_code[:index], latex_code[index:]
+
+
+class PreambleFormatCache:
+    """Pre-dumped pdflatex formats, one per distinct preamble, built in the background"""
+
+    def __init__(self, directory: Optional[str] = None, pdflatex: str = 'pdflatex', timeout: float = 60):
+        self.directory = directory or os.getenv('LATEX_FORMAT_DIR', os.path.join('cache', 'latex_formats'))
+        self.pdflatex = pdflatex
+        self.timeout = timeout
+        self._building: Set[str] = set()
+        self._failed: Set[str] = set()
+        self._lock = threading.Lock()
+        self._builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix='latex-format')
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, preamble: str) -> str:
+        return 'preamble_' + content_hash(preamble, toolchain_version(self.pdflatex))[:32]
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.fmt")
+
+    def lookup(self, preamble: str) -> Optional[str]:
+        """Return the format file for this preamble, scheduling a build if there is none yet"""
+        key = self.key(preamble)
+        path = self.path(key)
+        if os.path.exists(path):
+            return path
+        with self._lock:
+            if key in self._building or key in self._failed:
+                return None
+            self._building.add(key)
+        self._builder.submit(self._build, key, preamble)
+        return None
+
+    def mark_failed(self, preamble: str) -> None:
+        """Stop using a format that did not produce a PDF"""
+        key = self.key(preamble)
+        with self._lock:
+            self._failed.add(key)
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def build(self, preamble: str) -> Optional[str]:
+        """Build the format synchronously; returns its path or None on failure"""
+        key = self.key(preamble)
+        self._build(key, preamble)
+        path = self.path(key)
+        return path if os.path.exists(path) else None
+
+    def _build(self, key: str, preamble: str) -> None:
+        try:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                with open(os.path.join(tmpdir, 'preamble.tex'), 'w', encoding='utf-8') as f:
+                    f.write(preamble)
+                    f.write('\n\\dump\n')
+                subprocess.run(
+                    [self.pdflatex, '-ini', '-interaction=nonstopmode', f'-jobname={key}', '&pdflatex', 'preamble.tex'],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    cwd=tmpdir,
+                    timeout=self.timeout
+                )
+                fmt_path = os.path.join(tmpdir, f"{key}.fmt")
+                if not os.path.exists(fmt_path):
+                    raise LatexCompileError("pdflatex did not dump a format")
+                # Publish atomically so compiles never pick up a half-written format
+                staging_path = self.path(key) + '.tmp'
+                shutil.copyfile(fmt_path, staging_path)
+                os.replace(staging_path, self.path(key))
+                logger.info(f"Built LaTeX preamble format {key}")
+        except Exception as e:
+            logger.warning(f"Could not build LaTeX preamble format {key}: {str(e)}")
+            with self._lock:
+                self._failed.add(key)
+        finally:
+            with self._lock:
+                self._building.discard(key)
+
+
+@dataclass
+class CompileJob:
+    latex_code: str
+    timeout: float
+    future: Future = field(default_factory=Future)
+    submitted_at: float = field(default_factory=time.monotonic)
+    # The submitter's context, so compile spans nest under the request that asked for them
+    context: Context = field(default_factory=copy_context)
+
+
+class LatexCompileService:
+    """Bounded pool of pdflatex workers fed by a fixed-size queue"""
+
+    def __init__(self,
+                 workers: Optional[int] = None,
+                 queue_size: Optional[int] = None,
+                 timeout: Optional[float] = None,
+                 max_passes: int = 3,
+                 pdflatex: str = 'pdflatex',
+                 pdf_cache: Optional[LRUCache] = None,
+                 format_cache: Optional[PreambleFormatCache] = None,
+                 precompiled_preamble: Optional[bool] = None):
+        self.workers = workers or int(os.getenv('LATEX_COMPILE_WORKERS', os.cpu_count() or 2))
+        self.queue_size = queue_size or int(os.getenv('LATEX_COMPILE_QUEUE_SIZE', self.workers * 4))
+        self.timeout = timeout or float(os.getenv('LATEX_COMPILE_TIMEOUT', '30'))
+        self.max_passes = max_passes
+        self.pdflatex = pdflatex
+        self.pdf_cache = pdf_cache if pdf_cache is not None else LRUCache(
+            max_entries=None,
+            max_bytes=int(os.getenv('LATEX_PDF_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+        )
+        if precompiled_preamble is None:
+            precompiled_preamble = os.getenv('LATEX_PRECOMPILED_PREAMBLE', '1') == '1'
+        if precompiled_preamble and format_cache is None:
+            format_cache = PreambleFormatCache(pdflatex=pdflatex)
+        self.format_cache = format_cache if precompiled_preamble else None
+        # Pin the PDF's CreationDate/ModDate and /ID so the same source on the same day
+        # yields byte-identical PDFs; FORCE_SOURCE_DATE is left unset so \today still prints today
+        self._env = dict(os.environ, SOURCE_DATE_EPOCH='0')
+        self._queue: "queue.Queue[Optional[CompileJob]]" = queue.Queue(maxsize=self.queue_size)
+        self._threads: List[threading.Thread] = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"pdflatex-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def cache_key(self, latex_code: str) -> str:
+        """Content hash identifying the PDF this source compiles to
+
+        Sources that print the date (or time) include today's date (or the current minute),
+        so a cached PDF or ETag never outlives the date printed in it.
+        """
+        if TIME_MACROS_RE.search(latex_code):
+            return content_hash(latex_code, toolchain_version(self.pdflatex), time.strftime('%Y-%m-%d %H:%M'))
+        if DATE_MACROS_RE.search(latex_code):
+            return content_hash(latex_code, toolchain_version(self.pdflatex), time.strftime('%Y-%m-%d'))
+        return content_hash(latex_code, toolchain_version(self.pdflatex))
+
+    def submit(self, latex_code: str, timeout: Optional[float] = None) -> Future:
+        """Queue a compile job; raises CompileQueueFull instead of waiting for space"""
+        job = CompileJob(latex_code=latex_code, timeout=timeout or self.timeout)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise CompileQueueFull(f"LaTeX compile queue is full ({self.queue_size} jobs waiting)")
+        return job.future
+
+    def compile(self, latex_code: str, timeout: Optional[float] = None) -> bytes:
+        """Compile LaTeX to PDF bytes, blocking until a worker has finished the job"""
+        key = self.cache_key(latex_code)
+        pdf_bytes = self.pdf_cache.get(key)
+        if pdf_bytes is None:
+            pdf_bytes = self.submit(latex_code, timeout).result()
+            self.pdf_cache.put(key, pdf_bytes)
+        return pdf_bytes
+
+    def shutdown(self) -> None:
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _worker(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            STAGE_SECONDS.observe(time.monotonic() - job.submitted_at, stage='latex_compile_queue', outcome='ok')
+            try:
+                job.future.set_result(job.context.run(self._run_job, job))
+            except Exception as e:
+                job.future.set_exception(e)
+
+    def _run_job(self, job: CompileJob) -> bytes:
+        # Queue wait counts against the job's time budget too
+        deadline = job.submitted_at + job.timeout
+
+        preamble, body = split_preamble(job.latex_code)
+        fmt_path = self.format_cache.lookup(preamble) if self.format_cache and preamble else None
+        with stage('latex_compile', precompiled_preamble=bool(fmt_path)):
+            if fmt_path:
+                try:
+                    return self._compile(body, deadline, fmt_path)
+                except LatexCompileTimeout:
+                    raise
+                except LatexCompileError as e:
+                    logger.warning(f"Compile against preamble format failed, falling back: {str(e)}")
+                    self.format_cache.mark_failed(preamble)
+            return self._compile(job.latex_code, deadline)
+
+    def _compile(self, source: str, deadline: float, fmt_path: Optional[str] = None) -> bytes:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tex_path = os.path.join(tmpdir, 'resume.tex')
+            with open(tex_path, 'w', encoding='utf-8') as f:
+                f.write(source)
+
+            fmt_name = None
+            if fmt_path:
+                # The preamble is already loaded in the format, so only the body is compiled
+                fmt_name = os.path.splitext(os.path.basename(fmt_path))[0]
+                os.symlink(os.path.abspath(fmt_path), os.path.join(tmpdir, f"{fmt_name}.fmt"))
+
+            uses_contents = any(command in source for command in CONTENTS_COMMANDS)
+            signature = self._reference_signature(tmpdir, uses_contents)
+            for passes in range(1, self.max_passes + 1):
+                with stage('pdflatex_pass', number=passes):
+                    log = self._run_pass(tmpdir, tex_path, deadline, fmt_name)
+                new_signature = self._reference_signature(tmpdir, uses_contents)
+                changed = new_signature != signature
+                if passes == 1 and not uses_contents:
+                    # Against the empty starting directory every label is new; that only
+                    # matters if the pass referred to one it could not resolve yet
+                    changed = changed and UNDEFINED_REFERENCES in log
+                signature = new_signature
+                if not (changed or self._rerun_requested(log, uses_contents)):
+                    break
+            logger.debug(f"pdflatex finished in {passes} pass(es){' using ' + fmt_name if fmt_name else ''}")
+
+            pdf_path = os.path.join(tmpdir, 'resume.pdf')
+            if not os.path.exists(pdf_path):
+                raise LatexCompileError("PDF generation failed")
+            with open(pdf_path, 'rb') as f:
+                return f.read()
+
+    def _run_pass(self, tmpdir: str, tex_path: str, deadline: float, fmt_name: Optional[str] = None) -> str:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LatexCompileTimeout("PDF generation timed out")
+        command = [self.pdflatex, '-interaction=nonstopmode']
+        if fmt_name:
+            command.append(f'-fmt={fmt_name}')
+        command.append(tex_path)
+        try:
+            process = subprocess.run(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=tmpdir,
+                env=self._env,
+                timeout=remaining
+            )
+        except subprocess.TimeoutExpired:
+            raise LatexCompileTimeout("PDF generation timed out")
+        return process.stdout.decode('utf-8', errors='replace')
+
+    @staticmethod
+    def _rerun_requested(log: str, uses_contents: bool) -> bool:
+        for line in log.splitlines():
+            if any(marker in line for marker in RERUN_MARKERS):
+                if uses_contents or OUTLINE_RERUN_MARKER not in line:
+                    return True
+        return False
+
+    @staticmethod
+    def _reference_signature(tmpdir: str, uses_contents: bool = False) -> str:
+        """Digest of the .aux/.out data that a later pass would read back"""
+        prefixes = AUX_REFERENCE_PREFIXES + (AUX_CONTENTS_PREFIXES if uses_contents else ())
+        digest = hashlib.sha256()
+        aux_path = os.path.join(tmpdir, 'resume.aux')
+        if os.path.exists(aux_path):
+            with open(aux_path, 'r', encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    if line.startswith(prefixes):
+                        digest.update(line.encode('utf-8'))
+        out_path = os.path.join(tmpdir, 'resume.out')
+        if uses_contents and os.path.exists(out_path):
+            with open(out_path, 'rb') as f:
+                digest.update(f.read())
+        return digest.hexdigest()
@@ -0,0 +1,210 @@
+from typing import Any, Dict, List, Optional
+import os
+import re
+
+from Telemetry import timed
+
+# Theme used when a request does not pick one
+DEFAULT_THEME = os.getenv('LATEX_THEME', 'classic')
+
+# Every theme defines \resumeentry{Title}{Dates}{Organization}{Location} and styles
+# \section, so generated section fragments render under any of them
+_COMMON_PREAMBLE = r"""\usepackage[T1]{fontenc}
+\usepackage[utf8]{inputenc}
+\usepackage[hidelinks]{hyperref}
+\usepackage{enumitem}
+\usepackage{titlesec}
+\pagestyle{empty}
+\setlength{\parindent}{0pt}
+\setlist[itemize]{leftmargin=*,itemsep=1pt,topsep=2pt,parsep=0pt}
+"""
+
+THEMES: Dict[str, str] = {
+    'classic': r"""\documentclass[10pt]{article}
+\usepackage[margin=0.5in]{geometry}
+""" + _COMMON_PREAMBLE + r"""\titleformat{\section}{\large\bfseries\scshape}{}{0em}{}[\titlerule]
+\titlespacing*{\section}{0pt}{8pt}{4pt}
+\newcommand{\resumeentry}[4]{\textbf{#1} \hfill #2\\ \textit{#3} \hfill \textit{#4}\par}
+""",
+    'modern': r"""\documentclass[10pt]{article}
+\usepackage[margin=0.6in]{geometry}
+""" + _COMMON_PREAMBLE + r"""\usepackage[scaled]{helvet}
+\renewcommand{\familydefault}{\sfdefault}
+\usepackage{xcolor}
+\definecolor{accent}{RGB}{0,84,147}
+\titleformat{\section}{\large\bfseries\color{accent}}{}{0em}{}[{\color{accent}\titlerule}]
+\titlespacing*{\section}{0pt}{10pt}{4pt}
+\newcommand{\resumeentry}[4]{{\color{accent}\textbf{#1}} \hfill #2\\ #3 \hfill \textit{#4}\par}
+""",
+    'compact': r"""\documentclass[10pt]{article}
+\usepackage[margin=0.4in]{geometry}
+""" + _COMMON_PREAMBLE + r"""\AtBeginDocument{\small}
+\titleformat{\section}{\normalsize\bfseries}{}{0em}{\MakeUppercase}[\titlerule]
+\titlespacing*{\section}{0pt}{4pt}{2pt}
+\newcommand{\resumeentry}[4]{\textbf{#1}, \textit{#3} \hfill #2\par}
+"""
+}
+
+SECTION_TITLES = {
+    'summary': 'Summary',
+    'experience': 'Experience',
+    'projects': 'Projects',
+    'education': 'Education',
+    'skills': 'Skills',
+    'volunteer_experience': 'Volunteer Experience',
+    'awards': 'Awards',
+    'publications': 'Publications'
+}
+
+_SPECIAL_CHARS = {
+    '\\': r'\textbackslash{}',
+    '&': r'\&',
+    '%': r'\%',
+    '$': r'\$',
+    '#': r'\#',
+    '_': r'\_',
+    '{': r'\{',
+    '}': r'\}',
+    '~': r'\textasciitilde{}',
+    '^': r'\textasciicircum{}'
+}
+_SPECIAL_RE = re.compile('|'.join(re.escape(char) for char in _SPECIAL_CHARS))
+
+
+def escape_latex(value: Any) -> str:
+    """Plain text made safe to place anywhere in a LaTeX document"""
+    if value is None:
+        return ''
+    return _SPECIAL_RE.sub(lambda match: _SPECIAL_CHARS[match.group()], str(value))
+
+
+def theme_preamble(theme: Optional[str] = None) -> str:
+    theme = theme or DEFAULT_THEME
+    if theme not in THEMES:
+        raise ValueError(f"Unknown LaTeX theme '{theme}'; choose one of {sorted(THEMES)}")
+    return THEMES[theme]
+
+
+def wrap_document(body: str, theme: Optional[str] = None) -> str:
+    return theme_preamble(theme) + "\n\\begin{document}\n\n" + body.strip() + "\n\n\\end{document}\n"
+
+
+def _date_range(entry: Dict) -> str:
+    start, end = entry.get('start_date'), entry.get('end_date')
+    if start and end:
+        return f"{escape_latex(start)} -- {escape_latex(end)}"
+    return escape_latex(start or end or entry.get('date') or entry.get('graduation_date'))
+
+
+def _entry(title: Any, dates: str, organization: Any, location: Any) -> str:
+    return f"\\resumeentry{{{escape_latex(title)}}}{{{dates}}}{{{escape_latex(organization)}}}{{{escape_latex(location)}}}"
+
+
+def _bullets(items: List[Any]) -> str:
+    items = [item for item in items if item]
+    if not items:
+        return ''
+    lines = "\n".join(f"  \\item {escape_latex(item)}" for item in items)
+    return f"\\begin{{itemize}}\n{lines}\n\\end{{itemize}}"
+
+
+def _as_list(value: Any) -> List[Any]:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _href_target(url: str) -> str:
+    # \href takes the URL nearly verbatim; only % and # need escaping
+    return re.sub(r'([%#])', r'\\\1', url)
+
+
+def _link(url: Any) -> str:
+    url = str(url)
+    target = url if re.match(r'^[a-z]+:', url) else f"https://{url}"
+    return f"\\href{{{_href_target(target)}}}{{{escape_latex(url)}}}"
+
+
+def render_header(personal: Dict) -> str:
+    location = personal.get('location')
+    if isinstance(location, dict):
+        location = ', '.join(part for part in (location.get('city'), location.get('state'), location.get('country')) if part)
+    contacts = []
+    if location:
+        contacts.append(escape_latex(location))
+    if personal.get('phone'):
+        contacts.append(escape_latex(personal['phone']))
+    if personal.get('email'):
+        contacts.append(f"\\href{{mailto:{_href_target(personal['email'])}}}{{{escape_latex(personal['email'])}}}")
+    for key in ('linkedin', 'portfolio'):
+        if personal.get(key):
+            contacts.append(_link(personal[key]))
+    lines = [f"{{\\Huge\\bfseries {escape_latex(personal.get('name'))}}}"]
+    if contacts:
+        lines.append(' \\quad '.join(contacts))
+    return "\\begin{center}\n" + " \\\\[4pt]\n".join(lines) + "\n\\end{center}"
+
+
+def render_section(section: str, value: Any) -> str:
+    """Body of one resume section (without its heading)"""
+    if section == 'summary':
+        return escape_latex(value)
+    if section == 'skills':
+        if not isinstance(value, dict):
+            return escape_latex(', '.join(str(item) for item in _as_list(value)))
+        lines = [
+            f"\\textbf{{{escape_latex(group.replace('_', ' ').title())}:}} {escape_latex(', '.join(str(item) for item in items))}"
+            for group, items in value.items()
+            if items
+        ]
+        return " \\\\\n".join(lines)
+
+    blocks = []
+    for entry in _as_list(value):
+        if not isinstance(entry, dict):
+            blocks.append(escape_latex(entry))
+            continue
+        if section == 'experience':
+            block = [_entry(entry.get('title'), _date_range(entry), entry.get('company'), entry.get('location')),
+                     _bullets(_as_list(entry.get('responsibilities')) + _as_list(entry.get('achievements')))]
+            if entry.get('technologies_used'):
+                block.append(f"\\textit{{Technologies:}} {escape_latex(', '.join(entry['technologies_used']))}")
+        elif section == 'education':
+            degree = ', '.join(part for part in (entry.get('degree'), entry.get('field_of_study')) if part)
+            details = _as_list(entry.get('honors')) + _as_list(entry.get('highlights'))
+            if entry.get('gpa'):
+                details.insert(0, f"GPA: {entry['gpa']}")
+            if entry.get('relevant_coursework'):
+                details.append(f"Relevant coursework: {', '.join(entry['relevant_coursework'])}")
+            block = [_entry(degree, _date_range(entry), entry.get('institution'), entry.get('location')), _bullets(details)]
+        elif section == 'projects':
+            block = [_entry(entry.get('name'), _date_range(entry), ', '.join(_as_list(entry.get('technologies'))), ''),
+                     _bullets(_as_list(entry.get('description')) + _as_list(entry.get('achievements')))]
+        elif section == 'volunteer_experience':
+            block = [_entry(entry.get('role'), _date_range(entry), entry.get('organization'), ''),
+                     _bullets(_as_list(entry.get('description')) + _as_list(entry.get('impact')))]
+        elif section == 'awards':
+            block = [_entry(entry.get('title'), _date_range(entry), entry.get('issuer'), ''),
+                     _bullets(_as_list(entry.get('description')))]
+        elif section == 'publications':
+            block = [_entry(entry.get('title'), _date_range(entry), entry.get('journal'), ''),
+                     _bullets([', '.join(_as_list(entry.get('authors'))), entry.get('description')])]
+        else:
+            block = [_bullets([f"{key}: {item}" for key, item in entry.items() if item])]
+        blocks.append("\n".join(part for part in block if part))
+    return "\n\\medskip\n".join(blocks)
+
+
+@timed('render_latex')
+def render_resume(resume: Dict, theme: Optional[str] = None) -> str:
+    """Render a parsed resume (ResumeParser.md schema) to a complete LaTeX document"""
+    personal = resume.get('personal_info') or {}
+    body = [render_header(personal)]
+    summary = personal.get('summary') or personal.get('objective')
+    if summary:
+        body.append(f"\\section{{{SECTION_TITLES['summary']}}}\n{render_section('summary', summary)}")
+    for section in ('experience', 'projects', 'education', 'skills', 'volunteer_experience', 'awards', 'publications'):
+        value = resume.get(section)
+        if value:
+            body.append(f"\\section{{{SECTION_TITLES[section]}}}\n{render_section(section, value)}")
+    return wrap_document("\n\n".join(body), theme)
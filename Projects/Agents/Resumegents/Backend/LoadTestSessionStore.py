@@ -0,0 +1,119 @@
+# Load test for the shared SQLite session store across worker processes.
+# Each worker simulates requests against its own sessions: load the agent, add a
+# chat turn, spend --model-latency seconds "in the model", then save it back.
+# Before timing, it checks that two workers saving from the same loaded revision cannot
+# both succeed. Run from the Backend directory:  python LoadTestSessionStore.py --workers 1 2 4 8
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+import uuid
+
+from MultiturnResumeAgent import Message, MultiturnResumeAgent
+from SessionStore import SessionConflictError, SQLiteSessionStore
+
+SAMPLE_RESUME = {
+    'personal_info': {'name': 'Jane Doe', 'email': 'jane@example.com'},
+    'experience': [
+        {'company': f'Company {i}', 'title': 'Engineer', 'responsibilities': ['Built things'] * 5}
+        for i in range(5)
+    ],
+    'skills': {'technical': ['Python', 'SQL', 'Machine Learning']}
+}
+
+
+def run_worker(db_path, sessions_per_worker, requests_per_session, model_latency, barrier, results):
+    store = SQLiteSessionStore(db_path)
+    session_ids = []
+    for _ in range(sessions_per_worker):
+        session_id = str(uuid.uuid4())
+        agent = MultiturnResumeAgent(api_key='load-test')
+        agent.add_resume_version(SAMPLE_RESUME, 'Initial PDF parse')
+        store.create(session_id, agent)
+        session_ids.append(session_id)
+
+    # Start the timed loop in every worker at once so their windows overlap
+    barrier.wait()
+    completed = 0
+    start = time.perf_counter()
+    for _ in range(requests_per_session):
+        for session_id in session_ids:
+            agent = store.get(session_id)
+            agent.conversation_history.append(Message(role='user', content='Tighten my experience bullets'))
+            time.sleep(model_latency)
+            agent.conversation_history.append(Message(role='assistant', content='Here is a tighter version...'))
+            store.save(session_id, agent)
+            completed += 1
+    results.put((completed, time.perf_counter() - start))
+
+
+def check_stale_saves(db_path):
+    """Two stores (as two worker processes would) load the same revision; only the first save may win"""
+    first, second = SQLiteSessionStore(db_path), SQLiteSessionStore(db_path)
+    session_id = str(uuid.uuid4())
+    first.create(session_id, MultiturnResumeAgent(api_key='load-test'))
+
+    agents = [first.get(session_id), second.get(session_id)]
+    agents[0].job_description = 'first writer'
+    agents[1].job_description = 'second writer'
+    first.save(session_id, agents[0])
+    try:
+        second.save(session_id, agents[1])
+    except SessionConflictError:
+        pass
+    else:
+        raise AssertionError("Two saves from the same revision both succeeded")
+
+    # After the conflict the second store reloads and sees the first writer's change
+    reloaded = second.get(session_id)
+    assert reloaded.job_description == 'first writer', reloaded.job_description
+    reloaded.job_description = 'second writer'
+    second.save(session_id, reloaded)
+    assert first.get(session_id).job_description == 'second writer'
+
+
+def run(workers, db_path, args):
+    results = multiprocessing.Queue()
+    barrier = multiprocessing.Barrier(workers)
+    processes = [
+        multiprocessing.Process(
+            target=run_worker,
+            args=(db_path, args.sessions, args.requests, args.model_latency, barrier, results)
+        )
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    # Workers time only their request loop, so process start-up and imports are excluded
+    elapsed = max(seconds for _, seconds in outcomes)
+    return sum(count for count, _ in outcomes) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Session store throughput by worker count")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--sessions', type=int, default=10, help="sessions per worker")
+    parser.add_argument('--requests', type=int, default=10, help="requests per session")
+    parser.add_argument('--model-latency', type=float, default=0.02, help="simulated model time per request (s)")
+    args = parser.parse_args()
+
+    check_stale_saves(os.path.join(tempfile.mkdtemp(prefix='sessions_'), 'sessions.db'))
+    print("Stale saves rejected: ok")
+
+    baseline = None
+    print(f"{'workers':>8} {'req/s':>10} {'scaling':>8} {'efficiency':>11}")
+    for workers in args.workers:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='sessions_'), 'sessions.db')
+        SQLiteSessionStore(db_path)  # create the schema before the workers race for it
+        throughput = run(workers, db_path, args)
+        baseline = baseline or throughput / workers
+        scaling = throughput / baseline
+        print(f"{workers:>8} {throughput:>10.1f} {scaling:>7.2f}x {scaling / workers:>10.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+# Peak memory per resume upload: base64-in-JSON vs streamed multipart.
+# Run from the Backend directory:
+#   python MeasureUploadMemory.py                        # AzPM.pdf, padded to 1, 5 and 9.5 MB
+#   python MeasureUploadMemory.py resume.pdf --sizes 2 8
+# Each path is traced with tracemalloc from the first body chunk to the finished model
+# message content, the way the server handles it. The PDF is padded with an incompressible
+# attachment so it stays readable; set PDF_TEXT_EXTRACTION=off to measure the document
+# block path, where the base64 copy for the model is part of the peak.
+import argparse
+import base64
+import gc
+import io
+import json
+import os
+import time
+import tracemalloc
+import uuid
+
+import pypdf
+
+from PdfText import build_parse_content
+from ResumeUpload import CHUNK_BYTES, MAX_UPLOAD_BYTES, UploadError, receive_pdf
+
+MB = 1024 * 1024
+
+
+def chunks_of(body, size=CHUNK_BYTES):
+    view = memoryview(body)
+    for start in range(0, len(body), size):
+        yield bytes(view[start:start + size])
+
+
+def padded_pdf(original, size):
+    writer = pypdf.PdfWriter(clone_from=pypdf.PdfReader(io.BytesIO(original)))
+    writer.add_attachment('padding.bin', os.urandom(max(0, size - len(original) - 4096)))
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def json_body(pdf_bytes):
+    return json.dumps({'resume_base64': base64.b64encode(pdf_bytes).decode('ascii')}).encode()
+
+
+def multipart_body(pdf_bytes, content_type='application/pdf'):
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="resume"; filename="resume.pdf"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n').encode() + pdf_bytes + f'\r\n--{boundary}--\r\n'.encode()
+    return f'multipart/form-data; boundary={boundary}', body
+
+
+def handle_json(body):
+    # The framework buffers the whole body before the handler sees the parsed model
+    received = b''.join(chunks_of(body))
+    pdf_base64 = json.loads(received)['resume_base64']
+    return build_parse_content(base64.b64decode(pdf_base64), pdf_base64)
+
+
+def handle_multipart(content_type, body):
+    receiver = receive_pdf(content_type, chunks_of(body))
+    with receiver.upload as upload:
+        return build_parse_content(upload.read_bytes())
+
+
+def measure(handler, *args):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    content, mode = handler(*args)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del content
+    return peak, mode, seconds
+
+
+def consumed_before_rejection(content_type, body):
+    """Bytes of the body read before the upload is refused, and the status it got"""
+    consumed = 0
+
+    def counted():
+        nonlocal consumed
+        for chunk in chunks_of(body):
+            consumed += len(chunk)
+            yield chunk
+    try:
+        receive_pdf(content_type, counted()).close()
+        return consumed, 200
+    except UploadError as e:
+        return consumed, e.status_code
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory per resume upload")
+    parser.add_argument('pdf', nargs='?', default='AzPM.pdf')
+    parser.add_argument('--sizes', nargs='*', type=float, default=[1, 5, 9.5], help="padded PDF sizes in MB")
+    args = parser.parse_args()
+
+    with open(args.pdf, 'rb') as f:
+        original = f.read()
+
+    print(f"{'size':>7} {'mode':>8} {'json peak':>10} {'x file':>7} {'multipart peak':>15} {'x file':>7} {'saved':>6}")
+    for size_mb in args.sizes:
+        pdf_bytes = padded_pdf(original, int(size_mb * MB))
+        body = json_body(pdf_bytes)
+        json_peak, mode, _ = measure(handle_json, body)
+        del body
+        content_type, body = multipart_body(pdf_bytes)
+        multipart_peak, _, _ = measure(handle_multipart, content_type, body)
+        del body
+        size = len(pdf_bytes)
+        print(f"{size / MB:>5.1f}MB {mode:>8} {json_peak / MB:>8.1f}MB {json_peak / size:>6.1f}x "
+              f"{multipart_peak / MB:>13.1f}MB {multipart_peak / size:>6.1f}x {1 - multipart_peak / json_peak:>6.0%}")
+
+    print("\nEarly rejection (bytes read before the upload was refused):")
+    content_type, body = multipart_body(b'PK\x03\x04' + b'0' * (5 * MB), 'application/octet-stream')
+    print(f"  5 MB zip sent as a PDF:   {consumed_before_rejection(content_type, body)}")
+    content_type, body = multipart_body(original, 'image/png')
+    print(f"  PDF declared as image/png: {consumed_before_rejection(content_type, body)}")
+    content_type, body = multipart_body(original + b'0' * MAX_UPLOAD_BYTES)
+    print(f"  {MAX_UPLOAD_BYTES / MB:.0f} MB limit exceeded, no Content-Length: {consumed_before_rejection(content_type, body)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+from typing import Dict, Optional
+import atexit
+import logging
+import os
+import threading
+
+import anthropic
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class ModelClientManager:
+    """One pooled Anthropic client per API key, shared by every agent in the process"""
+
+    def __init__(self,
+                 max_connections: Optional[int] = None,
+                 max_keepalive_connections: Optional[int] = None,
+                 keepalive_expiry: Optional[float] = None,
+                 connect_timeout: Optional[float] = None,
+                 read_timeout: Optional[float] = None):
+        self.limits = httpx.Limits(
+            max_connections=max_connections or int(os.getenv('MODEL_MAX_CONNECTIONS', '64')),
+            max_keepalive_connections=max_keepalive_connections or int(os.getenv('MODEL_MAX_KEEPALIVE', '16')),
+            keepalive_expiry=keepalive_expiry or float(os.getenv('MODEL_KEEPALIVE_EXPIRY', '60'))
+        )
+        # Generations can legitimately take minutes; connecting should not
+        self.timeout = httpx.Timeout(
+            read_timeout or float(os.getenv('MODEL_READ_TIMEOUT', '300')),
+            connect=connect_timeout or float(os.getenv('MODEL_CONNECT_TIMEOUT', '5'))
+        )
+        self._clients: Dict[str, anthropic.Anthropic] = {}
+        self._lock = threading.Lock()
+
+    def get_client(self, api_key: Optional[str] = None) -> anthropic.Anthropic:
+        api_key = api_key or os.getenv('ANTHROPIC_KEY_1')
+        key = api_key or ''
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = anthropic.Anthropic(
+                    api_key=api_key,
+                    timeout=self.timeout,
+                    # Retries go through the shared rate limiter in ModelRequests
+                    max_retries=0,
+                    http_client=anthropic.DefaultHttpxClient(limits=self.limits)
+                )
+                self._clients[key] = client
+            return client
+
+    def close(self) -> None:
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            try:
+                client.close()
+            except Exception as e:
+                logger.warning(f"Error closing model client: {str(e)}")
+
+
+_manager: Optional[ModelClientManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_model_client_manager() -> ModelClientManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ModelClientManager()
+            atexit.register(_manager.close)
+        return _manager
+
+
+def get_model_client(api_key: Optional[str] = None) -> anthropic.Anthropic:
+    """The process-wide pooled client for this API key"""
+    return get_model_client_manager().get_client(api_key)
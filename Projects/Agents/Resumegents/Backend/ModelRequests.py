@@ -0,0 +1,198 @@
+from typing import Any, Dict, Iterator, List, Optional, Union
+import logging
+import time
+
+import anthropic
+
+from RateLimiter import backoff_delay, estimate_request_tokens, get_rate_limiter
+from Resilience import get_circuit_breaker, get_hedger
+from Telemetry import model_call, record_tokens
+
+logger = logging.getLogger(__name__)
+
+SystemPrompt = Union[str, List[Dict[str, Any]]]
+
+
+def cached_system_prompt(*static_parts: str) -> List[Dict[str, Any]]:
+    """Build system blocks for static text, marking the end of the prefix as cacheable
+
+    Everything up to and including the last block is cached by the API, so only
+    text that is identical across requests belongs here; per-request content
+    goes in the messages that follow.
+    """
+    blocks = [{"type": "text", "text": part} for part in static_parts if part]
+    if blocks:
+        blocks[-1]["cache_control"] = {"type": "ephemeral"}
+    return blocks
+
+
+def usage_counts(usage: Any) -> Dict[str, int]:
+    """Input/output and prompt-cache token counts from a response's usage block"""
+    return {
+        'input_tokens': getattr(usage, 'input_tokens', 0) or 0,
+        'output_tokens': getattr(usage, 'output_tokens', 0) or 0,
+        'cache_read_input_tokens': getattr(usage, 'cache_read_input_tokens', 0) or 0,
+        'cache_creation_input_tokens': getattr(usage, 'cache_creation_input_tokens', 0) or 0
+    }
+
+
+def log_usage(prompt_type: str, usage: Any) -> Dict[str, int]:
+    """Log input/output and prompt-cache token counts from a response's usage block"""
+    counts = usage_counts(usage)
+    logger.info(
+        f"{prompt_type} usage: input={counts['input_tokens']} output={counts['output_tokens']} "
+        f"cache_read={counts['cache_read_input_tokens']} cache_creation={counts['cache_creation_input_tokens']}"
+    )
+    record_tokens(prompt_type, counts)
+    return counts
+
+
+# 429 is a rate limit, 529 means the API is overloaded; both are worth waiting out
+THROTTLE_STATUS_CODES = (429, 529)
+# Request timeouts, lock conflicts and server errors are transient too, but say
+# nothing about our rate, so they are retried without slowing the limiter down
+TRANSIENT_STATUS_CODES = (408, 409)
+MAX_MODEL_RETRIES = 5
+
+
+def _retry_after(error: anthropic.APIStatusError) -> Optional[float]:
+    try:
+        return float(error.response.headers.get('retry-after'))
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def _is_throttled(error: Exception) -> bool:
+    return isinstance(error, anthropic.APIStatusError) and error.status_code in THROTTLE_STATUS_CODES
+
+
+def _is_retryable(error: Exception) -> bool:
+    # Client timeouts are not retried: the request may have run for minutes already
+    if isinstance(error, anthropic.APIStatusError):
+        return (error.status_code in THROTTLE_STATUS_CODES
+                or error.status_code in TRANSIENT_STATUS_CODES
+                or error.status_code >= 500)
+    return isinstance(error, anthropic.APIConnectionError) and not isinstance(error, anthropic.APITimeoutError)
+
+
+def _is_upstream_failure(error: Exception) -> bool:
+    """Errors that say the API itself is unhealthy, as opposed to a bad or throttled request"""
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code >= 500
+    return isinstance(error, anthropic.APIConnectionError)
+
+
+def _rate_limited_tokens(counts: Dict[str, int]) -> int:
+    # Cache reads do not count towards the input token rate limit
+    return counts['input_tokens'] + counts['cache_creation_input_tokens'] + counts['output_tokens']
+
+
+def _record_outcome(breaker, error: Exception) -> None:
+    # A 4xx still means the API answered, which also settles a half-open trial call
+    if _is_upstream_failure(error):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def _back_off(limiter, error: anthropic.APIError, attempt: int) -> None:
+    """Wait before retrying a failed request, or re-raise once out of attempts"""
+    if attempt >= MAX_MODEL_RETRIES:
+        raise error
+    if _is_throttled(error):
+        time.sleep(limiter.on_throttled(attempt, _retry_after(error)))
+    elif isinstance(error, anthropic.APIStatusError):
+        logger.warning(f"Model API error {error.status_code}: {str(error)}. Retrying...")
+        retry_after = _retry_after(error)
+        time.sleep(retry_after if retry_after is not None else backoff_delay(attempt))
+    else:
+        logger.warning(f"Model API connection error: {str(error)}. Retrying...")
+        time.sleep(backoff_delay(attempt))
+
+
+def create_message(client: anthropic.Anthropic, prompt_type: str = "default", **request: Any) -> Any:
+    """Send a Messages API request through the process-wide rate limiter
+
+    Throttled (429/529), transient (408/409/5xx) responses and dropped connections
+    are retried here with backoff; any other error is raised to the caller. Slow calls may be hedged,
+    and CircuitOpenError is raised without calling the API while the upstream
+    is failing. Every request sent, hedges included, takes its own limiter
+    reservation and settles it against its actual usage once it returns.
+    """
+    limiter = get_rate_limiter()
+    breaker = get_circuit_breaker()
+    hedger = get_hedger()
+    estimated = estimate_request_tokens(request)
+
+    def send() -> Any:
+        try:
+            response = client.messages.create(**request)
+        except Exception:
+            # A failed request used no tokens; its request slot stays spent
+            limiter.reconcile(estimated, 0)
+            raise
+        limiter.reconcile(estimated, _rate_limited_tokens(usage_counts(response.usage)))
+        return response
+
+    attempt = 0
+    with model_call(prompt_type) as call:
+        while True:
+            breaker.before_call()
+            # Limiter waits happen out here so they never count as call latency
+            limiter.acquire(estimated)
+            try:
+                response = hedger.call(
+                    prompt_type, send,
+                    reserve=lambda: limiter.acquire(estimated),
+                    release=lambda: limiter.release(estimated)
+                )
+            except (anthropic.APIStatusError, anthropic.APIConnectionError) as e:
+                _record_outcome(breaker, e)
+                if not _is_retryable(e):
+                    raise
+                _back_off(limiter, e, attempt)
+                attempt += 1
+                continue
+            breaker.record_success()
+            limiter.on_success()
+            counts = log_usage(prompt_type, response.usage)
+            call.set(attempts=attempt + 1, **counts)
+            return response
+
+
+def stream_message(client: anthropic.Anthropic, prompt_type: str = "default", **request: Any) -> Iterator[str]:
+    """Stream a response's text through the rate limiter, as create_message does
+
+    A throttled request is only retried if it fails before any text was yielded.
+    Streams are never hedged, since text has already reached the caller.
+    """
+    limiter = get_rate_limiter()
+    breaker = get_circuit_breaker()
+    estimated = estimate_request_tokens(request)
+    attempt = 0
+    with model_call(prompt_type) as call:
+        while True:
+            breaker.before_call()
+            limiter.acquire(estimated)
+            started = False
+            try:
+                with client.messages.stream(**request) as stream:
+                    for text in stream.text_stream:
+                        if not started:
+                            call.set(first_token_ms=round((time.time() - call.start) * 1000, 3))
+                        started = True
+                        yield text
+                    usage = stream.get_final_message().usage
+            except (anthropic.APIStatusError, anthropic.APIConnectionError) as e:
+                _record_outcome(breaker, e)
+                if started or not _is_retryable(e):
+                    raise
+                _back_off(limiter, e, attempt)
+                attempt += 1
+                continue
+            breaker.record_success()
+            limiter.on_success()
+            counts = log_usage(prompt_type, usage)
+            limiter.reconcile(estimated, _rate_limited_tokens(counts))
+            call.set(attempts=attempt + 1, **counts)
+            return
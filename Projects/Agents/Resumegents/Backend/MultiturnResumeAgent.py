@@ -1,11 +1,35 @@
-from typing import List, Dict, Optional, Union
+from typing import Any, Iterator, List, Dict, Optional, Tuple, Union
 from dataclasses import dataclass
 from datetime import datetime
 import anthropic
 import base64
+import copy
  
 import json
 import os   
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from PromptRegistry import get_prompt_registry
+from ModelRequests import SystemPrompt, cached_system_prompt, create_message, stream_message
+from ContextBuilder import ContextBuilder, detect_focus
+from ModelClient import get_model_client
+from PdfText import build_parse_content
+from ResumeHistory import ResumeHistory, ResumeVersion
+from JobKeywords import get_job_index, job_context, resume_context
+from ResumeSchema import RESUME_TOOL, RESUME_TOOL_CHOICE, parse_resume_output
+from SectionGenerator import GENERATION_MODE, SectionGenerator
+from BulletRewriter import BulletRewriter
+from LatexTemplates import render_resume
+from Telemetry import stage, timed
+
+# Background workers that fold new chat turns into each session's insights
+insight_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('INSIGHT_WORKERS', '4')),
+    thread_name_prefix='conversation-insights'
+)
+
+# How long LaTeX generation waits for an in-flight insight refresh before using the stored insights
+INSIGHT_WAIT_SECONDS = float(os.getenv('INSIGHT_WAIT_SECONDS', '2'))
 
 @dataclass
 class Message:
@@ -13,84 +37,125 @@ class Message:
     content: str
     timestamp: datetime = datetime.now()
 
-@dataclass
-class ResumeVersion:
-    content: Dict  # Now stores the structured JSON resume data
-    latex_content: Optional[str]  # Stores the LaTeX version
-    changes_made: str
-    timestamp: datetime = datetime.now()
-    feedback: Optional[str] = None
-    version_number: int = 0
-    pdf_path: Optional[str] = None
-
 class MultiturnResumeAgent:
-    def __init__(self, api_key: Optional[str] = None):
+    # Registry template names for each prompt key used by the agent
+    PROMPT_TEMPLATES = {
+        'resume_parser': 'ResumeParser',
+        'resume_creator': 'ComplexResumeCreator'
+    }
+
+    def __init__(self,
+                 api_key: Optional[str] = None,
+                 context_builder: Optional[ContextBuilder] = None,
+                 client: Optional[anthropic.Anthropic] = None):
         self.conversation_history: List[Message] = []
-        self.resume_versions: List[ResumeVersion] = []
+        # Versions are stored as patches with periodic snapshots and rebuilt on access
+        self.resume_versions = ResumeHistory()
         self.job_description: Optional[str] = None
         self.current_focus: Optional[str] = None
-        self.client = anthropic.Anthropic(api_key=api_key or os.getenv('ANTHROPIC_KEY_1'))
+        # Sessions share one pooled client instead of opening a connection pool each
+        self.client = client or get_model_client(api_key)
+
+        # Conversation insights are kept up to date incrementally; the checkpoint is the
+        # index of the first conversation message not analysed yet
+        self.conversation_insights: Dict = self._empty_insights()
+        self._insights_checkpoint: int = 0
+        # _insights_lock guards the insights and checkpoint; _analysis_lock runs one analysis at a time
+        self._insights_lock = threading.Lock()
+        self._analysis_lock = threading.Lock()
+        self._insights_future: Optional[Future] = None
+
+        # Chat prompts keep recent turns verbatim and fold older ones into a rolling summary
+        self.context_builder = context_builder or ContextBuilder()
+        self.conversation_summary: List[str] = []
+        self._summary_checkpoint: int = 0
         
-        # Load prompts
-        self.prompts = self._load_prompts()
-    
-    def _load_prompts(self) -> Dict[str, str]:
-        """Load all prompt templates"""
-        prompts = {}
-        prompt_files = {
-            'resume_parser': 'PROMPTS/ResumeParser.md',
-            'resume_creator': 'PROMPTS/ComplexResumeCreator.md'
+        # Prompt templates are shared across sessions and hot-reloaded by the registry
+        self.prompt_registry = get_prompt_registry()
+
+        # LaTeX fragments are cached process-wide, so unchanged sections are reused across versions
+        self.section_generator = SectionGenerator(
+            lambda system_prompt, messages: self.call_model(system_prompt, messages, prompt_type="resume_section")
+        )
+        # Template mode asks the model for reworded bullets only and renders the layout locally
+        self.bullet_rewriter = BulletRewriter(
+            lambda system_prompt, messages: self.call_model(system_prompt, messages, prompt_type="bullet_rewrite")
+        )
+
+    @property
+    def prompts(self) -> Dict[str, str]:
+        """Current text of all prompt templates"""
+        return {
+            key: self.prompt_registry.text(name, default="")  # Fallback empty prompt if file not found
+            for key, name in self.PROMPT_TEMPLATES.items()
         }
-        
-        for key, filepath in prompt_files.items():
-            try:
-                with open(filepath, 'r') as file:
-                    prompts[key] = file.read()
-            except FileNotFoundError:
-                prompts[key] = ""  # Fallback empty prompt if file not found
-        
-        return prompts
     
     def call_model(self, 
-                  system_prompt: str, 
+                  system_prompt: SystemPrompt, 
                   messages: List[Dict], 
-                  model_name: str = "claude-3-5-sonnet-20241022") -> str:
+                  model_name: str = "claude-3-5-sonnet-20241022",
+                  prompt_type: str = "default") -> str:
         """Make a call to Claude"""
-        response = self.client.messages.create(
+        response = create_message(
+            self.client,
+            prompt_type,
             model=model_name,
             max_tokens=4096,
             system=system_prompt,
             messages=messages
         )
         return response.content[0].text
+
+    def call_model_structured(self,
+                              system_prompt: SystemPrompt,
+                              messages: List[Dict],
+                              model_name: str = "claude-3-5-sonnet-20241022",
+                              prompt_type: str = "resume_parser") -> anthropic.types.Message:
+        """Call Claude with the resume tool forced; ResumeSchema reads the tool input"""
+        return create_message(
+            self.client,
+            prompt_type,
+            model=model_name,
+            max_tokens=8192,
+            system=system_prompt,
+            messages=messages,
+            tools=[RESUME_TOOL],
+            tool_choice=RESUME_TOOL_CHOICE
+        )
+
+    def stream_model(self,
+                    system_prompt: SystemPrompt,
+                    messages: List[Dict],
+                    model_name: str = "claude-3-5-sonnet-20241022",
+                    prompt_type: str = "default") -> Iterator[str]:
+        """Stream text deltas from Claude as they are produced"""
+        yield from stream_message(
+            self.client,
+            prompt_type,
+            model=model_name,
+            max_tokens=4096,
+            system=system_prompt,
+            messages=messages
+        )
     
     def parse_resume_pdf(self, pdf_base64: str) -> Dict:
-        """Parse PDF resume into structured JSON"""
-        user_prompt_content = [
-            {
-                "type": "document",
-                "source": {
-                    "type": "base64",
-                    "media_type": "application/pdf",
-                    "data": pdf_base64
-                }
-            },
-            {
-                "type": "text",
-                "text": "Extract the structured information from this resume and return it as JSON following the exact format specified:"
-            }
-        ]
+        """Parse a base64-encoded PDF resume into structured JSON"""
+        return self.parse_resume_pdf_bytes(base64.b64decode(pdf_base64), pdf_base64)
+
+    @timed('parse_resume')
+    def parse_resume_pdf_bytes(self, pdf_bytes: bytes, pdf_base64: Optional[str] = None) -> Dict:
+        """Parse PDF resume bytes into structured JSON"""
+        # Text-based PDFs go as extracted text; scanned ones as the PDF document itself
+        user_prompt_content, _ = build_parse_content(pdf_bytes, pdf_base64)
         
         messages = [{"role": "user", "content": user_prompt_content}]
         
+        system_prompt = cached_system_prompt(self.prompts['resume_parser'])
         try:
-            parsed_json = self.call_model(
-                system_prompt=self.prompts['resume_parser'],
-                messages=messages
-            )
-            
+            # Schema-checked tool output; malformed replies are repaired locally before re-calling
+            resume_data = parse_resume_output(lambda: self.call_model_structured(system_prompt, messages))
+
             # Add the first version to our version control
-            resume_data = json.loads(parsed_json)
             self.add_resume_version(
                 content=resume_data,
                 changes_made="Initial PDF parse",
@@ -104,8 +169,8 @@ class MultiturnResumeAgent:
             self._add_system_message(error_msg)
             raise
     
-    def generate_tailored_latex(self, target_version: int = -1) -> Dict:
-        """Generate LaTeX from the specified resume version, incorporating conversation history"""
+    def _resolve_latex_inputs(self, target_version: int = -1) -> Tuple[ResumeVersion, Dict]:
+        """The resume version to render and the current conversation insights"""
         if not self.resume_versions or not self.job_description:
             raise ValueError("Both resume and job description are required")
             
@@ -116,75 +181,212 @@ class MultiturnResumeAgent:
         
         if not resume_version:
             raise ValueError("Invalid resume version")
-        
-        try:
-            # Analyze conversation history for improvements and suggestions
-            conversation_insights = self._analyze_conversation_history()
-            
-            # Build enhanced prompt incorporating conversation insights
-            prompt = f"""Here is a job description:
 
-    {self.job_description}
+        return resume_version, self._current_insights()
+
+    def _build_latex_request(self, target_version: int = -1) -> Tuple[ResumeVersion, Dict, SystemPrompt, List[Dict]]:
+        """Resolve the target version and build the whole-document LaTeX generation prompt"""
+        resume_version, conversation_insights = self._resolve_latex_inputs(target_version)
+
+        # Build enhanced prompt incorporating conversation insights
+        # Keyword summary of the posting and the best-matching material, unless JOB_CONTEXT_MODE=full
+        prompt = f"""Here is a job description:
+
+    {job_context(self.job_description)}
 
     Here is the resume data:
 
-    {json.dumps(resume_version.content, indent=2)}
+    {resume_context(resume_version.content, self.job_description)}
 
     Based on our conversation, these improvements were suggested:
     {json.dumps(conversation_insights, indent=2)}
 
-    IMPORTANT: Create a professional LaTeX resume that STRICTLY follows these rules:
-    1. Use ONLY the information provided in the resume data above and from our conversation ONLY - DO NOT add or fabricate any additional experiences, skills, or qualifications
-    2. You may rephrase or reformat existing content, but must maintain complete factual accuracy
-    3. Maintain professional formatting and structure
-
-    {self.prompts['resume_creator']}
-
     Return only the LaTeX code."""
 
-            system_prompt = """You are an expert resume writer with a strict commitment to accuracy. 
+        # The instructions and creator template never change between calls, so they form
+        # a cacheable system prefix ahead of the per-request job description and resume
+        system_prompt = cached_system_prompt(
+            """You are an expert resume writer with a strict commitment to accuracy. 
     Create a professional LaTeX resume using ONLY the information provided in the resume data. 
     Never add, fabricate, or enhance details beyond what is explicitly stated in the source data. 
     Focus on optimal presentation of existing information only.
-    Return only the LaTeX code."""
+    Return only the LaTeX code.
 
-            messages = [{"role": "user", "content": prompt}]
-            
-            latex_code = self.call_model(system_prompt, messages)
-            
-            # Validate LaTeX code
-            if not latex_code.startswith('\\documentclass'):
-                raise ValueError("Generated LaTeX code appears to be invalid")
-            
-            # Save to file with timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"tailored_resume_{timestamp}.tex"
-            
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(latex_code)
-            
-            # Update resume version with LaTeX content
-            resume_version.latex_content = latex_code
-            
-            return {
-                'status': 'success',
-                'message': f'LaTeX file saved as {filename}',
-                'latex_code': latex_code,
-                'filepath': filename,
-                'improvements_applied': conversation_insights
-            }
+    IMPORTANT: Create a professional LaTeX resume that STRICTLY follows these rules:
+    1. Use ONLY the information provided in the resume data and from our conversation ONLY - DO NOT add or fabricate any additional experiences, skills, or qualifications
+    2. You may rephrase or reformat existing content, but must maintain complete factual accuracy
+    3. Maintain professional formatting and structure""",
+            self.prompts['resume_creator']
+        )
+
+        messages = [{"role": "user", "content": prompt}]
+        return resume_version, conversation_insights, system_prompt, messages
+
+    def _finalize_latex(self, resume_version: ResumeVersion, latex_code: str, conversation_insights: Dict) -> Dict:
+        """Validate, save and version the LaTeX returned by the model"""
+        # Drop any preamble text the model put before the document
+        start = latex_code.find('\\documentclass')
+        if start > 0:
+            latex_code = latex_code[start:]
+        latex_code = latex_code.strip()
+
+        # Validate LaTeX code
+        if not latex_code.startswith('\\documentclass'):
+            raise ValueError("Generated LaTeX code appears to be invalid")
+        
+        # Save to file with timestamp
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"tailored_resume_{timestamp}.tex"
+        
+        with stage('save_resume'), open(filename, 'w', encoding='utf-8') as f:
+            f.write(latex_code)
+        
+        # Update resume version with LaTeX content and record the generation as a new version
+        resume_version.latex_content = latex_code
+        self.add_resume_version(
+            content=resume_version.content,
+            changes_made=f"Generated tailored LaTeX from version {resume_version.version_number}",
+            latex_content=latex_code
+        )
+        
+        return {
+            'status': 'success',
+            'message': f'LaTeX file saved as {filename}',
+            'latex_code': latex_code,
+            'filepath': filename,
+            'latex_valid': True,
+            'version_number': self.current_resume.version_number,
+            'improvements_applied': conversation_insights,
+            'relevance': get_job_index(self.job_description).relevance(resume_version.content)
+        }
+
+    def _latex_error(self, e: Exception) -> Dict:
+        error_msg = f"Error generating LaTeX: {str(e)}"
+        self._add_system_message(error_msg)
+        return {
+            'status': 'error',
+            'message': error_msg,
+            'latex_valid': False
+        }
+
+    @staticmethod
+    def _section_guidance(insights: Dict, resume: Dict) -> Dict[str, str]:
+        """Route conversation insights to the resume sections they are about
+
+        Nothing goes to every section ('*'), so a new insight only changes the
+        cache keys of the fragments it concerns. General improvements go to the
+        section they name, else to the summary (or, without one, the roles);
+        job keywords go to the skills and summary.
+        """
+        personal = resume.get('personal_info') or {}
+        overview = 'summary' if personal.get('summary') or personal.get('objective') else 'experience'
+        routed: Dict[str, List] = {}
+
+        def add(section: str, items: List) -> None:
+            routed.setdefault(section, []).extend(items)
+
+        for item in insights.get('general_improvements') or []:
+            focus = detect_focus(str(item), resume)
+            if focus == 'personal_info':
+                mentions_summary = any(word in str(item).lower() for word in ('summary', 'objective'))
+                focus = 'summary' if overview == 'summary' and mentions_summary else 'header'
+            add(focus or overview, [item])
+        for section, items in (insights.get('section_specific') or {}).items():
+            if items:
+                add('header' if section == 'personal_info' else section, items)
+        if insights.get('skills_focus'):
+            add('skills', insights['skills_focus'])
+        if insights.get('keywords'):
+            add('skills', insights['keywords'])
+            if overview == 'summary':
+                add('summary', insights['keywords'])
+        return {section: json.dumps(items) for section, items in routed.items()}
+
+    @timed('generate_latex')
+    def generate_tailored_latex(self, target_version: int = -1, theme: Optional[str] = None) -> Dict:
+        """Generate LaTeX from the specified resume version, incorporating conversation history"""
+        if GENERATION_MODE in ('template', 'sections'):
+            resume_version, conversation_insights = self._resolve_latex_inputs(target_version)
+            try:
+                guidance = self._section_guidance(conversation_insights, resume_version.content)
+                if GENERATION_MODE == 'template':
+                    tailored, _ = self.bullet_rewriter.rewrite(resume_version.content, self.job_description, guidance)
+                    latex_code = render_resume(tailored, theme)
+                else:
+                    latex_code, _ = self.section_generator.generate(
+                        resume_version.content, self.job_description, guidance, theme
+                    )
+                return self._finalize_latex(resume_version, latex_code, conversation_insights)
+            except Exception as e:
+                return self._latex_error(e)
+
+        resume_version, conversation_insights, system_prompt, messages = self._build_latex_request(target_version)
+        
+        try:
+            latex_code = self.call_model(system_prompt, messages, prompt_type="resume_creator")
+            return self._finalize_latex(resume_version, latex_code, conversation_insights)
             
         except Exception as e:
-            error_msg = f"Error generating LaTeX: {str(e)}"
-            self._add_system_message(error_msg)
-            return {
-                'status': 'error',
-                'message': error_msg
-            }
+            return self._latex_error(e)
 
-    def _analyze_conversation_history(self) -> Dict:
-        """Extract improvements and suggestions from conversation history"""
-        insights = {
+    @timed('generate_latex')
+    def generate_tailored_latex_stream(self, target_version: int = -1, theme: Optional[str] = None) -> Iterator[Tuple[str, Any]]:
+        """Stream LaTeX generation as (event, data) pairs, ending with a 'result' event"""
+        yield 'status', {'stage': 'preparing'}
+        if GENERATION_MODE == 'template':
+            yield from self._generate_template_stream(target_version, theme)
+            return
+        if GENERATION_MODE == 'sections':
+            yield from self._generate_sections_stream(target_version, theme)
+            return
+        resume_version, conversation_insights, system_prompt, messages = self._build_latex_request(target_version)
+        yield 'status', {'stage': 'generating'}
+
+        chunks = []
+        try:
+            for text in self.stream_model(system_prompt, messages, prompt_type="resume_creator"):
+                chunks.append(text)
+                yield 'token', text
+            result = self._finalize_latex(resume_version, "".join(chunks), conversation_insights)
+        except Exception as e:
+            result = self._latex_error(e)
+        yield 'result', result
+
+    def _generate_template_stream(self, target_version: int, theme: Optional[str]) -> Iterator[Tuple[str, Any]]:
+        """Template-mode generation: one bullet rewrite call, then local rendering"""
+        resume_version, conversation_insights = self._resolve_latex_inputs(target_version)
+        yield 'status', {'stage': 'generating'}
+        try:
+            guidance = self._section_guidance(conversation_insights, resume_version.content)
+            tailored, stats = self.bullet_rewriter.rewrite(resume_version.content, self.job_description, guidance)
+            yield 'status', {'stage': 'rendering', **stats}
+            result = self._finalize_latex(resume_version, render_resume(tailored, theme), conversation_insights)
+        except Exception as e:
+            result = self._latex_error(e)
+        yield 'result', result
+
+    def _generate_sections_stream(self, target_version: int, theme: Optional[str] = None) -> Iterator[Tuple[str, Any]]:
+        """Section-mode generation, with a 'section' event as each fragment is ready"""
+        resume_version, conversation_insights = self._resolve_latex_inputs(target_version)
+        resume = resume_version.content
+        yield 'status', {'stage': 'generating'}
+
+        fragments = {}
+        try:
+            for fragment, latex, cached in self.section_generator.iter_fragments(
+                resume, self.job_description, self._section_guidance(conversation_insights, resume)
+            ):
+                fragments[fragment.id] = latex
+                yield 'section', {'id': fragment.id, 'cached': cached, 'latex': latex}
+            latex_code = self.section_generator.assemble(fragments, resume, theme)
+            result = self._finalize_latex(resume_version, latex_code, conversation_insights)
+        except Exception as e:
+            result = self._latex_error(e)
+        yield 'result', result
+
+    @staticmethod
+    def _empty_insights() -> Dict:
+        return {
             'general_improvements': [],
             'section_specific': {},
             'skills_focus': [],
@@ -193,9 +395,84 @@ class MultiturnResumeAgent:
             'model_suggested_changes': [],  # New field for tracking model suggestions
             'approved_changes': []  # New field for tracking user-approved changes
         }
-        
-        try:
-            analysis_prompt = """Carefully analyze this conversation history about a resume and extract:
+
+    @staticmethod
+    def _merge_insights(insights: Dict, new_insights: Dict) -> Dict:
+        """Merge newly extracted findings into the running insight JSON without duplicates"""
+        def merge_list(existing: List, additions: List) -> List:
+            seen = {json.dumps(item, sort_keys=True) for item in existing}
+            for item in additions or []:
+                marker = json.dumps(item, sort_keys=True)
+                if marker not in seen:
+                    existing.append(item)
+                    seen.add(marker)
+            return existing
+
+        for key, value in new_insights.items():
+            if key == 'section_specific' and isinstance(value, dict):
+                sections = insights.setdefault('section_specific', {})
+                for section, changes in value.items():
+                    sections[section] = merge_list(sections.get(section, []), changes)
+            elif key == 'model_suggested_changes' and isinstance(value, list):
+                # A later turn may approve an earlier suggestion; update it in place
+                existing = {item.get('suggestion'): item for item in insights.setdefault(key, []) if isinstance(item, dict)}
+                for item in value:
+                    if isinstance(item, dict) and item.get('suggestion') in existing:
+                        existing[item['suggestion']].update(item)
+                    else:
+                        insights[key].append(item)
+            elif isinstance(value, list):
+                insights[key] = merge_list(insights.get(key, []), value)
+            else:
+                insights[key] = value
+        return insights
+
+    def _schedule_insight_refresh(self) -> None:
+        """Analyse the latest turns in the background so LaTeX generation does not wait on it"""
+        self._insights_future = insight_executor.submit(self._analyze_conversation_history)
+
+    def _current_insights(self) -> Dict:
+        """Insights for LaTeX generation without a model call of its own
+
+        An in-flight refresh gets a short wait; turns it has not reached yet (for example in
+        a session loaded from another worker) are analysed in the background for next time.
+        """
+        refresh = self._insights_future
+        if refresh is not None and not refresh.done():
+            try:
+                refresh.result(timeout=INSIGHT_WAIT_SECONDS)
+            except Exception:
+                pass
+        with self._insights_lock:
+            insights, behind = self.conversation_insights, self._insights_checkpoint < len(self.conversation_history)
+        if behind and (self._insights_future is None or self._insights_future.done()):
+            self._schedule_insight_refresh()
+        return insights
+
+    @property
+    def insights_refresh(self) -> Optional[Future]:
+        """The background insight analysis last scheduled, if any; it changes the agent when done"""
+        return self._insights_future
+
+    @timed('analyze_conversation_history')
+    def _analyze_conversation_history(self) -> Dict:
+        """Extract improvements and suggestions from turns not analysed yet and merge them in"""
+        # Only one analysis runs at a time; the insights lock is held only to read and merge,
+        # never across the model call, so readers do not wait on the analysis
+        with self._analysis_lock:
+            with self._insights_lock:
+                checkpoint = len(self.conversation_history)
+                new_turns = [
+                    msg for msg in self.conversation_history[self._insights_checkpoint:checkpoint]
+                    if msg.role in ['user', 'assistant']
+                ]
+                insights = self.conversation_insights
+                if not new_turns:
+                    self._insights_checkpoint = checkpoint
+                    return insights
+
+            try:
+                analysis_prompt = """Carefully analyze the NEW turns of this conversation about a resume and extract:
     1. General improvements suggested
     2. Section-specific changes
     3. Skills to emphasize
@@ -211,6 +488,8 @@ class MultiturnResumeAgent:
         b) Suggested by me (the AI assistant)
         c) Explicitly approved by the user
     - Do not include suggestions that would require adding new information not present in the original resume
+    - Return ONLY findings from the new turns. If a new turn approves a suggestion listed in the
+      insights so far, repeat that suggestion with the exact same text and status "approved"
 
     Return the analysis as a JSON object with the following structure:
     {
@@ -225,36 +504,39 @@ class MultiturnResumeAgent:
         "approved_changes": ["approved change1", "approved change2"]
     }
 
-    Conversation:
+    Insights so far:
     """
-            # Add relevant conversation messages
-            conversation_text = "\n".join([
-                f"{msg['role']}: {msg['content']}"
-                for msg in self.conversation_history
-                if msg['role'] in ['user', 'assistant']
-            ])
-            
-            # Get analysis from Claude
-            messages = [{
-                "role": "user", 
-                "content": analysis_prompt + conversation_text
-            }]
-            
-            analysis = self.call_model(
-                system_prompt="""You are an expert at analyzing resume discussions. 
-                Focus on extracting concrete, actionable changes while maintaining strict accuracy. 
-                Only include changes that work with existing resume information.
-                Return results as properly formatted JSON.""",
-                messages=messages
-            )
-            
-            # Parse and structure the insights
-            insights = json.loads(analysis)
-            
-        except Exception as e:
-            self._add_system_message(f"Error analyzing conversation: {str(e)}")
-            
-        return insights
+                # Add only the conversation messages since the last checkpoint
+                conversation_text = "\n".join([
+                    f"{msg.role}: {msg.content}"
+                    for msg in new_turns
+                ])
+                
+                # Get analysis from Claude
+                messages = [{
+                    "role": "user", 
+                    "content": analysis_prompt + json.dumps(insights) + "\n\n    New conversation turns:\n" + conversation_text
+                }]
+                
+                analysis = self.call_model(
+                    system_prompt="""You are an expert at analyzing resume discussions. 
+                    Focus on extracting concrete, actionable changes while maintaining strict accuracy. 
+                    Only include changes that work with existing resume information.
+                    Return results as properly formatted JSON.""",
+                    messages=messages,
+                    prompt_type="conversation_analysis"
+                )
+                
+                # Merge into a copy and swap it in, so readers never see a half-merged dict
+                merged = self._merge_insights(copy.deepcopy(insights), json.loads(analysis))
+                with self._insights_lock:
+                    self.conversation_insights = merged
+                    self._insights_checkpoint = checkpoint
+                
+            except Exception as e:
+                self._add_system_message(f"Error analyzing conversation: {str(e)}")
+                
+            return self.conversation_insights
     
     @property
     def current_resume(self) -> Optional[ResumeVersion]:
@@ -267,50 +549,111 @@ class MultiturnResumeAgent:
                           latex_content: Optional[str] = None,
                           feedback: Optional[str] = None) -> None:
         """Add a new version of the resume"""
-        version_number = len(self.resume_versions)
-        new_version = ResumeVersion(
-            content=content,
+        new_version = self.resume_versions.append(
+            content,
             latex_content=latex_content,
             changes_made=changes_made,
-            feedback=feedback,
-            version_number=version_number
+            feedback=feedback
         )
-        self.resume_versions.append(new_version)
-        self._add_system_message(f"New resume version {version_number} created. Resume Content {content}. Changes: {changes_made}")
+        # The content itself lives in the version history, not in the conversation
+        self._add_system_message(f"New resume version {new_version.version_number} created. Changes: {changes_made}")
     
     def _add_system_message(self, content: str) -> None:
         """Add a system message to the conversation history"""
         self.conversation_history.append(Message(role="system", content=content))
     
-    def chat(self, user_message: str) -> str:
-        """Handle ongoing conversation about the resume"""
+    def _build_chat_request(self, user_message: str) -> Tuple[SystemPrompt, List[Dict]]:
+        """Record the user turn and build a token-budgeted chat prompt"""
         self.conversation_history.append(Message(role="user", content=user_message))
-        
-        context = {
-            "resume": self.current_resume.content if self.current_resume else None,
-            "resume_version": self.current_resume.version_number if self.current_resume else None,
-            "job_description": self.job_description,
-            "current_focus": self.current_focus,
-             "version_info": {
-                "current_version": self.current_resume.version_number if self.current_resume else None,
-                "total_versions": len(self.resume_versions)
-            }
-        }
-        
-        system_prompt = f"""You are an expert resume consultant. 
-Current context: {json.dumps(context, indent=2)}
 
-Provide specific, actionable advice for improving the resume based on the conversation history.
-If suggesting changes, be specific about what should be modified and why."""
+        resume = self.current_resume.content if self.current_resume else None
+        focus = detect_focus(user_message, resume)
+        if focus:
+            self.current_focus = focus
+
+        self.conversation_summary, self._summary_checkpoint = self.context_builder.update_summary(
+            self.conversation_summary, self.conversation_history, self._summary_checkpoint
+        )
+        return self.context_builder.build(
+            history=self.conversation_history,
+            summary_lines=self.conversation_summary,
+            resume=resume,
+            resume_version=self.current_resume.version_number if self.current_resume else None,
+            total_versions=len(self.resume_versions),
+            job_description=self.job_description,
+            current_focus=self.current_focus
+        )
 
-        messages = [{"role": "user", "content": user_message}]
+    @timed('chat')
+    def chat(self, user_message: str) -> str:
+        """Handle ongoing conversation about the resume"""
+        system_prompt, messages = self._build_chat_request(user_message)
         
         try:
-            response = self.call_model(system_prompt, messages)
+            response = self.call_model(system_prompt, messages, prompt_type="chat")
             self.conversation_history.append(Message(role="assistant", content=response))
+            self._schedule_insight_refresh()
             return response
             
         except Exception as e:
             error_msg = f"Error in conversation: {str(e)}"
             self._add_system_message(error_msg)
-            return error_msg
\ No newline at end of file
+            return error_msg
+
+    @timed('chat')
+    def chat_stream(self, user_message: str) -> Iterator[Tuple[str, Any]]:
+        """Stream a chat reply as (event, data) pairs, ending with a 'result' event"""
+        system_prompt, messages = self._build_chat_request(user_message)
+
+        chunks = []
+        try:
+            for text in self.stream_model(system_prompt, messages, prompt_type="chat"):
+                chunks.append(text)
+                yield 'token', text
+        except Exception as e:
+            error_msg = f"Error in conversation: {str(e)}"
+            self._add_system_message(error_msg)
+            yield 'result', {'status': 'error', 'message': error_msg}
+            return
+
+        response = "".join(chunks)
+        self.conversation_history.append(Message(role="assistant", content=response))
+        self._schedule_insight_refresh()
+        yield 'result', {'status': 'success', 'response': response}
+
+    def to_state(self) -> Dict:
+        """Serializable snapshot of everything that makes up the session"""
+        return {
+            'conversation_history': [
+                {'role': msg.role, 'content': msg.content, 'timestamp': msg.timestamp.isoformat()}
+                for msg in self.conversation_history
+            ],
+            'resume_versions': self.resume_versions.to_state(),
+            'job_description': self.job_description,
+            'current_focus': self.current_focus,
+            **self._insights_state(),
+            'conversation_summary': self.conversation_summary,
+            'summary_checkpoint': self._summary_checkpoint
+        }
+
+    def _insights_state(self) -> Dict:
+        with self._insights_lock:
+            return {'conversation_insights': self.conversation_insights, 'insights_checkpoint': self._insights_checkpoint}
+
+    @classmethod
+    def from_state(cls, state: Dict, **kwargs) -> 'MultiturnResumeAgent':
+        """Rebuild an agent from a to_state() snapshot"""
+        agent = cls(**kwargs)
+        agent.conversation_history = [
+            Message(role=msg['role'], content=msg['content'], timestamp=datetime.fromisoformat(msg['timestamp']))
+            for msg in state.get('conversation_history', [])
+        ]
+        # States saved before delta encoding carry full 'content' per version; both load
+        agent.resume_versions = ResumeHistory.from_state(state.get('resume_versions', []))
+        agent.job_description = state.get('job_description')
+        agent.current_focus = state.get('current_focus')
+        agent.conversation_insights = state.get('conversation_insights') or cls._empty_insights()
+        agent._insights_checkpoint = state.get('insights_checkpoint', 0)
+        agent.conversation_summary = state.get('conversation_summary', [])
+        agent._summary_checkpoint = state.get('summary_checkpoint', 0)
+        return agent
@@ -0,0 +1,180 @@
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+import base64
+import logging
+import os
+import re
+import unicodedata
+
+from Telemetry import timed
+
+try:
+    import pypdf
+except ImportError:  # Optional: without pypdf every PDF is sent as a document block
+    pypdf = None
+
+logger = logging.getLogger(__name__)
+
+# 'auto' sends extracted text for text-based PDFs; 'off' always sends the PDF itself
+PDF_TEXT_MODE = os.getenv('PDF_TEXT_EXTRACTION', 'auto')
+
+# Below this many visible characters per page a PDF is treated as scanned or image-only
+MIN_CHARS_PER_PAGE = int(os.getenv('PDF_MIN_CHARS_PER_PAGE', '200'))
+
+# Share of unreadable characters (missing glyph maps, replacement chars) that marks extraction as garbled
+MAX_GARBLED_RATIO = float(os.getenv('PDF_MAX_GARBLED_RATIO', '0.05'))
+
+# Share of words glued to a neighbour in the layout text (e.g. "Scientistfinishinga") that marks it unusable
+MAX_MERGED_RATIO = float(os.getenv('PDF_MAX_MERGED_RATIO', '0.01'))
+
+# Horizontal scale weights tried for layout extraction, in order; pypdf's default (1.25) drops
+# the spaces between words in some tightly kerned PDFs, which a wider weight puts back
+LAYOUT_SCALE_WEIGHTS = (1.25, 1.5, 2.0)
+
+# Bumped whenever the extracted text format changes, so cached parses of the old format are not reused
+EXTRACTOR_VERSION = 'pdftext-2'
+
+PARSE_INSTRUCTION = "Extract the structured information from this resume and return it as JSON following the exact format specified:"
+
+_GARBLED_RE = re.compile(r'\(cid:\d+\)|[\ufffd\ue000-\uf8ff]')
+
+# Separators that layout text may attach to a word without merging it with another
+_WORD_PUNCTUATION = '|•·-–—,;:()[]"\''
+
+
+@dataclass
+class ExtractedText:
+    text: str
+    pages: int
+    chars: int  # Visible (non-whitespace) characters across all pages
+    links: List[str] = field(default_factory=list)
+    garbled_ratio: float = 0.0
+    merged_ratio: float = 0.0  # Share of words that lost the space to their neighbour
+
+    @property
+    def chars_per_page(self) -> float:
+        return self.chars / max(1, self.pages)
+
+    @property
+    def is_text_based(self) -> bool:
+        """Text-density heuristic: enough readable, correctly spaced text per page to stand in for the PDF"""
+        return (self.chars_per_page >= MIN_CHARS_PER_PAGE
+                and self.garbled_ratio <= MAX_GARBLED_RATIO
+                and self.merged_ratio <= MAX_MERGED_RATIO)
+
+
+def _compact_line(line: str) -> str:
+    # Layout extraction pads columns with spaces; keep wide gaps as a column hint only
+    columns = re.split(r' {4,}', line.strip())
+    return '  '.join(' '.join(column.split()) for column in columns)
+
+
+def _words(text: str) -> List[str]:
+    words = (word.strip(_WORD_PUNCTUATION) for word in unicodedata.normalize('NFKC', text).split())
+    return [word for word in words if word]
+
+
+def _layout_text(page: Any) -> Tuple[str, int, int]:
+    """A page's layout text, the number of words on it and how many of those were merged away
+
+    pypdf's plain extraction keeps every word intact (one per line) and serves as the
+    reference; layout extraction is retried with wider spacing while words are missing.
+    """
+    try:
+        reference = _words(page.extract_text() or '')
+        for weight in LAYOUT_SCALE_WEIGHTS:
+            raw = page.extract_text(extraction_mode='layout', layout_mode_scale_weight=weight) or ''
+            found = set(_words(raw))
+            merged = sum(1 for word in reference if word not in found)
+            if merged <= MAX_MERGED_RATIO * len(reference):
+                break
+        return raw, len(reference), merged
+    except (KeyError, ValueError):
+        # Pages without a content stream (e.g. blank or image-only) have no text
+        return '', 0, 0
+
+
+def _page_links(page: Any) -> List[str]:
+    links = []
+    for annotation in page.get('/Annots') or []:
+        action = annotation.get_object().get('/A') or {}
+        uri = action.get('/URI')
+        if isinstance(uri, str):
+            links.append(uri)
+    return links
+
+
+@timed('pdf_text_extract')
+def extract_pdf_text(pdf_bytes: bytes) -> Optional[ExtractedText]:
+    """Text and layout hints from a PDF, or None if pypdf is missing or cannot read it"""
+    if pypdf is None:
+        return None
+    try:
+        reader = pypdf.PdfReader(BytesIO(pdf_bytes))
+        pages = []
+        links: List[str] = []
+        words = merged = 0
+        for page in reader.pages:
+            raw, page_words, page_merged = _layout_text(page)
+            words += page_words
+            merged += page_merged
+            # NFKC folds ligatures such as 'ﬁ' back into plain letters
+            lines = [_compact_line(line) for line in unicodedata.normalize('NFKC', raw).splitlines()]
+            pages.append("\n".join(line for line in lines if line))
+            links.extend(link for link in _page_links(page) if link not in links)
+    except Exception as e:
+        logger.warning(f"PDF text extraction failed, sending the PDF instead: {str(e)}")
+        return None
+
+    visible = sum(len(re.sub(r'\s', '', page)) for page in pages)
+    garbled = sum(len(match) for page in pages for match in _GARBLED_RE.findall(page))
+    sections = [f"[Page {i}]\n{page}" for i, page in enumerate(pages, 1)]
+    if links:
+        # Link targets are often hidden behind display text, so list them separately
+        sections.append("[Links]\n" + "\n".join(links))
+    return ExtractedText(
+        text="\n\n".join(sections),
+        pages=len(pages),
+        chars=visible,
+        links=links,
+        garbled_ratio=garbled / max(1, visible),
+        merged_ratio=merged / max(1, words)
+    )
+
+
+def build_parse_content(pdf_bytes: bytes, pdf_base64: Optional[str] = None) -> Tuple[List[Dict], str]:
+    """User message content for a resume parse and the input mode used ('text' or 'document')
+
+    Text-based PDFs are sent as their extracted text, which costs a fraction of the
+    tokens of the rendered pages; scanned or image-only PDFs still go as a document.
+    The PDF is only base64-encoded here, when a document block actually needs it.
+    """
+    if PDF_TEXT_MODE != 'off':
+        extracted = extract_pdf_text(pdf_bytes)
+        if extracted is not None and extracted.is_text_based:
+            logger.info(f"Parsing from extracted text ({extracted.pages} pages, {extracted.chars_per_page:.0f} chars/page)")
+            return [{
+                "type": "text",
+                "text": f"Resume text extracted from a PDF (columns separated by double spaces):\n\n{extracted.text}\n\n{PARSE_INSTRUCTION}"
+            }], 'text'
+        if extracted is not None:
+            logger.info(
+                f"PDF text unusable ({extracted.chars_per_page:.0f} chars/page, {extracted.garbled_ratio:.0%} garbled, "
+                f"{extracted.merged_ratio:.0%} merged words), sending the PDF"
+            )
+
+    return [
+        {
+            "type": "document",
+            "source": {
+                "type": "base64",
+                "media_type": "application/pdf",
+                "data": pdf_base64 or base64.b64encode(pdf_bytes).decode('ascii')
+            }
+        },
+        {
+            "type": "text",
+            "text": PARSE_INSTRUCTION
+        }
+    ], 'document'
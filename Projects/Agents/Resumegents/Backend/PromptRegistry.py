@@ -0,0 +1,105 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import hashlib
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'PROMPTS')
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    name: str
+    text: str
+    version_id: str  # "<name>@<content hash>", stable across processes and restarts
+    path: str
+    mtime: float
+
+
+class PromptRegistry:
+    """Process-wide, versioned store of the PROMPTS/*.md templates"""
+
+    def __init__(self, directory: str = PROMPTS_DIR, reload_interval: Optional[float] = None):
+        self.directory = directory
+        self.reload_interval = reload_interval or float(os.getenv('PROMPT_RELOAD_INTERVAL', '5'))
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.refresh()
+
+    def get(self, name: str) -> PromptTemplate:
+        """Return the current version of a template; raises KeyError if it does not exist"""
+        return self._templates[name]
+
+    def text(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        template = self._templates.get(name)
+        return template.text if template else default
+
+    def versions(self) -> Dict[str, str]:
+        return {name: template.version_id for name, template in self._templates.items()}
+
+    def refresh(self) -> List[str]:
+        """Reload templates whose mtime and content changed; returns the names that changed"""
+        changed = []
+        try:
+            filenames = sorted(name for name in os.listdir(self.directory) if name.endswith('.md'))
+        except FileNotFoundError:
+            logger.error(f"Prompt directory not found at {self.directory}")
+            return changed
+
+        with self._lock:
+            for filename in filenames:
+                name = os.path.splitext(filename)[0]
+                path = os.path.join(self.directory, filename)
+                try:
+                    mtime = os.stat(path).st_mtime
+                    current = self._templates.get(name)
+                    if current and current.mtime == mtime:
+                        continue
+                    with open(path, 'r', encoding='utf-8') as file:
+                        text = file.read()
+                except OSError as e:
+                    logger.error(f"Error reading prompt template {path}: {str(e)}")
+                    continue
+
+                version_id = f"{name}@{hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]}"
+                if current and current.version_id == version_id:
+                    # Touched but not edited; remember the mtime so we skip it next time
+                    self._templates[name] = PromptTemplate(name, text, version_id, path, mtime)
+                    continue
+                self._templates[name] = PromptTemplate(name, text, version_id, path, mtime)
+                changed.append(name)
+                logger.info(f"Loaded prompt template {version_id}")
+        return changed
+
+    def start_watching(self) -> None:
+        """Poll the prompt directory in the background so lookups never touch the disk"""
+        if self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, name='prompt-registry', daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        self._stop.set()
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.reload_interval):
+            self.refresh()
+
+
+_registry: Optional[PromptRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_prompt_registry() -> PromptRegistry:
+    """Return the shared registry, loading every template on first use"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PromptRegistry()
+            _registry.start_watching()
+        return _registry
@@ -0,0 +1,166 @@
+from typing import Any, Dict, Optional
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Rough chars-per-token ratio used to price a request before sending it
+CHARS_PER_TOKEN = 4
+# PDF document blocks are billed per page; assume a dense page per ~3 KB of PDF
+PDF_BYTES_PER_PAGE = 3000
+PDF_TOKENS_PER_PAGE = 1500
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Exponential backoff with full jitter for the given (0-based) retry attempt"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def estimate_request_tokens(request: Dict[str, Any]) -> int:
+    """Estimate what a Messages API request will cost: input tokens plus its output allowance"""
+    def text_tokens(value: Any) -> int:
+        return len(value) // CHARS_PER_TOKEN if isinstance(value, str) else len(json.dumps(value)) // CHARS_PER_TOKEN
+
+    tokens = 0
+    system = request.get('system')
+    if system:
+        tokens += text_tokens(system if isinstance(system, str) else [block.get('text', '') for block in system])
+
+    if request.get('tools'):
+        tokens += text_tokens(request['tools'])
+
+    for message in request.get('messages', []):
+        content = message.get('content')
+        if isinstance(content, str):
+            tokens += text_tokens(content)
+            continue
+        for block in content or []:
+            if block.get('type') == 'document' and block.get('source', {}).get('type') == 'base64':
+                pdf_bytes = len(block['source'].get('data', '')) * 3 // 4
+                tokens += max(1, pdf_bytes // PDF_BYTES_PER_PAGE) * PDF_TOKENS_PER_PAGE
+            else:
+                tokens += text_tokens(block.get('text', block))
+
+    return tokens + int(request.get('max_tokens', 0))
+
+
+class TokenBucket:
+    """Classic token bucket; debt (a negative level) is allowed so usage can be reconciled"""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float, scale: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.refill_per_second * scale)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float, scale: float) -> float:
+        self._refill(now, scale)
+        # A single request larger than the whole bucket waits for a full bucket instead of forever
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / (self.refill_per_second * scale)
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+    def give(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+
+class ModelRateLimiter:
+    """Requests-per-minute and tokens-per-minute limiter with adaptive backoff
+
+    The limiter runs below its configured rates after a 429/529 (halving the rate each
+    time, down to min_scale) and creeps back up on every success. A retry-after
+    hint pauses every caller in the process, not just the one that was throttled.
+    """
+
+    def __init__(self,
+                 requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None,
+                 min_scale: float = 0.1,
+                 recovery_step: float = 0.05):
+        rpm = requests_per_minute or float(os.getenv('MODEL_RPM', '50'))
+        tpm = tokens_per_minute or float(os.getenv('MODEL_TPM', '80000'))
+        self.requests = TokenBucket(rpm, rpm / 60.0)
+        self.tokens = TokenBucket(tpm, tpm / 60.0)
+        self.min_scale = min_scale
+        self.recovery_step = recovery_step
+        self.scale = 1.0
+        self.paused_until = 0.0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, estimated_tokens: int) -> float:
+        """Block until the request fits both buckets; returns the seconds spent waiting"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = max(
+                    self.paused_until - now,
+                    self.requests.wait_time(1, now, self.scale),
+                    self.tokens.wait_time(estimated_tokens, now, self.scale)
+                )
+                if wait <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(estimated_tokens)
+                    return waited
+            time.sleep(wait)
+            waited += wait
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Correct the token bucket once the real usage is known"""
+        with self._lock:
+            self.tokens.take(actual_tokens - estimated_tokens)
+
+    def release(self, estimated_tokens: int) -> None:
+        """Hand back a reservation whose request was never sent"""
+        with self._lock:
+            self.requests.give(1)
+            self.tokens.give(estimated_tokens)
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.scale = min(1.0, self.scale + self.recovery_step)
+
+    def on_throttled(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Slow down after a 429/529 and return how long this caller should wait"""
+        delay = retry_after if retry_after is not None else backoff_delay(attempt)
+        with self._lock:
+            self.throttled += 1
+            self.scale = max(self.min_scale, self.scale / 2)
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        logger.warning(f"Model API throttled; backing off {delay:.1f}s (rate at {self.scale:.0%})")
+        return delay
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                'rate_scale': self.scale,
+                'throttled': self.throttled,
+                'request_budget': self.requests.level,
+                'token_budget': self.tokens.level
+            }
+
+
+_limiter: Optional[ModelRateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> ModelRateLimiter:
+    """Process-wide limiter shared by every model call"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = ModelRateLimiter()
+        return _limiter
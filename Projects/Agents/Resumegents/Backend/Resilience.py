@@ -0,0 +1,255 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Optional
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the model while the upstream is considered unhealthy"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LatencyTracker:
+    """Rolling window of recent call latencies"""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """The p-th percentile (0-100) of the window, or None if it is empty"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(p / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+
+class Hedger:
+    """Send a second identical call when the first is slower than recent calls usually are
+
+    A call that has not finished after the configured percentile of recent
+    latency (tracked separately per prompt type) gets a backup; whichever
+    answers first wins. The losing call cannot be cancelled mid-request and
+    runs to completion in the background. Hedging is off unless a percentile
+    is configured (MODEL_HEDGE_PERCENTILE, e.g. 95).
+    """
+
+    def __init__(self,
+                 percentile: Optional[float] = None,
+                 min_delay: Optional[float] = None,
+                 min_samples: int = 20,
+                 max_workers: Optional[int] = None):
+        self.percentile = percentile if percentile is not None else float(os.getenv('MODEL_HEDGE_PERCENTILE', '0'))
+        self.min_delay = min_delay if min_delay is not None else float(os.getenv('MODEL_HEDGE_MIN_DELAY', '1'))
+        self.min_samples = min_samples
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.getenv('MODEL_HEDGE_WORKERS', '32')),
+            thread_name_prefix='model-hedge'
+        )
+        self._trackers: Dict[str, LatencyTracker] = {}
+        self._lock = threading.Lock()
+        self.counts = {'calls': 0, 'hedged': 0, 'hedge_wins': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return 0 < self.percentile < 100
+
+    def tracker(self, key: str) -> LatencyTracker:
+        with self._lock:
+            if key not in self._trackers:
+                self._trackers[key] = LatencyTracker()
+            return self._trackers[key]
+
+    def delay(self, key: str) -> Optional[float]:
+        """Seconds to wait before hedging a call of this kind, or None to not hedge"""
+        tracker = self.tracker(key)
+        if not self.enabled or len(tracker) < self.min_samples:
+            return None
+        return max(self.min_delay, tracker.percentile(self.percentile))
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def call(self,
+             key: str,
+             fn: Callable[[], Any],
+             reserve: Optional[Callable[[], Any]] = None,
+             release: Optional[Callable[[], Any]] = None) -> Any:
+        """Run fn, hedging it if it is slow; latency of the answer is recorded under key
+
+        reserve runs before a backup is sent (outside its timing), e.g. to take a
+        rate limiter reservation for it; release hands that reservation back if the
+        first call answered while the backup was still waiting to be sent.
+        """
+        tracker = self.tracker(key)
+        answered = threading.Event()
+
+        def timed() -> Any:
+            started = time.monotonic()
+            result = fn()
+            tracker.record(time.monotonic() - started)
+            return result
+
+        def hedge() -> Any:
+            if reserve is not None:
+                reserve()
+            if answered.is_set():
+                if release is not None:
+                    release()
+                return None
+            return timed()
+
+        self._count('calls')
+        delay = self.delay(key)
+        if delay is None:
+            return timed()
+
+        primary = self.executor.submit(timed)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        self._count('hedged')
+        logger.info(f"{key} call slower than {delay:.1f}s (p{self.percentile:g}); sending a hedge request")
+        backup = self.executor.submit(hedge)
+        pending = {primary, backup}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    answered.set()
+                    if future is backup:
+                        self._count('hedge_wins')
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            trackers = dict(self._trackers)
+            counts = dict(self.counts)
+        counts['latency'] = {
+            key: {'samples': len(tracker), 'p50': tracker.percentile(50), 'p99': tracker.percentile(99)}
+            for key, tracker in trackers.items()
+        }
+        return counts
+
+
+class CircuitBreaker:
+    """Fail fast while the upstream error rate is above a threshold
+
+    Closed: calls go through and outcomes are recorded in a rolling window.
+    Open: once the window holds at least min_calls and the error rate reaches
+    error_threshold, calls raise CircuitOpenError for reset_timeout seconds.
+    Half-open: after that, one trial call is let through at a time; its
+    outcome closes the circuit again or re-opens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self,
+                 error_threshold: Optional[float] = None,
+                 min_calls: Optional[int] = None,
+                 window: int = 50,
+                 reset_timeout: Optional[float] = None):
+        self.error_threshold = error_threshold or float(os.getenv('MODEL_BREAKER_ERROR_RATE', '0.5'))
+        self.min_calls = min_calls or int(os.getenv('MODEL_BREAKER_MIN_CALLS', '10'))
+        self.reset_timeout = reset_timeout or float(os.getenv('MODEL_BREAKER_RESET_TIMEOUT', '30'))
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def error_rate(self) -> float:
+        return self._outcomes.count(False) / len(self._outcomes) if self._outcomes else 0.0
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError if the call should not be made"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            remaining = self.opened_at + self.reset_timeout - now
+            if remaining <= 0:
+                # Let one trial call through; a trial that never reports back is replaced after another timeout
+                self.state = self.HALF_OPEN
+                self.opened_at = now
+                return
+            self.rejected += 1
+        raise CircuitOpenError(
+            f"Model API temporarily unavailable after repeated upstream errors; retry in {remaining:.0f}s",
+            remaining
+        )
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._outcomes.append(True)
+            if self.state != self.CLOSED:
+                logger.info("Model API circuit closed")
+                self.state = self.CLOSED
+                self._outcomes.clear()
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._outcomes.append(False)
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED
+                and len(self._outcomes) >= self.min_calls
+                and self.error_rate() >= self.error_threshold
+            ):
+                logger.warning(f"Model API circuit opened (error rate {self.error_rate():.0%})")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'state': self.state,
+                'error_rate': self.error_rate(),
+                'window': len(self._outcomes),
+                'rejected': self.rejected
+            }
+
+
+_hedger: Optional[Hedger] = None
+_breaker: Optional[CircuitBreaker] = None
+_singleton_lock = threading.Lock()
+
+
+def get_hedger() -> Hedger:
+    global _hedger
+    with _singleton_lock:
+        if _hedger is None:
+            _hedger = Hedger()
+        return _hedger
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """Process-wide breaker shared by every model call"""
+    global _breaker
+    with _singleton_lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker()
+        return _breaker
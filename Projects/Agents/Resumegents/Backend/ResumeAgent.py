@@ -1,67 +1,103 @@
 import logging
-import anthropic, base64, os, json, time
+import anthropic, base64, os, json
 from datetime import datetime
+from Caching import ParseCache
+from PromptRegistry import get_prompt_registry
+from ModelRequests import cached_system_prompt, create_message
+from Resilience import CircuitOpenError
+from SectionGenerator import GENERATION_MODE, SectionGenerator, route_guidance
+from BulletRewriter import BulletRewriter
+from LatexTemplates import render_resume
+from ModelClient import get_model_client
+from PdfText import EXTRACTOR_VERSION, PDF_TEXT_MODE, build_parse_content
+from JobKeywords import get_job_index, job_context, resume_context
+from Telemetry import timed
+from ResumeSchema import RESUME_TOOL, RESUME_TOOL_CHOICE, SCHEMA_VERSION, parse_resume_output, validate_resume
 
 class ResumeAgent:
-    def __init__(self):
-        # Configure Anthropic client
-        self.client = anthropic.Anthropic(api_key=os.getenv('ANTHROPIC_KEY_1'))
+    def __init__(self, parse_cache=None, client=None):
+        # Use the shared, pooled Anthropic client unless one is injected
+        self.client = client or get_model_client()
+
+        # Parsed resumes keyed by PDF bytes + parser prompt version
+        self.parse_cache = parse_cache or ParseCache()
+
+        # Templates are loaded once per process and reloaded only when edited
+        self.prompt_registry = get_prompt_registry()
+
+        # Per-section LaTeX fragments, cached across requests
+        self.section_generator = SectionGenerator(
+            lambda system_prompt, messages: self.call_model_with_retry(system_prompt, messages, prompt_type="resume_section")
+        )
+
+        # Template mode: the model only rewords bullets and the layout is rendered locally
+        self.bullet_rewriter = BulletRewriter(
+            lambda system_prompt, messages: self.call_model_with_retry(system_prompt, messages, prompt_type="bullet_rewrite")
+        )
     
-    def call_model(self, system_prompt, messages, model_name = "claude-3-5-sonnet-20241022"):
-        response = self.client.messages.create(
+    def call_model(self, system_prompt, messages, model_name = "claude-3-5-sonnet-20241022", prompt_type = "default"):
+        response = create_message(
+            self.client,
+            prompt_type,
             model=model_name,
             max_tokens=4096,
             system=system_prompt,
             messages=messages
         )
-        return response.content[0].text
+        return response.content[0].text if response.content else ''
+
+    def call_model_structured(self, system_prompt, messages, model_name = "claude-3-5-sonnet-20241022", prompt_type = "resume_parser"):
+        """Call the model with the resume tool forced; returns the whole response for ResumeSchema to read"""
+        return create_message(
+            self.client,
+            prompt_type,
+            model=model_name,
+            max_tokens=8192,
+            system=system_prompt,
+            messages=messages,
+            tools=[RESUME_TOOL],
+            tool_choice=RESUME_TOOL_CHOICE
+        )
     
-    def call_model_with_retry(self, system_prompt, messages, max_retries = 3):
-        """Call the model with retry logic and better error handling"""
-        attempts = 0
-        while attempts < max_retries:
-            try:
-                response = self.call_model(system_prompt, messages)
-                if response and response.strip():
-                    return response.strip()
-                raise Exception("Empty response received from the model")
-            except Exception as e:
-                attempts += 1
-                if attempts == max_retries:
-                    raise Exception(f"Failed to generate response after {max_retries} attempts")
-                print(f"Error: {str(e)}. Retrying...")
-                time.sleep(1 * attempts) # Exponential backoff
-        raise Exception("Failed to generate response after multiple attempts")
+    def call_model_with_retry(self, system_prompt, messages, max_retries = 3, prompt_type = "default"):
+        """Call the model, asking again if it comes back empty
+
+        API errors are already retried with backoff (through the shared rate limiter)
+        in ModelRequests, so they are raised straight to the caller here.
+        """
+        for attempt in range(1, max_retries + 1):
+            response = self.call_model(system_prompt, messages, prompt_type=prompt_type)
+            if response and response.strip():
+                return response.strip()
+            logging.warning(f"Empty {prompt_type} response from the model (attempt {attempt} of {max_retries})")
+        raise Exception(f"Empty response from the model after {max_retries} attempts")
     
     def validate_resume(self, resume_json):
-        """Validate the resume data"""
-        required_fields = ['name', 'email', 'phone', 'education', 'experience', 'skills']
-        for field in required_fields:
-            if field not in resume_json:
-                raise ValueError(f"Field {field} is required")
+        """Validate the resume data against the parser schema"""
+        validate_resume(resume_json)
 
     def parse_resume_with_claude(self, pdf_base64):
-        """Use Claude to extract structured information from resume"""
+        """Use Claude to extract structured information from a base64-encoded resume"""
+        return self.parse_resume_bytes(base64.b64decode(pdf_base64), pdf_base64)
+
+    @timed('parse_resume')
+    def parse_resume_bytes(self, pdf_bytes, pdf_base64=None):
+        """Use Claude to extract structured information from resume PDF bytes"""
         
-        # Load the Prompt to use from the appropriate file
-        with open('PROMPTS/ResumeParser.md', 'r') as file:
-            system_prompt = file.read()
+        # Load the Prompt to use from the registry
+        parser_template = self.prompt_registry.get('ResumeParser')
+        system_prompt = cached_system_prompt(parser_template.text)
 
-        # Prepare the user prompt content
-        user_prompt_content = [
-            {
-                "type": "document",
-                "source": {
-                    "type": "base64",
-                    "media_type": "application/pdf",
-                    "data": pdf_base64
-                }
-            },
-            {
-                "type": "text",
-                "text": "Extract the structured information from this resume and return it as JSON following the exact format specified:"
-            }
-        ]
+        # Identical PDFs parsed with the same prompt and input mode always produce the same data
+        input_version = EXTRACTOR_VERSION if PDF_TEXT_MODE != 'off' else 'document'
+        cache_key = ParseCache.make_key(pdf_bytes, f"{parser_template.version_id}:{input_version}:{SCHEMA_VERSION}")
+        cached_resume = self.parse_cache.get(cache_key)
+        if cached_resume is not None:
+            logging.info(f"Parse cache hit for {cache_key[:12]} ({parser_template.version_id})")
+            return cached_resume
+
+        # Text-based PDFs go as extracted text; scanned ones as the PDF document itself
+        user_prompt_content, _ = build_parse_content(pdf_bytes, pdf_base64)
 
         user_prompt_content = [
             {
@@ -70,9 +106,13 @@ class ResumeAgent:
             }
         ]
         
-        # Call the model
+        # Call the model; malformed output is repaired locally before costing another call
         try:
-            return self.call_model_with_retry(system_prompt, user_prompt_content)
+            parsed_resume = parse_resume_output(lambda: self.call_model_structured(system_prompt, user_prompt_content))
+            self.parse_cache.put(cache_key, parsed_resume)
+            return parsed_resume
+        except CircuitOpenError:
+            raise
         except Exception as e:
             return {
                 'status': 'error',
@@ -93,14 +133,15 @@ class ResumeAgent:
     def _build_prompt(self, original_resume_json, current_editted_resume_json, job_description, instructions_or_feedback):
         """Create a structured prompt with proper error handling and consistent formatting"""
         
+        # Keyword summary of the posting and only the best-matching bullets and skills, unless JOB_CONTEXT_MODE=full
         sections = [
-            ("Job Description", job_description),
-            ("Original Resume", json.dumps(original_resume_json, indent=2))
+            ("Job Description", job_context(job_description)),
+            ("Original Resume", resume_context(self._as_resume_dict(original_resume_json) or original_resume_json, job_description))
         ]
 
         # Add the current editted resume if it exists
         if current_editted_resume_json:
-            sections.append(("Current Editted Resume", json.dumps(current_editted_resume_json, indent=2)))
+            sections.append(("Current Editted Resume", resume_context(self._as_resume_dict(current_editted_resume_json) or current_editted_resume_json, job_description)))
 
         # Add the instructions or feedback if it exists
         if instructions_or_feedback:
@@ -114,20 +155,19 @@ class ResumeAgent:
 
         return prompt
     
-    def _load_prompt_template(self, template_path='PROMPTS/ComplexResumeCreator.md'):
+    def _load_prompt_template(self, template_name='ComplexResumeCreator'):
         """
-        Safely loads the prompt template with fallback options
+        Looks up the prompt template in the shared registry with fallback options
         """
         try:
-            with open(template_path, 'r') as file:
-                return file.read().strip()
-        except FileNotFoundError:
-            logging.error(f"Prompt template not found at {template_path}")
-            return None
-        except Exception as e:
-            logging.error(f"Error reading prompt template: {str(e)}")
+            template = self.prompt_registry.get(template_name)
+        except KeyError:
+            logging.error(f"Prompt template {template_name} not found in {self.prompt_registry.directory}")
             return None
+        logging.debug(f"Using prompt template {template.version_id}")
+        return template.text.strip()
     
+    @timed('save_resume')
     def save_resume(self, latex_code, is_backup = False):
         """Save the resume with proper error handling and backup functionality"""
 
@@ -154,7 +194,8 @@ class ResumeAgent:
                 raise Exception(f"Error saving LaTeX file: {str(e)}. Backup resume saved as {backup_filepath}")
             raise Exception(f"Error saving LaTeX file: {str(e)}")
     
-    def generate_tailored_latex(self, original_resume_json, current_editted_resume_json, job_description, instructions_or_feedback):
+    @timed('generate_latex')
+    def generate_tailored_latex(self, original_resume_json, current_editted_resume_json, job_description, instructions_or_feedback, save = True, theme = None):
         """
         Creates LaTeX code for a professionally formatted resume tailored to the job description.
         
@@ -163,6 +204,8 @@ class ResumeAgent:
             current_editted_resume_json (dict): Current editted resume data in JSON format
             job_description (str): Target job description
             instructions_or_feedback (str): Instructions or feedback to the agent about the resume
+            save (bool): Write the LaTeX to the resumes directory; callers that store it themselves pass False
+            theme (str): LatexTemplates theme for the template and sections modes (default LATEX_THEME)
         
         Returns:
             dict: Status and LaTeX code or error message
@@ -175,23 +218,71 @@ class ResumeAgent:
                 'message': f'Invalid resume data: {str(e)}'
             }
 
+        # Template mode renders the layout locally; section mode regenerates only the
+        # fragments whose inputs changed since the last call
+        resume = self._as_resume_dict(current_editted_resume_json or original_resume_json)
+        # Keyword weights and per-bullet/per-skill scores are returned alongside the LaTeX
+        relevance = get_job_index(job_description).relevance(resume) if resume is not None else None
+        if GENERATION_MODE in ('template', 'sections') and resume is not None:
+            try:
+                guidance = route_guidance(instructions_or_feedback, resume)
+                if GENERATION_MODE == 'template':
+                    tailored, _ = self.bullet_rewriter.rewrite(resume, job_description, guidance)
+                    latex_code = render_resume(tailored, theme)
+                else:
+                    latex_code, _ = self.section_generator.generate(resume, job_description, guidance, theme)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                return {
+                    'status': 'error',
+                    'message': f'Error generating LaTeX: {str(e)}'
+                }
+            return self._finish_latex(latex_code, save, relevance)
+
         # Create prompt
         prompt = self._build_prompt(original_resume_json, current_editted_resume_json, job_description, instructions_or_feedback)
         
         complex_resumer_creator = self._load_prompt_template()
-        complex_resumer_creator += prompt
         try:
-            system_prompt = self._get_system_prompt()['content']
-            messages = [{"role": "user", "content": complex_resumer_creator}]
+            # Static instructions form a cacheable prefix; the per-request data follows it
+            system_prompt = cached_system_prompt(self._get_system_prompt()['content'], complex_resumer_creator)
+            messages = [{"role": "user", "content": prompt}]
 
             try:
-                response = self.call_model_with_retry(system_prompt, messages)
+                response = self.call_model_with_retry(system_prompt, messages, prompt_type="resume_creator")
+            except CircuitOpenError:
+                raise
             except Exception as e:
                 return {
                     'status': 'error',
                     'message': f'Error generating LaTeX: {str(e)}'
                 }
 
+            return self._finish_latex(response, save, relevance)
+            
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            return {
+                'status': 'error',
+                'message': f'Error generating LaTeX: {str(e)}'
+            }
+
+    @staticmethod
+    def _as_resume_dict(resume_json):
+        """Parsed resume as a dict, or None if it is not structured JSON"""
+        if isinstance(resume_json, dict):
+            return resume_json
+        try:
+            resume = json.loads(resume_json)
+        except (TypeError, ValueError):
+            return None
+        return resume if isinstance(resume, dict) else None
+
+    def _finish_latex(self, response, save, relevance = None):
+        """Validate the generated LaTeX and save it unless the caller stores it itself"""
+        try:
             latex_code = response[response.find('\\documentclass'):]
             latex_code = latex_code.strip()
             
@@ -203,9 +294,17 @@ class ResumeAgent:
                     'message': 'Generated LaTeX code appears to be invalid'
                 }
             
-            # Save to file
-            saved_result = self.save_resume(latex_code)
-            
+            if not save:
+                saved_result = {
+                    'status': 'success',
+                    'latex_code': latex_code
+                }
+            else:
+                # Save to file
+                saved_result = self.save_resume(latex_code)
+
+            if relevance is not None:
+                saved_result['relevance'] = relevance
             return saved_result
             
         except Exception as e:
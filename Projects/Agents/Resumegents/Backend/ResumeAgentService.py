@@ -1,12 +1,27 @@
-from fastapi import FastAPI, HTTPException, Depends, Header, Response
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uuid
 import jwt
 from datetime import datetime, timedelta
-from typing import Dict, Optional
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextlib
+import functools
 import json
+import logging
+import os
+import time
+from contextvars import copy_context
 from MultiturnResumeAgent import MultiturnResumeAgent
+from LatexTemplates import THEMES
+from ResumeSchema import get_parse_metrics
+from Telemetry import CONTENT_TYPE, observe_request, register_queue_depth, render_metrics, span
+from ResumeUpload import UploadError, check_content_length, receive_pdf_async
+from SessionStore import SessionConflictError, SessionStore, SessionSweeper, create_session_store
+from ModelClient import get_model_client_manager
 from contextlib import asynccontextmanager
 
 app = FastAPI()
@@ -23,8 +38,149 @@ app.add_middleware(
 SECRET_KEY = "your-secret-key"
 ALGORITHM = "HS256"
 
-# Store for active sessions
-sessions: Dict[str, MultiturnResumeAgent] = {}
+# Store for active sessions (in-process, or SQLite shared across workers; see SESSION_STORE)
+session_store: SessionStore = create_session_store()
+
+# Blocking agent calls run on a bounded pool so the event loop stays free
+MODEL_WORKERS = int(os.getenv("RESUME_MODEL_WORKERS", "32"))
+model_executor = ThreadPoolExecutor(max_workers=MODEL_WORKERS, thread_name_prefix="resume-agent")
+
+# Per-endpoint concurrency limits (requests beyond the limit wait their turn)
+ENDPOINT_LIMITS = {
+    "resume": int(os.getenv("RESUME_LIMIT_PARSE", "4")),
+    "chat": int(os.getenv("RESUME_LIMIT_CHAT", "16")),
+    "generate-latex": int(os.getenv("RESUME_LIMIT_GENERATE", "8")),
+}
+endpoint_semaphores: Dict[str, asyncio.Semaphore] = {
+    name: asyncio.Semaphore(limit) for name, limit in ENDPOINT_LIMITS.items()
+}
+
+# Calls queued behind each endpoint limit (or their session's lock), reported on /metrics
+endpoint_waiting: Dict[str, int] = {name: 0 for name in ENDPOINT_LIMITS}
+for _name in ENDPOINT_LIMITS:
+    register_queue_depth(f"endpoint_{_name}", functools.partial(endpoint_waiting.get, _name))
+
+# One in-flight agent call per session; agents are not safe for concurrent mutation
+session_locks: Dict[str, asyncio.Lock] = {}
+
+def load_agent(session_id: str) -> MultiturnResumeAgent:
+    agent = session_store.get(session_id)
+    if agent is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return agent
+
+def validate_theme(theme: Optional[str]) -> Optional[str]:
+    if theme and theme not in THEMES:
+        raise HTTPException(status_code=400, detail=f"Unknown theme '{theme}'; choose one of {sorted(THEMES)}")
+    return theme
+
+def save_agent(session_id: str, agent: MultiturnResumeAgent, loop: asyncio.AbstractEventLoop) -> None:
+    """Write the agent back, and again once a background insight refresh it started has finished
+
+    Another worker process saving the session first makes this request fail with a 409;
+    the client retries against the stored session.
+    """
+    refresh = agent.insights_refresh
+    pending = refresh is not None and not refresh.done()
+    try:
+        session_store.save(session_id, agent)
+    except SessionConflictError:
+        raise HTTPException(status_code=409, detail="Session was changed by a concurrent request; please retry")
+    if pending:
+        refresh.add_done_callback(
+            lambda _: asyncio.run_coroutine_threadsafe(save_refreshed_insights(session_id, agent), loop)
+        )
+
+async def save_refreshed_insights(session_id: str, agent: MultiturnResumeAgent) -> None:
+    """Save insights merged after the request that started the refresh had already saved the agent"""
+    async with session_locks.setdefault(session_id, asyncio.Lock()):
+        loop = asyncio.get_running_loop()
+        try:
+            # Skip sessions removed meanwhile, or changed since by another worker process
+            if await loop.run_in_executor(model_executor, session_store.get, session_id) is agent:
+                await loop.run_in_executor(model_executor, session_store.save, session_id, agent)
+        except SessionConflictError:
+            # Another worker saved the session first; its own analysis covers these turns
+            logging.info(f"Refreshed insights for session {session_id} superseded by a newer save")
+        except Exception as e:
+            logging.error(f"Saving refreshed insights for session {session_id} failed: {str(e)}")
+
+def call_agent(session_id: str, action: Callable[[MultiturnResumeAgent], Any], save: bool, loop: asyncio.AbstractEventLoop) -> Any:
+    """Load the session's agent, apply the action and write the agent back"""
+    agent = load_agent(session_id)
+    try:
+        return action(agent)
+    finally:
+        if save:
+            save_agent(session_id, agent, loop)
+
+@contextlib.asynccontextmanager
+async def admitted(endpoint: Optional[str], session_id: str):
+    """Hold the session lock and the endpoint's slot, counting the wait in endpoint_waiting"""
+    lock = session_locks.setdefault(session_id, asyncio.Lock())
+    semaphore = endpoint_semaphores[endpoint] if endpoint else contextlib.nullcontext()
+    waiting = endpoint is not None
+    if waiting:
+        endpoint_waiting[endpoint] += 1
+    try:
+        async with lock, semaphore:
+            if waiting:
+                endpoint_waiting[endpoint] -= 1
+                waiting = False
+            yield
+    finally:
+        if waiting:
+            endpoint_waiting[endpoint] -= 1
+
+async def run_agent_call(endpoint: Optional[str], session_id: str, action: Callable[[MultiturnResumeAgent], Any], save: bool = True):
+    """Run a blocking agent action on the model pool under the endpoint and session limits"""
+    async with admitted(endpoint, session_id):
+        loop = asyncio.get_running_loop()
+        # Carry the request's trace context onto the worker thread
+        return await loop.run_in_executor(model_executor, functools.partial(copy_context().run, call_agent, session_id, action, save, loop))
+
+_STREAM_END = object()
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Event frame"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def stream_agent_events(endpoint: str, session_id: str, start: Callable[[MultiturnResumeAgent], Iterator[Tuple[str, Any]]]) -> AsyncIterator[str]:
+    """Drive a blocking agent event generator on the model pool and forward it as SSE"""
+    # Flush a first frame straight away so clients see bytes before the model starts
+    yield sse_event("open", {"session_id": session_id})
+
+    events: Iterator[Tuple[str, Any]] = iter(())
+    context = copy_context()
+    try:
+        async with admitted(endpoint, session_id):
+            loop = asyncio.get_running_loop()
+            agent = await loop.run_in_executor(model_executor, load_agent, session_id)
+            events = start(agent)
+            while True:
+                item = await loop.run_in_executor(model_executor, context.run, next, events, _STREAM_END)
+                if item is _STREAM_END:
+                    break
+                event, data = item
+                yield sse_event(event, data)
+            await loop.run_in_executor(model_executor, save_agent, session_id, agent, loop)
+    except HTTPException as e:
+        yield sse_event("error", {"status": "error", "message": e.detail})
+    except Exception as e:
+        yield sse_event("error", {"status": "error", "message": str(e)})
+    finally:
+        try:
+            events.close()
+        except ValueError:
+            # Generator is still running on a worker thread after a client disconnect
+            pass
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # Pydantic models for request/response
 class SessionResponse(BaseModel):
@@ -43,15 +199,33 @@ class JobDescriptionRequest(BaseModel):
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Handle startup and shutdown events"""
-    # Startup: cleanup old sessions
-    await cleanup_old_sessions()
+    # Startup: expire and evict sessions in the background for the life of the worker
+    sweeper_task = asyncio.create_task(sweep_sessions_periodically())
     yield
-    # Shutdown: cleanup old sessions again
-    await cleanup_old_sessions()
+    # Shutdown: stop the sweeper and the model pool
+    sweeper_task.cancel()
+    model_executor.shutdown(wait=False, cancel_futures=True)
+    get_model_client_manager().close()
 
 # Update FastAPI initialization
 app = FastAPI(lifespan=lifespan)
 
+@app.middleware("http")
+async def record_request_telemetry(request: Request, call_next):
+    """Time every request by route template and trace it as the root span of its work"""
+    started = time.perf_counter()
+    status, endpoint = 500, "unmatched"
+    try:
+        with span("http_request", app="fastapi", method=request.method, path=request.url.path) as current:
+            response = await call_next(request)
+            status = response.status_code
+            # The router records the matched route in the shared scope
+            endpoint = getattr(request.scope.get("route"), "path", endpoint)
+            current.set(endpoint=endpoint, status=status)
+            return response
+    finally:
+        observe_request("fastapi", request.method, endpoint, status, time.perf_counter() - started)
+
 def create_session_token(session_id: str) -> str:
     """Create JWT token for session"""
     expiration = datetime.utcnow() + timedelta(hours=24)
@@ -61,13 +235,14 @@ def create_session_token(session_id: str) -> str:
         algorithm=ALGORITHM
     )
 
-async def get_session_id(authorization: str = Header(...)) -> str:
+# Plain def so FastAPI runs it on its threadpool: the session lookup may hit disk
+def get_session_id(authorization: str = Header(...)) -> str:
     """Validate JWT and return session_id"""
     try:
         token = authorization.replace("Bearer ", "")
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         session_id = payload.get("session_id")
-        if session_id not in sessions:
+        if not session_store.exists(session_id):
             raise HTTPException(status_code=404, detail="Session not found")
         return session_id
     except jwt.ExpiredSignatureError:
@@ -76,10 +251,10 @@ async def get_session_id(authorization: str = Header(...)) -> str:
         raise HTTPException(status_code=401, detail="Invalid token")
     
 @app.post("/sessions", response_model=SessionResponse)
-async def create_session():
+def create_session():
     """Create new resume improvement session"""
     session_id = str(uuid.uuid4())
-    sessions[session_id] = MultiturnResumeAgent()
+    session_store.create(session_id, MultiturnResumeAgent())
     token = create_session_token(session_id)
     return SessionResponse(session_id=session_id, token=token)
 
@@ -89,21 +264,48 @@ async def upload_resume(
     session_id: str = Depends(get_session_id)
 ):
     """Upload and parse resume"""
-    agent = sessions[session_id]
     try:
-        parsed_resume = agent.parse_resume_pdf(request.resume_base64)
+        parsed_resume = await run_agent_call("resume", session_id, lambda agent: agent.parse_resume_pdf(request.resume_base64))
         return {"status": "success", "resume_data": parsed_resume}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/resume/upload")
+async def upload_resume_file(
+    request: Request,
+    session_id: str = Depends(get_session_id)
+):
+    """Upload a resume as multipart/form-data (file field 'resume') and parse it
+
+    The body is streamed into a spooled temporary file, so memory stays flat while
+    the upload arrives; oversized or non-PDF uploads are rejected as they stream.
+    """
+    try:
+        content_length = request.headers.get("content-length")
+        check_content_length(int(content_length) if content_length and content_length.isdigit() else None)
+        receiver = await receive_pdf_async(request.headers.get("content-type", ""), request.stream())
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    # The PDF is read back and handed over as bytes on the model pool, off the event loop
+    with receiver.upload as upload:
+        try:
+            parsed_resume = await run_agent_call("resume", session_id, lambda agent: agent.parse_resume_pdf_bytes(upload.read_bytes()))
+            return {"status": "success", "resume_data": parsed_resume, "size": upload.size}
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
 @app.post("/job-description")
 async def set_job_description(
     request: JobDescriptionRequest,
     session_id: str = Depends(get_session_id)
 ):
     """Set job description for session"""
-    agent = sessions[session_id]
-    agent.job_description = request.job_description
+    await run_agent_call(None, session_id, lambda agent: setattr(agent, "job_description", request.job_description))
     return {"status": "success"}
 
 @app.post("/chat")
@@ -112,51 +314,100 @@ async def chat(
     session_id: str = Depends(get_session_id)
 ):
     """Chat with the resume agent"""
-    agent = sessions[session_id]
     try:
-        response = agent.chat(request.message)
+        response = await run_agent_call("chat", session_id, lambda agent: agent.chat(request.message))
         return {"status": "success", "response": response}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/generate-latex")
 async def generate_latex(
+    theme: Optional[str] = None,
     session_id: str = Depends(get_session_id)
 ):
-    """Generate tailored LaTeX resume"""
-    agent = sessions[session_id]
+    """Generate tailored LaTeX resume, optionally in a given LatexTemplates theme"""
+    validate_theme(theme)
     try:
-        result = agent.generate_tailored_latex()
+        result = await run_agent_call("generate-latex", session_id, lambda agent: agent.generate_tailored_latex(theme=theme))
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    session_id: str = Depends(get_session_id)
+):
+    """Chat with the resume agent, streaming tokens over SSE"""
+    return sse_response(stream_agent_events("chat", session_id, lambda agent: agent.chat_stream(request.message)))
+
+@app.post("/generate-latex/stream")
+async def generate_latex_stream(
+    theme: Optional[str] = None,
+    session_id: str = Depends(get_session_id)
+):
+    """Generate tailored LaTeX resume, streaming tokens over SSE"""
+    validate_theme(theme)
+    return sse_response(stream_agent_events("generate-latex", session_id, lambda agent: agent.generate_tailored_latex_stream(theme=theme)))
+
 @app.get("/conversation-history")
 async def get_history(
     session_id: str = Depends(get_session_id)
 ):
     """Get conversation history for session"""
-    agent = sessions[session_id]
+    agent = await run_agent_call(None, session_id, lambda agent: agent, save=False)
     return {
         "history": agent.conversation_history,
         "current_version": agent.current_resume.version_number if agent.current_resume else None
     }
 
 # Session cleanup
-async def cleanup_old_sessions():
-    """Remove expired sessions"""
-    now = datetime.utcnow()
-    expired = []
-    for session_id in sessions:
+SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+session_sweeper = SessionSweeper(session_store)
+
+def forget_session_lock(session_id: str) -> None:
+    """Drop a removed session's lock, unless a request is still holding it"""
+    lock = session_locks.get(session_id)
+    if lock is not None and not lock.locked():
+        del session_locks[session_id]
+
+async def sweep_sessions_periodically():
+    """Expire idle sessions and evict least-recently-used ones beyond the count/memory limits"""
+    loop = asyncio.get_running_loop()
+    # The sweep runs on the model pool, but session_locks belong to the event loop
+    session_sweeper.on_remove = lambda session_id: loop.call_soon_threadsafe(forget_session_lock, session_id)
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
         try:
-            # Check if token is expired
-            token = create_session_token(session_id)
-            jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        except jwt.ExpiredSignatureError:
-            expired.append(session_id)
-    
-    for session_id in expired:
-        del sessions[session_id]
+            await loop.run_in_executor(model_executor, session_sweeper.sweep)
+        except Exception as e:
+            logging.error(f"Session sweep failed: {str(e)}")
+
+@app.get("/sessions/stats")
+async def session_stats():
+    """Report session eviction totals and the sweeper's limits"""
+    return {
+        "resident_sessions": len(session_store.resident()),
+        "persistent_store": session_store.persistent,
+        "idle_ttl_seconds": session_sweeper.idle_ttl,
+        "max_sessions": session_sweeper.max_sessions,
+        "max_memory_bytes": session_sweeper.max_bytes,
+        **session_sweeper.totals
+    }
+
+@app.get("/parse-stats")
+async def parse_stats():
+    """How often resume parses needed local repair or a second model call"""
+    return get_parse_metrics().stats()
+
+@app.get("/metrics")
+async def metrics():
+    """Stage, endpoint and model latency histograms, token counters and queue depths for Prometheus"""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
 
 import uvicorn
 
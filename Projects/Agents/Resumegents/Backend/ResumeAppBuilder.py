@@ -1,11 +1,20 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, g, request, jsonify, send_file, stream_with_context, url_for
 import anthropic
 import os
 from ResumeAgent import ResumeAgent
+from Caching import content_hash
+from JobQueue import CANCELLED, FAILED, JobQueue, JobQueueFull
+from LatexCompiler import LatexCompileService, CompileQueueFull
+from LatexTemplates import THEMES
+from RateLimiter import get_rate_limiter
+from Resilience import CircuitOpenError, get_circuit_breaker, get_hedger
+from ResumeSchema import get_parse_metrics
+from Telemetry import CONTENT_TYPE, end_span, observe_request, register_queue_depth, render_metrics, start_span, timed
+from ResumeUpload import UploadError, check_content_length, iter_stream, max_json_request_bytes, receive_pdf
 from flask_cors import CORS
+import json
 import logging
-import subprocess
-import tempfile
+import time
 from io import BytesIO
 
 app = Flask(__name__)
@@ -17,63 +26,140 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
+# Bodies over the limit get a 413 before they are read
+app.config['MAX_CONTENT_LENGTH'] = max_json_request_bytes()
+
 resumeAgent = ResumeAgent()
 
+# Bounded pdflatex worker pool shared by every request thread
+compile_service = LatexCompileService()
+
+# Long-running tailoring and compile work submitted through /jobs runs here, off the request threads
+job_queue = JobQueue()
+
+# Idle /jobs/<id>/events streams get a comment frame this often
+JOB_EVENTS_HEARTBEAT_SECONDS = 15
+
+register_queue_depth('latex_compile', lambda: compile_service.queue_depth)
+register_queue_depth('jobs', lambda: job_queue.stats()['queued'])
+
+@app.before_request
+def start_request_telemetry():
+    g.request_started = time.perf_counter()
+    g.request_span = start_span('http_request', app='flask', method=request.method, path=request.path)
+
+@app.after_request
+def record_request_telemetry(response):
+    # Route templates rather than paths keep job IDs out of the metric labels
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    observe_request('flask', request.method, endpoint, response.status_code, time.perf_counter() - g.request_started)
+    g.request_span[0].set(endpoint=endpoint, status=response.status_code)
+    return response
+
+@app.teardown_request
+def end_request_telemetry(error=None):
+    if 'request_span' in g:
+        end_span(*g.pop('request_span'), error=error)
+
+def sse_event(event, data):
+    """Format one Server-Sent Event frame"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@timed('latex_to_pdf')
 def latex_to_pdf(latex_code):
-    """Convert LaTeX code to PDF using pdflatex"""
-    with tempfile.TemporaryDirectory() as tmpdir:
-        # Create temporary tex file
-        tex_path = os.path.join(tmpdir, 'resume.tex')
-        with open(tex_path, 'w') as f:
-            f.write(latex_code)
-        
-        # Run pdflatex twice to resolve references
-        for _ in range(2):
-            process = subprocess.Popen(
-                ['pdflatex', '-interaction=nonstopmode', tex_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                cwd=tmpdir
-            )
-            process.communicate()
-        
-        # Read the generated PDF
-        pdf_path = os.path.join(tmpdir, 'resume.pdf')
-        if os.path.exists(pdf_path):
-            with open(pdf_path, 'rb') as f:
-                return f.read()
-        else:
-            raise Exception("PDF generation failed")
+    """Convert LaTeX code to PDF using the pdflatex worker pool"""
+    return compile_service.compile(latex_code)
+
+def read_multipart_resume():
+    """Form fields and PDF bytes from a multipart upload, streamed through a spooled temp file"""
+    check_content_length(request.content_length)
+    receiver = receive_pdf(request.content_type, iter_stream(request.stream))
+    with receiver.upload as upload:
+        pdf_bytes = upload.read_bytes()
+    data = dict(receiver.fields)
+    if data.get('current_editted_resume_json'):
+        data['current_editted_resume_json'] = json.loads(data['current_editted_resume_json'])
+    return data, pdf_bytes
+
+def read_customize_request():
+    """(data, pdf_bytes, error_response) for a tailoring request sent as multipart or base64 JSON"""
+    pdf_bytes = None
+    if request.mimetype == 'multipart/form-data':
+        try:
+            data, pdf_bytes = read_multipart_resume()
+        except UploadError as ue:
+            return None, None, (jsonify({
+                'status': 'error',
+                'message': str(ue)
+            }), ue.status_code)
+        except ValueError as ve:
+            return None, None, (jsonify({
+                'status': 'error',
+                'message': f'Invalid current_editted_resume_json: {str(ve)}'
+            }), 400)
+    else:
+        data = request.get_json()
+
+    if not data or (pdf_bytes is None and 'resume_base64' not in data) or 'job_description' not in data:
+        return None, None, (jsonify({
+            'status': 'error',
+            'message': 'Missing resume (file or resume_base64) or job_description in request body'
+        }), 400)
+
+    theme = data.get('theme')
+    if theme and theme not in THEMES:
+        return None, None, (jsonify({
+            'status': 'error',
+            'message': f"Unknown theme '{theme}'; choose one of {sorted(THEMES)}"
+        }), 400)
+    return data, pdf_bytes, None
+
+def customize(data, pdf_bytes, job=None):
+    """Parse and tailor a resume; shared by the blocking endpoint and queued jobs"""
+    if job is not None:
+        job_queue.set_stage(job, 'parsing')
+    if pdf_bytes is not None:
+        parsed_data = resumeAgent.parse_resume_bytes(pdf_bytes)
+    else:
+        parsed_data = resumeAgent.parse_resume_with_claude(data['resume_base64'])
+    if job is not None:
+        if isinstance(parsed_data, dict) and parsed_data.get('status') == 'error':
+            raise Exception(parsed_data['message'])
+        job.raise_if_cancelled()
+        job_queue.set_stage(job, 'generating')
+    latex_result = resumeAgent.generate_tailored_latex(
+        parsed_data, 
+        data.get('current_editted_resume_json', {}),
+        data['job_description'],
+        data.get('instructions_or_feedback', ''),
+        theme=data.get('theme')
+    )
+    if job is not None and latex_result.get('status') == 'error':
+        raise Exception(latex_result['message'])
+    return {
+        'status': 'success',
+        'data': parsed_data,
+        'latex_code': latex_result.get('latex_code', latex_result),  # Handle both string and object responses
+        'relevance': latex_result.get('relevance')
+    }
 
 @app.route('/customize-resume', methods=['POST'])
 def customize_resume():
-    """Endpoint to receive base64 PDF and job description"""
+    """Endpoint to receive a PDF (multipart file field 'resume', or base64 JSON) and job description"""
     
     print("Request received as: ", request)
-    data = request.get_json()
-    print("The data is: ", data)
-
-    if not data or 'resume_base64' not in data or 'job_description' not in data:
-        return jsonify({
-            'status': 'error',
-            'message': 'Missing resume_base64 or job_description in request body'
-        }), 400
+    data, pdf_bytes, error_response = read_customize_request()
+    if error_response:
+        return error_response
 
     try:
-        parsed_data = resumeAgent.parse_resume_with_claude(data['resume_base64'])
-        latex_result = resumeAgent.generate_tailored_latex(
-            parsed_data, 
-            data.get('current_editted_resume_json', {}),
-            data['job_description'],
-            data.get('instructions_or_feedback', '')
-        )
-        
-        return jsonify({
-            'status': 'success',
-            'data': parsed_data,
-            'latex_code': latex_result.get('latex_code', latex_result)  # Handle both string and object responses
-        }), 200
+        return jsonify(customize(data, pdf_bytes)), 200
 
+    except CircuitOpenError as ce:
+        return jsonify({
+            'status': 'error',
+            'message': str(ce)
+        }), 503, {'Retry-After': str(int(ce.retry_after) + 1)}
     except anthropic.APIError as ae:
         return jsonify({
             'status': 'error',
@@ -85,6 +171,23 @@ def customize_resume():
             'message': f'Server error: {str(e)}'
         }), 500
     
+def pdf_response(pdf_bytes, etag):
+    """Serve compiled PDF bytes with their content-hash ETag"""
+    # Convert bytes to BytesIO object for send_file
+    pdf_blob = BytesIO(pdf_bytes)
+    pdf_blob.seek(0)
+    
+    # Return the PDF file
+    response = send_file(
+        pdf_blob,
+        mimetype='application/pdf',
+        as_attachment=False,
+        download_name='resume.pdf',
+        etag=etag
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/get-pdf', methods=['POST'])
 def get_pdf():
     """Endpoint to convert LaTeX code to PDF"""
@@ -98,26 +201,203 @@ def get_pdf():
         }), 400
         
     try:
+        # The same LaTeX compiles to the same bytes (on the same day, if it prints the date),
+        # so the compile cache key is a strong ETag
+        etag = compile_service.cache_key(data['latex_code'])
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+
         # Convert LaTeX to PDF using the provided function
-        pdf_bytes = latex_to_pdf(data['latex_code'])
-        
-        # Convert bytes to BytesIO object for send_file
-        pdf_blob = BytesIO(pdf_bytes)
-        pdf_blob.seek(0)
-        
-        # Return the PDF file
-        return send_file(
-            pdf_blob,
-            mimetype='application/pdf',
-            as_attachment=False,
-            download_name='resume.pdf'
-        )
+        return pdf_response(latex_to_pdf(data['latex_code']), etag)
         
+    except CompileQueueFull as e:
+        response = jsonify({
+            'status': 'error',
+            'message': f'PDF generation busy: {str(e)}'
+        })
+        response.headers['Retry-After'] = '5'
+        return response, 503
     except Exception as e:
         return jsonify({
             'status': 'error',
             'message': f'PDF generation error: {str(e)}'
         }), 500
+
+def job_accepted(job, created):
+    """202 response pointing the client at a queued (or already in-flight) job"""
+    response = jsonify({
+        'status': 'accepted',
+        'deduplicated': not created,
+        'job': job.to_dict(),
+        'status_url': url_for('job_status', job_id=job.id),
+        'result_url': url_for('job_result', job_id=job.id),
+        'events_url': url_for('job_events', job_id=job.id)
+    })
+    response.headers['Location'] = url_for('job_status', job_id=job.id)
+    return response, 202
+
+def submit_job(kind, function, key):
+    """Queue work at the ?priority= given (high, normal or low) and answer 202, or an error response"""
+    try:
+        job, created = job_queue.submit(kind, function, key=key, priority=request.args.get('priority', 'normal'))
+    except ValueError as ve:
+        return jsonify({
+            'status': 'error',
+            'message': str(ve)
+        }), 400
+    except JobQueueFull as e:
+        response = jsonify({
+            'status': 'error',
+            'message': str(e)
+        })
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    return job_accepted(job, created)
+
+@app.route('/jobs/customize-resume', methods=['POST'])
+def submit_customize_job():
+    """Queue a parse and tailor job; same body as /customize-resume, answers 202 with a job ID"""
+    data, pdf_bytes, error_response = read_customize_request()
+    if error_response:
+        return error_response
+
+    # Identical requests share one in-flight job
+    key = content_hash(
+        'customize',
+        pdf_bytes if pdf_bytes is not None else data['resume_base64'],
+        data['job_description'],
+        data.get('instructions_or_feedback', ''),
+        data.get('theme') or '',
+        json.dumps(data.get('current_editted_resume_json', {}), sort_keys=True)
+    )
+    return submit_job('customize-resume', lambda job: customize(data, pdf_bytes, job), key)
+
+@app.route('/jobs/get-pdf', methods=['POST'])
+def submit_pdf_job():
+    """Queue a LaTeX compile job; same body as /get-pdf, answers 202 with a job ID"""
+    data = request.get_json()
+    if not data or 'latex_code' not in data:
+        return jsonify({
+            'status': 'error',
+            'message': 'Missing latex_code in request body'
+        }), 400
+
+    latex_code = data['latex_code']
+    etag = compile_service.cache_key(latex_code)
+
+    def compile_pdf(job):
+        job_queue.set_stage(job, 'compiling')
+        return latex_to_pdf(latex_code)
+    return submit_job('get-pdf', compile_pdf, 'pdf:' + etag)
+
+def find_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return None, (jsonify({
+            'status': 'error',
+            'message': f'Unknown or expired job {job_id}'
+        }), 404)
+    return job, None
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Poll a job's status"""
+    job, error_response = find_job(job_id)
+    if error_response:
+        return error_response
+    return jsonify({'status': 'success', 'job': job.to_dict()}), 200
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued job, or stop a running one at its next stage"""
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return find_job(job_id)[1]
+    return jsonify({'status': 'success', 'job': job.to_dict()}), 200
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """A finished job's result: the /customize-resume JSON or the PDF; 202 while it is still pending"""
+    job, error_response = find_job(job_id)
+    if error_response:
+        return error_response
+    if not job.finished:
+        response = jsonify({'status': 'pending', 'job': job.to_dict()})
+        response.headers['Retry-After'] = '2'
+        return response, 202
+    if job.status == CANCELLED:
+        return jsonify({'status': 'error', 'message': 'Job was cancelled', 'job': job.to_dict()}), 409
+    if job.status == FAILED:
+        status_code = 503 if job.error_type in ('CircuitOpenError', 'CompileQueueFull') else 500
+        return jsonify({'status': 'error', 'message': job.error, 'job': job.to_dict()}), status_code
+    if job.kind == 'get-pdf':
+        return pdf_response(job.result, job.key[len('pdf:'):])
+    return jsonify(job.result), 200
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-Sent Events: one 'status' event per change, then 'done' once the job finishes"""
+    job, error_response = find_job(job_id)
+    if error_response:
+        return error_response
+
+    def events():
+        version = -1
+        while True:
+            current = job_queue.wait(job_id, version, JOB_EVENTS_HEARTBEAT_SECONDS)
+            if current is None:
+                yield sse_event('error', {'status': 'error', 'message': f'Job {job_id} expired'})
+                return
+            if current.finished:
+                yield sse_event('done', current.to_dict())
+                return
+            if current.version == version:
+                # Keep idle connections (and any proxies) from timing out
+                yield ": keepalive\n\n"
+                continue
+            version = current.version
+            yield sse_event('status', current.to_dict())
+
+    return app.response_class(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/job-stats', methods=['GET'])
+def job_stats():
+    """Endpoint to report job queue depth and outcomes"""
+    return jsonify({
+        'status': 'success',
+        'jobs': job_queue.stats()
+    }), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Stage, endpoint and model latency histograms, token counters and queue depths for Prometheus"""
+    return app.response_class(render_metrics(), content_type=CONTENT_TYPE)
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """Endpoint to report resume parse cache hit/miss counts"""
+    return jsonify({
+        'status': 'success',
+        'parse_cache': resumeAgent.parse_cache.stats(),
+        'pdf_cache': compile_service.pdf_cache.stats()
+    }), 200
+
+@app.route('/model-stats', methods=['GET'])
+def model_stats():
+    """Endpoint to report rate limiting, hedging, circuit breaker and parse repair state for model calls"""
+    return jsonify({
+        'status': 'success',
+        'rate_limiter': get_rate_limiter().stats(),
+        'hedging': get_hedger().stats(),
+        'circuit_breaker': get_circuit_breaker().stats(),
+        'parsing': get_parse_metrics().stats()
+    }), 200
     
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
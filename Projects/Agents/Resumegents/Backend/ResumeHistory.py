@@ -0,0 +1,186 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+import copy
+import os
+
+# RFC 6902 style patch: a list of {"op": "add" | "remove" | "replace", "path": ..., "value": ...}
+Patch = List[Dict[str, Any]]
+
+
+def _escape(token: Any) -> str:
+    return str(token).replace('~', '~0').replace('/', '~1')
+
+
+def _unescape(token: str) -> str:
+    return token.replace('~1', '/').replace('~0', '~')
+
+
+def make_patch(old: Any, new: Any, path: str = '') -> Patch:
+    """JSON patch turning old into new; unchanged subtrees produce no operations"""
+    if old == new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops: Patch = []
+        for key in old:
+            if key not in new:
+                ops.append({'op': 'remove', 'path': f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            if key not in old:
+                ops.append({'op': 'add', 'path': f"{path}/{_escape(key)}", 'value': copy.deepcopy(value)})
+            else:
+                ops.extend(make_patch(old[key], value, f"{path}/{_escape(key)}"))
+        return ops
+    if isinstance(old, list) and isinstance(new, list):
+        ops = []
+        common = min(len(old), len(new))
+        for i in range(common):
+            ops.extend(make_patch(old[i], new[i], f"{path}/{i}"))
+        for i in range(common, len(new)):
+            ops.append({'op': 'add', 'path': f"{path}/{i}", 'value': copy.deepcopy(new[i])})
+        # Remove from the end so earlier indexes stay valid
+        for i in range(len(old) - 1, common - 1, -1):
+            ops.append({'op': 'remove', 'path': f"{path}/{i}"})
+        return ops
+    return [{'op': 'replace', 'path': path, 'value': copy.deepcopy(new)}]
+
+
+def apply_patch(doc: Any, patch: Patch) -> Any:
+    """Apply a patch from make_patch in place and return the (possibly replaced) document"""
+    for op in patch:
+        tokens = [_unescape(token) for token in op['path'].split('/')[1:]]
+        if not tokens:
+            doc = copy.deepcopy(op['value'])
+            continue
+        parent = doc
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        last = tokens[-1]
+        if isinstance(parent, list):
+            index = int(last)
+            if op['op'] == 'add':
+                parent.insert(index, copy.deepcopy(op['value']))
+            elif op['op'] == 'remove':
+                del parent[index]
+            else:
+                parent[index] = copy.deepcopy(op['value'])
+        elif op['op'] == 'remove':
+            del parent[last]
+        else:
+            parent[last] = copy.deepcopy(op['value'])
+    return doc
+
+
+@dataclass
+class ResumeVersion:
+    latex_content: Optional[str]  # Stores the LaTeX version
+    changes_made: str
+    timestamp: datetime = field(default_factory=datetime.now)
+    feedback: Optional[str] = None
+    version_number: int = 0
+    pdf_path: Optional[str] = None
+    # Either a full copy of the structured resume or a patch against the previous version
+    snapshot: Optional[Dict] = field(default=None, repr=False)
+    patch: Optional[Patch] = field(default=None, repr=False)
+    history: Optional['ResumeHistory'] = field(default=None, repr=False, compare=False)
+
+    @property
+    def content(self) -> Dict:
+        """The structured JSON resume data, rebuilt on demand"""
+        return self.history.materialize(self.version_number)
+
+
+class ResumeHistory:
+    """Resume versions stored as patches against their predecessor
+
+    Every snapshot_interval-th version keeps a full snapshot, so rebuilding any
+    version applies at most snapshot_interval - 1 patches. The newest version
+    is also kept materialized, since it is read on every chat turn and is the
+    base for the next patch.
+    """
+
+    def __init__(self, snapshot_interval: Optional[int] = None):
+        self.snapshot_interval = snapshot_interval or int(os.getenv('RESUME_SNAPSHOT_INTERVAL', '10'))
+        self._versions: List[ResumeVersion] = []
+        self._latest: Optional[Dict] = None
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+    def __iter__(self) -> Iterator[ResumeVersion]:
+        return iter(self._versions)
+
+    def __getitem__(self, index: int) -> ResumeVersion:
+        return self._versions[index]
+
+    def append(self, content: Dict, **metadata: Any) -> ResumeVersion:
+        """Record content as the next version; metadata is passed to ResumeVersion"""
+        version_number = len(self._versions)
+        if version_number % self.snapshot_interval == 0 or self._latest is None:
+            snapshot, patch = copy.deepcopy(content), None
+        else:
+            snapshot, patch = None, make_patch(self._latest, content)
+        version = ResumeVersion(
+            version_number=version_number,
+            snapshot=snapshot,
+            patch=patch,
+            history=self,
+            **metadata
+        )
+        self._versions.append(version)
+        self._latest = copy.deepcopy(content)
+        return version
+
+    def materialize(self, version_number: int) -> Dict:
+        """Full content of a version, as a copy the caller may modify"""
+        if version_number == len(self._versions) - 1 and self._latest is not None:
+            return copy.deepcopy(self._latest)
+        base = version_number
+        while self._versions[base].snapshot is None:
+            base -= 1
+        content = copy.deepcopy(self._versions[base].snapshot)
+        for version in self._versions[base + 1:version_number + 1]:
+            content = apply_patch(content, version.patch)
+        return content
+
+    def to_state(self) -> List[Dict]:
+        return [
+            {
+                'snapshot': version.snapshot,
+                'patch': version.patch,
+                'latex_content': version.latex_content,
+                'changes_made': version.changes_made,
+                'timestamp': version.timestamp.isoformat(),
+                'feedback': version.feedback,
+                'version_number': version.version_number,
+                'pdf_path': version.pdf_path
+            }
+            for version in self._versions
+        ]
+
+    @classmethod
+    def from_state(cls, versions: List[Dict], snapshot_interval: Optional[int] = None) -> 'ResumeHistory':
+        """Rebuild from to_state(); entries saved with a full 'content' are re-encoded as patches"""
+        history = cls(snapshot_interval)
+        for i, version in enumerate(versions):
+            metadata = {
+                'latex_content': version.get('latex_content'),
+                'changes_made': version.get('changes_made', ''),
+                'timestamp': datetime.fromisoformat(version['timestamp']),
+                'feedback': version.get('feedback'),
+                'pdf_path': version.get('pdf_path')
+            }
+            if 'content' in version:
+                history.append(version['content'], **metadata)
+                continue
+            history._versions.append(ResumeVersion(
+                version_number=version.get('version_number', i),
+                snapshot=version.get('snapshot'),
+                patch=version.get('patch'),
+                history=history,
+                **metadata
+            ))
+        if history._versions:
+            history._latest = None
+            history._latest = history.materialize(len(history._versions) - 1)
+        return history
@@ -0,0 +1,422 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import json
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever parse output handling changes, so cached parses are not reused across formats
+SCHEMA_VERSION = 'resume-schema-1'
+
+RESUME_TOOL_NAME = 'record_resume'
+
+
+def _string() -> Dict:
+    return {"type": "string"}
+
+
+def _strings() -> Dict:
+    return {"type": "array", "items": {"type": "string"}}
+
+
+def _entries(properties: Dict[str, Dict]) -> Dict:
+    return {"type": "array", "items": {"type": "object", "properties": properties}}
+
+
+# JSON Schema for the structure described in PROMPTS/ResumeParser.md
+RESUME_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "personal_info": {
+            "type": "object",
+            "properties": {
+                "name": _string(),
+                "email": _string(),
+                "phone": _string(),
+                "location": {
+                    "anyOf": [
+                        {"type": "object", "properties": {"city": _string(), "state": _string(), "country": _string()}},
+                        _string()
+                    ]
+                },
+                "linkedin": _string(),
+                "portfolio": _string(),
+                "summary": _string(),
+                "objective": _string(),
+                "citizenship": _string(),
+                "visa_status": _string()
+            },
+            "required": ["name"]
+        },
+        "education": _entries({
+            "institution": _string(),
+            "degree": _string(),
+            "field_of_study": _string(),
+            "graduation_date": _string(),
+            "gpa": {"type": "number"},
+            "highlights": _strings(),
+            "honors": _strings(),
+            "relevant_coursework": _strings(),
+            "thesis": _string(),
+            "activities": _strings()
+        }),
+        "experience": _entries({
+            "company": _string(),
+            "title": _string(),
+            "location": _string(),
+            "start_date": _string(),
+            "end_date": _string(),
+            "responsibilities": _strings(),
+            "achievements": _strings(),
+            "technologies_used": _strings(),
+            "projects": _strings(),
+            "team_size": {"type": "integer"},
+            "industry": _string()
+        }),
+        "skills": {
+            "type": "object",
+            "properties": {
+                group: _strings()
+                for group in ('technical', 'soft_skills', 'languages', 'certifications',
+                              'tools', 'frameworks', 'databases', 'methodologies')
+            },
+            # Keep skill groups the resume names differently rather than losing them
+            "additionalProperties": _strings()
+        },
+        "projects": _entries({
+            "name": _string(),
+            "description": _string(),
+            "technologies": _strings(),
+            "start_date": _string(),
+            "end_date": _string(),
+            "url": _string(),
+            "achievements": _strings()
+        }),
+        "volunteer_experience": _entries({
+            "organization": _string(),
+            "role": _string(),
+            "start_date": _string(),
+            "end_date": _string(),
+            "description": _strings(),
+            "impact": _strings()
+        }),
+        "awards": _entries({
+            "title": _string(),
+            "issuer": _string(),
+            "date": _string(),
+            "description": _string()
+        }),
+        "publications": _entries({
+            "title": _string(),
+            "authors": _strings(),
+            "journal": _string(),
+            "date": _string(),
+            "url": _string(),
+            "description": _string()
+        })
+    },
+    "required": ["personal_info"]
+}
+
+# Forced tool call: the model must answer with arguments matching RESUME_SCHEMA
+RESUME_TOOL: Dict[str, Any] = {
+    "name": RESUME_TOOL_NAME,
+    "description": "Record the structured information extracted from the resume.",
+    "input_schema": RESUME_SCHEMA
+}
+RESUME_TOOL_CHOICE: Dict[str, str] = {"type": "tool", "name": RESUME_TOOL_NAME}
+
+
+class SchemaError(ValueError):
+    """Output that cannot be coerced into the resume schema"""
+
+
+Normalizer = Callable[[Any, str, List[str]], Any]
+
+_DROP = object()
+_NUMBER_RE = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+def compile_schema(schema: Dict[str, Any]) -> Normalizer:
+    """Turn a JSON Schema subset into a function that validates and coerces a value
+
+    The function takes (value, path, repairs), appends a note to repairs for every
+    coercion it makes and raises SchemaError for anything it cannot fix. Unknown
+    keys (unless additionalProperties gives a schema) and empty values are dropped, single values become one-item
+    lists and numeric strings become numbers.
+    """
+    if 'anyOf' in schema:
+        branches = [compile_schema(branch) for branch in schema['anyOf']]
+
+        def normalize_any(value: Any, path: str, repairs: List[str]) -> Any:
+            for branch in branches:
+                attempt: List[str] = []
+                try:
+                    result = branch(value, path, attempt)
+                except SchemaError:
+                    continue
+                repairs.extend(attempt)
+                return result
+            raise SchemaError(f"{path or '/'} matches no allowed type")
+        return normalize_any
+
+    kind = schema.get('type')
+    if kind == 'object':
+        properties = {key: compile_schema(sub) for key, sub in schema.get('properties', {}).items()}
+        extra = schema.get('additionalProperties')
+        extra = compile_schema(extra) if isinstance(extra, dict) else None
+        required = schema.get('required', [])
+
+        def normalize_object(value: Any, path: str, repairs: List[str]) -> Any:
+            if not isinstance(value, dict):
+                raise SchemaError(f"{path or '/'} should be an object")
+            result = {}
+            for key, item in value.items():
+                normalize = properties.get(key, extra)
+                if normalize is None:
+                    repairs.append(f"dropped unknown field {path}/{key}")
+                    continue
+                if item is None or item == '' or item == []:
+                    continue
+                normalized = normalize(item, f"{path}/{key}", repairs)
+                if normalized is not _DROP:
+                    result[key] = normalized
+            missing = [key for key in required if key not in result]
+            if missing:
+                raise SchemaError(f"{path or '/'} is missing {', '.join(missing)}")
+            return result
+        return normalize_object
+
+    if kind == 'array':
+        items = compile_schema(schema.get('items', {}))
+
+        def normalize_array(value: Any, path: str, repairs: List[str]) -> Any:
+            if not isinstance(value, list):
+                repairs.append(f"wrapped {path} in a list")
+                value = [value]
+            result = []
+            for i, item in enumerate(value):
+                if item is None or item == '':
+                    continue
+                normalized = items(item, f"{path}/{i}", repairs)
+                if normalized is not _DROP:
+                    result.append(normalized)
+            return result
+        return normalize_array
+
+    if kind == 'string':
+        def normalize_string(value: Any, path: str, repairs: List[str]) -> Any:
+            if isinstance(value, str):
+                return value.strip()
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                repairs.append(f"converted {path} to text")
+                return str(value)
+            if isinstance(value, list) and all(isinstance(item, str) for item in value):
+                repairs.append(f"joined {path} into one string")
+                return ' '.join(item.strip() for item in value)
+            raise SchemaError(f"{path} should be a string")
+        return normalize_string
+
+    if kind in ('number', 'integer'):
+        cast = int if kind == 'integer' else float
+
+        def normalize_number(value: Any, path: str, repairs: List[str]) -> Any:
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return cast(value)
+            match = _NUMBER_RE.search(str(value))
+            if match:
+                # e.g. "3.73/4.0" or "about 12 people"
+                repairs.append(f"read {path} as a number")
+                return cast(float(match.group()))
+            repairs.append(f"dropped non-numeric {path}")
+            return _DROP
+        return normalize_number
+
+    return lambda value, path, repairs: value
+
+
+normalize_resume = compile_schema(RESUME_SCHEMA)
+
+
+def _close_truncated(text: str) -> str:
+    """Close the strings, arrays and objects left open by a reply cut off mid-JSON"""
+    stack = []
+    in_string = escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]' and stack:
+            stack.pop()
+    if in_string:
+        text += '"'
+    text = text.rstrip().rstrip(',')
+    if stack and stack[-1] == '}':
+        # Inside an object a trailing string after '{' or ',' is a key that never got its value
+        text = re.sub(r'(?:,|(?<=\{))\s*"(?:[^"\\]|\\.)*"\s*:?\s*$', '', text).rstrip().rstrip(',')
+    return text + ''.join(reversed(stack))
+
+
+def repair_json_text(text: str) -> str:
+    """Fix the usual ways model JSON goes wrong: smart quotes, trailing commas, Python literals, truncation"""
+    # Curly quotes only where they delimit keys and values; inside text they are content
+    text = re.sub(r'(?<=[{\[:,])(\s*)[“”]', r'\1"', text)
+    text = re.sub(r'[“”](?=\s*[:,}\]])', '"', text)
+    text = re.sub(r',\s*([}\]])', r'\1', text)
+    text = re.sub(r'(?<=[:\[,\s])(None|True|False)(?=\s*[,}\]])',
+                  lambda match: {'None': 'null', 'True': 'true', 'False': 'false'}[match.group()], text)
+    return _close_truncated(text)
+
+
+def extract_json(text: str) -> Tuple[Any, bool]:
+    """Parse JSON from model text, returning (value, repaired)
+
+    Handles code fences and prose around the object locally before falling back
+    to repair_json_text.
+    """
+    text = text.strip()
+    try:
+        return json.loads(text), False
+    except ValueError:
+        pass
+    fenced = re.search(r'```(?:json)?\s*(.*?)(?:```|$)', text, re.DOTALL)
+    candidate = fenced.group(1) if fenced else text
+    start = candidate.find('{')
+    if start < 0:
+        raise SchemaError("No JSON object in the model output")
+    candidate = candidate[start:]
+    try:
+        value, _ = json.JSONDecoder().raw_decode(candidate)
+        return value, True
+    except ValueError:
+        pass
+    try:
+        return json.loads(repair_json_text(candidate)), True
+    except ValueError as e:
+        raise SchemaError(f"Unrepairable JSON in the model output: {str(e)}")
+
+
+class ParseMetrics:
+    """Counts how resume parses were obtained: clean, locally repaired, re-called or failed"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {
+            'parses': 0,
+            'tool_output': 0,
+            'text_output': 0,
+            'clean': 0,
+            'repaired': 0,
+            'recalled': 0,
+            'truncated': 0,
+            'failed': 0
+        }
+
+    def record(self, *names: str) -> None:
+        with self._lock:
+            for name in names:
+                self._counts[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+        parses = max(1, counts['parses'])
+        counts['repair_rate'] = round(counts['repaired'] / parses, 4)
+        counts['recall_rate'] = round(counts['recalled'] / parses, 4)
+        return counts
+
+
+def response_output(response: Any) -> Tuple[Any, str]:
+    """The resume payload of a Messages API response: the tool input, else the text"""
+    for block in response.content:
+        if getattr(block, 'type', None) == 'tool_use' and block.name == RESUME_TOOL_NAME:
+            return block.input, 'tool_output'
+    return "".join(getattr(block, 'text', '') for block in response.content), 'text_output'
+
+
+def read_resume(output: Any, source: str = 'text_output') -> Tuple[Dict, List[str]]:
+    """Validate a tool input or model text against the schema, returning (resume, repairs)"""
+    repairs: List[str] = []
+    if isinstance(output, str):
+        output, repaired = extract_json(output)
+        if repaired:
+            repairs.append("recovered JSON from malformed text")
+    if isinstance(output, dict) and set(output) == {'resume'} and source == 'tool_output':
+        # Some replies nest the arguments one level down
+        output = output['resume']
+        repairs.append("unwrapped nested tool input")
+    return normalize_resume(output, '', repairs), repairs
+
+
+def parse_resume_output(call: Callable[[], Any], metrics: Optional[ParseMetrics] = None) -> Dict:
+    """Run a structured parse call and return a schema-valid resume dict
+
+    Malformed output is repaired locally first; only output that cannot be
+    repaired costs a second model call. Output cut off at max_tokens is never
+    repaired, since closing it would silently drop the rest of the resume, and
+    is re-called instead. Raises SchemaError if the second call fails too.
+    """
+    metrics = metrics or get_parse_metrics()
+    metrics.record('parses')
+    for attempt in range(2):
+        response = call()
+        output, source = response_output(response)
+        metrics.record(source)
+        try:
+            if getattr(response, 'stop_reason', None) == 'max_tokens':
+                metrics.record('truncated')
+                raise SchemaError("Resume parse output was cut off at the max_tokens limit")
+            resume, repairs = read_resume(output, source)
+        except SchemaError as e:
+            if attempt == 0:
+                logger.warning(f"Re-calling resume parse after unusable output: {str(e)}")
+                metrics.record('recalled')
+                continue
+            metrics.record('failed')
+            raise
+        if repairs:
+            logger.info(f"Repaired resume parse output: {'; '.join(repairs[:5])}")
+            metrics.record('repaired')
+        else:
+            metrics.record('clean')
+        return resume
+
+
+def validate_resume(resume: Any) -> Dict:
+    """Check a parsed resume (dict or JSON text) has the parts every generation needs"""
+    if isinstance(resume, str):
+        try:
+            resume = json.loads(resume)
+        except ValueError:
+            raise ValueError("Resume is not valid JSON")
+    if not isinstance(resume, dict):
+        raise ValueError("Resume should be a JSON object")
+    if resume.get('status') == 'error':
+        raise ValueError(resume.get('message', 'Resume parsing failed'))
+    if not (resume.get('personal_info') or {}).get('name'):
+        raise ValueError("Field personal_info.name is required")
+    if not any(resume.get(section) for section in ('experience', 'education', 'projects')):
+        raise ValueError("At least one of experience, education or projects is required")
+    return resume
+
+
+_parse_metrics: Optional[ParseMetrics] = None
+_parse_metrics_lock = threading.Lock()
+
+
+def get_parse_metrics() -> ParseMetrics:
+    """Process-wide parse metrics shared by every agent"""
+    global _parse_metrics
+    with _parse_metrics_lock:
+        if _parse_metrics is None:
+            _parse_metrics = ParseMetrics()
+        return _parse_metrics
@@ -0,0 +1,228 @@
+from typing import AsyncIterator, Dict, Iterable, Optional
+import logging
+import math
+import os
+import tempfile
+
+try:
+    import python_multipart
+    from python_multipart.multipart import parse_options_header
+except ImportError:  # Optional: without python-multipart only base64 JSON uploads are accepted
+    python_multipart = None
+
+logger = logging.getLogger(__name__)
+
+# Hard limit on the PDF itself; larger uploads are rejected as soon as the limit is crossed
+MAX_UPLOAD_BYTES = int(os.getenv('RESUME_MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+
+# Uploads stay in memory up to this size, then roll over to a temporary file on disk
+SPOOL_MEMORY_BYTES = int(os.getenv('RESUME_UPLOAD_SPOOL_BYTES', str(1024 * 1024)))
+
+# Multipart framing plus the small text fields sent alongside the file
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+UPLOAD_FIELD = 'resume'
+CHUNK_BYTES = 64 * 1024
+
+# Readers accept a PDF header anywhere in the first KB; anything else is not a PDF
+PDF_MAGIC = b'%PDF-'
+PDF_MAGIC_WINDOW = 1024
+PDF_CONTENT_TYPES = ('application/pdf', 'application/octet-stream', 'application/x-pdf')
+
+
+class UploadError(Exception):
+    """Rejected upload, with the HTTP status to answer it with"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def max_json_request_bytes() -> int:
+    """Largest base64-in-JSON request that can carry a PDF within MAX_UPLOAD_BYTES"""
+    return 4 * math.ceil(MAX_UPLOAD_BYTES / 3) + FORM_OVERHEAD_BYTES
+
+
+def check_content_length(content_length: Optional[int]) -> None:
+    """Reject a declared request size over the limit before reading any of the body"""
+    if content_length is not None and content_length > MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES:
+        raise UploadError(f"Upload exceeds the {MAX_UPLOAD_BYTES} byte limit", 413)
+
+
+class PdfUpload:
+    """A PDF written in chunks to a spooled temporary file
+
+    The size limit and the PDF header are checked as each chunk arrives, so an
+    oversized or non-PDF upload fails after at most one chunk past the problem.
+    """
+
+    def __init__(self, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+        self._head = b''
+        self._is_pdf = False
+
+    def write(self, chunk: bytes) -> None:
+        if self.size + len(chunk) > self.max_bytes:
+            raise UploadError(f"Upload exceeds the {self.max_bytes} byte limit", 413)
+        if not self._is_pdf:
+            self._head += chunk[:PDF_MAGIC_WINDOW - len(self._head)]
+            self._is_pdf = PDF_MAGIC in self._head
+            if not self._is_pdf and len(self._head) >= PDF_MAGIC_WINDOW:
+                raise UploadError("Upload is not a PDF", 415)
+        self.file.write(chunk)
+        self.size += len(chunk)
+
+    def finish(self) -> 'PdfUpload':
+        if not self._is_pdf:
+            raise UploadError("Upload is not a PDF" if self.size else "Uploaded file is empty", 415 if self.size else 400)
+        self.file.seek(0)
+        return self
+
+    def read_bytes(self) -> bytes:
+        """The whole PDF; the only full in-memory copy made of the upload"""
+        self.file.seek(0)
+        return self.file.read()
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self) -> 'PdfUpload':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class MultipartPdfReceiver:
+    """Incremental multipart/form-data parser that streams one file field into a PdfUpload
+
+    Text fields are kept (they are small and bounded by FORM_OVERHEAD_BYTES); any other
+    file field is discarded as it arrives.
+    """
+
+    def __init__(self, content_type: str, field: str = UPLOAD_FIELD, max_bytes: int = MAX_UPLOAD_BYTES):
+        if python_multipart is None:
+            raise UploadError("Multipart uploads need python-multipart installed", 500)
+        mime, options = parse_options_header(content_type or '')
+        boundary = options.get(b'boundary')
+        if mime != b'multipart/form-data' or not boundary:
+            raise UploadError("Expected a multipart/form-data request with a boundary", 415)
+
+        self.field = field
+        self.fields: Dict[str, str] = {}
+        self.upload: Optional[PdfUpload] = PdfUpload(max_bytes)
+        self._received = False
+        self._field_bytes = 0
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_name = b''
+        self._header_value = b''
+        self._part_name = ''
+        self._part_is_file = False
+        self._part_data = bytearray()
+        self._parser = python_multipart.MultipartParser(boundary, callbacks={
+            'on_part_begin': self._on_part_begin,
+            'on_part_data': self._on_part_data,
+            'on_part_end': self._on_part_end,
+            'on_header_field': self._on_header_field,
+            'on_header_value': self._on_header_value,
+            'on_header_end': self._on_header_end,
+            'on_headers_finished': self._on_headers_finished,
+        })
+
+    def feed(self, chunk: bytes) -> None:
+        try:
+            self._parser.write(chunk)
+        except UploadError:
+            raise
+        except Exception as e:
+            raise UploadError(f"Malformed multipart body: {str(e)}", 400)
+
+    def finish(self) -> PdfUpload:
+        self._parser.finalize()
+        if not self._received:
+            raise UploadError(f"Missing '{self.field}' file field", 400)
+        return self.upload.finish()
+
+    def close(self) -> None:
+        if self.upload is not None:
+            self.upload.close()
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._part_name = ''
+        self._part_is_file = False
+        self._part_data = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = self._header_value = b''
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b'content-disposition', b''))
+        self._part_name = options.get(b'name', b'').decode('utf-8', 'replace')
+        self._part_is_file = b'filename' in options
+        if self._part_name != self.field:
+            return
+        if self._received:
+            raise UploadError(f"More than one '{self.field}' file field", 400)
+        self._received = True
+        # A declared non-PDF type fails before a single byte of the file is stored
+        content_type = parse_options_header(self._headers.get(b'content-type', b'application/pdf'))[0].decode('latin-1')
+        if content_type not in PDF_CONTENT_TYPES:
+            raise UploadError(f"Expected a PDF, got {content_type}", 415)
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._part_name == self.field:
+            self.upload.write(data[start:end])
+        elif not self._part_is_file:
+            self._field_bytes += end - start
+            if self._field_bytes > FORM_OVERHEAD_BYTES:
+                raise UploadError("Form fields are too large", 413)
+            self._part_data += data[start:end]
+
+    def _on_part_end(self) -> None:
+        if self._part_name and self._part_name != self.field and not self._part_is_file:
+            self.fields[self._part_name] = self._part_data.decode('utf-8', 'replace')
+
+
+def receive_pdf(content_type: str, chunks: Iterable[bytes], field: str = UPLOAD_FIELD) -> MultipartPdfReceiver:
+    """Stream a multipart body into a PdfUpload; the caller closes receiver.upload"""
+    receiver = MultipartPdfReceiver(content_type, field)
+    try:
+        for chunk in chunks:
+            receiver.feed(chunk)
+        receiver.finish()
+        return receiver
+    except BaseException:
+        receiver.close()
+        raise
+
+
+async def receive_pdf_async(content_type: str, chunks: AsyncIterator[bytes], field: str = UPLOAD_FIELD) -> MultipartPdfReceiver:
+    """receive_pdf for an ASGI request body stream"""
+    receiver = MultipartPdfReceiver(content_type, field)
+    try:
+        async for chunk in chunks:
+            receiver.feed(chunk)
+        receiver.finish()
+        return receiver
+    except BaseException:
+        receiver.close()
+        raise
+
+
+def iter_stream(stream, chunk_bytes: int = CHUNK_BYTES) -> Iterable[bytes]:
+    """Chunks of a WSGI input stream"""
+    while True:
+        chunk = stream.read(chunk_bytes)
+        if not chunk:
+            return
+        yield chunk
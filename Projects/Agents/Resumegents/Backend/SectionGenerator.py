@@ -0,0 +1,215 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import json
+import logging
+import os
+import re
+import threading
+
+from Caching import FragmentCache, content_hash
+from ContextBuilder import detect_focus
+from JobKeywords import JOB_CONTEXT_MODE, job_context
+from LatexTemplates import SECTION_TITLES, wrap_document
+from ModelRequests import SystemPrompt, cached_system_prompt
+from PromptRegistry import PromptRegistry, get_prompt_registry
+from Telemetry import timed
+
+logger = logging.getLogger(__name__)
+
+# 'template' renders the document locally and only asks the model to reword bullets;
+# 'sections' builds it from cached per-section fragments; 'document' asks the model
+# for the whole file in one call as before
+GENERATION_MODE = os.getenv('LATEX_GENERATION_MODE', 'template')
+
+SECTION_TEMPLATE = 'ResumeSectionWriter'
+
+# Fragments generated concurrently for one document
+section_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('SECTION_WORKERS', '4')),
+    thread_name_prefix='latex-sections'
+)
+
+# Document order of sections; headings and the document shell come from LatexTemplates
+SECTION_ORDER = ['header', 'summary', 'experience', 'projects', 'education', 'skills',
+                 'volunteer_experience', 'awards', 'publications']
+
+
+@dataclass
+class Fragment:
+    id: str  # e.g. 'header', 'experience/2'
+    section: str
+    source: Any
+
+
+def split_fragments(resume: Dict) -> List[Fragment]:
+    """Cut a parsed resume into independently generated fragments, in document order"""
+    personal = resume.get('personal_info') or {}
+    fragments = [Fragment('header', 'header', {k: v for k, v in personal.items() if k not in ('summary', 'objective')})]
+    summary = {k: personal[k] for k in ('summary', 'objective') if personal.get(k)}
+    if summary:
+        fragments.append(Fragment('summary', 'summary', summary))
+    for section in SECTION_ORDER[2:]:
+        value = resume.get(section)
+        if not value:
+            continue
+        if section == 'experience':
+            # One fragment per role, so editing one role leaves the others cached
+            fragments.extend(Fragment(f"experience/{i}", section, entry) for i, entry in enumerate(value))
+        else:
+            fragments.append(Fragment(section, section, value))
+    return fragments
+
+
+def route_guidance(instructions: str, resume: Dict) -> Dict[str, str]:
+    """Attach free-text feedback to the section it is about, or to every section ('*')"""
+    if not instructions or not instructions.strip():
+        return {}
+    focus = detect_focus(instructions, resume)
+    if focus == 'personal_info':
+        focus = 'header'
+    return {focus or '*': instructions}
+
+
+def _mentions(text: str, entry: Any) -> bool:
+    lowered = text.lower()
+    names = [entry.get(field) for field in ('company', 'title')] if isinstance(entry, dict) else []
+    return any(name and len(name) > 2 and name.lower() in lowered for name in names)
+
+
+def clean_fragment(text: str) -> str:
+    """Strip markdown fences the model may add and reject anything that is not a body fragment"""
+    text = re.sub(r'^```[a-zA-Z]*\s*|\s*```$', '', text.strip())
+    for forbidden in ('\\documentclass', '\\begin{document}', '\\end{document}'):
+        if forbidden in text:
+            raise ValueError(f"Section fragment contains {forbidden}")
+    if text.count('{') != text.count('}') or text.count('\\begin{') != text.count('\\end{'):
+        raise ValueError("Section fragment has unbalanced braces or environments")
+    return text
+
+
+class SectionGenerator:
+    """Build a tailored LaTeX resume from per-section fragments, reusing unchanged ones
+
+    Each fragment is cached under a hash of its source JSON, the job description,
+    any guidance routed to it and the section prompt version, so a follow-up edit
+    only regenerates the fragments whose inputs changed.
+    """
+
+    def __init__(self,
+                 call_model: Callable[[SystemPrompt, List[Dict]], str],
+                 cache: Optional[FragmentCache] = None,
+                 prompt_registry: Optional[PromptRegistry] = None):
+        self.call_model = call_model
+        self.cache = cache or get_fragment_cache()
+        self.prompt_registry = prompt_registry or get_prompt_registry()
+
+    @staticmethod
+    def fragment_guidance(fragment: Fragment, guidance: Dict[str, str]) -> str:
+        """Guidance for one fragment: its own entry if it has one, else general plus section guidance"""
+        if fragment.id in guidance:
+            return guidance[fragment.id]
+        return "\n".join(part for part in [guidance.get('*', ''), guidance.get(fragment.section, '')] if part)
+
+    def fragment_key(self, fragment: Fragment, job_digest: str, guidance_text: str, prompt_version: str) -> str:
+        source = json.dumps(fragment.source, sort_keys=True, separators=(',', ':'))
+        return content_hash(fragment.section, source, job_digest, guidance_text, prompt_version)
+
+    def iter_fragments(self,
+                       resume: Dict,
+                       job_description: str,
+                       guidance: Optional[Dict[str, str]] = None) -> Iterator[Tuple[Fragment, str, bool]]:
+        """Yield (fragment, latex, cached) as each fragment becomes available"""
+        template = self.prompt_registry.get(SECTION_TEMPLATE)
+        job_digest = content_hash(JOB_CONTEXT_MODE, job_description or '')
+        guidance = self._narrow_experience_guidance(resume, guidance or {})
+        # The job description is shared by every fragment of this document, so it joins the cached prefix
+        system_prompt = cached_system_prompt(template.text, f"Job description:\n\n{job_context(job_description)}")
+
+        # Start every missing fragment before handing back the cached ones
+        cached_fragments = []
+        pending = {}
+        for fragment in split_fragments(resume):
+            guidance_text = self.fragment_guidance(fragment, guidance)
+            key = self.fragment_key(fragment, job_digest, guidance_text, template.version_id)
+            cached = self.cache.get(key)
+            if cached is not None:
+                cached_fragments.append((fragment, cached, True))
+            else:
+                future = section_executor.submit(self._generate_fragment, fragment, guidance_text, system_prompt)
+                pending[future] = (fragment, key)
+
+        yield from cached_fragments
+        for future in as_completed(pending):
+            fragment, key = pending[future]
+            latex = future.result()
+            self.cache.put(key, latex)
+            yield fragment, latex, False
+
+    @timed('section_generate')
+    def generate(self,
+                 resume: Dict,
+                 job_description: str,
+                 guidance: Optional[Dict[str, str]] = None,
+                 theme: Optional[str] = None) -> Tuple[str, Dict[str, int]]:
+        """Return (latex_document, stats) where stats counts cached and generated fragments"""
+        fragments = list(self.iter_fragments(resume, job_description, guidance))
+        stats = {
+            'fragments': len(fragments),
+            'cached': sum(1 for _, _, cached in fragments if cached),
+            'generated': sum(1 for _, _, cached in fragments if not cached)
+        }
+        logger.info(f"Section generation: {stats['generated']} generated, {stats['cached']} reused")
+        return self.assemble({fragment.id: latex for fragment, latex, _ in fragments}, resume, theme), stats
+
+    @staticmethod
+    def assemble(latex_by_id: Dict[str, str], resume: Dict, theme: Optional[str] = None) -> str:
+        """Place fragments into the theme's document shell in section order"""
+        body = []
+        current_section = None
+        for fragment in split_fragments(resume):
+            if fragment.section != current_section and fragment.section in SECTION_TITLES:
+                body.append(f"\\section{{{SECTION_TITLES[fragment.section]}}}")
+            current_section = fragment.section
+            body.append(latex_by_id[fragment.id])
+        return wrap_document("\n\n".join(body), theme)
+
+    def _narrow_experience_guidance(self, resume: Dict, guidance: Dict[str, str]) -> Dict[str, str]:
+        """Send experience feedback that names specific roles only to those roles' fragments"""
+        text = guidance.get('experience')
+        if not text:
+            return guidance
+        entries = resume.get('experience') or []
+        named = [i for i, entry in enumerate(entries) if _mentions(text, entry)]
+        if not named:
+            return guidance
+        narrowed = {key: value for key, value in guidance.items() if key != 'experience'}
+        general = guidance.get('*', '')
+        for i in range(len(entries)):
+            narrowed[f"experience/{i}"] = "\n".join(part for part in [general, text if i in named else ''] if part)
+        return narrowed
+
+    def _generate_fragment(self, fragment: Fragment, guidance_text: str, system_prompt: SystemPrompt) -> str:
+        content = f"Section: {fragment.section}\n\nSection data:\n{json.dumps(fragment.source, indent=2)}"
+        if guidance_text:
+            content += f"\n\nSection guidance:\n{guidance_text}"
+        messages = [{"role": "user", "content": content}]
+        try:
+            return clean_fragment(self.call_model(system_prompt, messages))
+        except ValueError as e:
+            # One retry for a malformed fragment before failing the document
+            logger.warning(f"Regenerating malformed fragment {fragment.id}: {str(e)}")
+            return clean_fragment(self.call_model(system_prompt, messages))
+
+
+_fragment_cache: Optional[FragmentCache] = None
+_fragment_cache_lock = threading.Lock()
+
+
+def get_fragment_cache() -> FragmentCache:
+    """Process-wide fragment cache shared by every agent and session"""
+    global _fragment_cache
+    with _fragment_cache_lock:
+        if _fragment_cache is None:
+            _fragment_cache = FragmentCache()
+        return _fragment_cache
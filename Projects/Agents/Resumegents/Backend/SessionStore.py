@@ -0,0 +1,333 @@
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Tuple
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from MultiturnResumeAgent import MultiturnResumeAgent
+
+logger = logging.getLogger(__name__)
+
+
+class SessionConflictError(Exception):
+    """A session was saved elsewhere after this process loaded it"""
+
+
+def state_json(agent: MultiturnResumeAgent) -> bytes:
+    """An agent's session state as JSON; its length stands in for the agent's memory footprint"""
+    return json.dumps(agent.to_state(), separators=(',', ':')).encode('utf-8')
+
+
+class SessionStore(ABC):
+    """Where MultiturnResumeAgent sessions live between requests"""
+
+    # True when sessions survive being dropped from this process's memory
+    persistent = False
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[MultiturnResumeAgent]:
+        """Load a session's agent, or None if the session does not exist"""
+
+    @abstractmethod
+    def save(self, session_id: str, agent: MultiturnResumeAgent) -> None:
+        """Persist an agent after a request has changed it
+
+        Raises SessionConflictError if the stored session has moved on since the agent was loaded.
+        """
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        pass
+
+    @abstractmethod
+    def exists(self, session_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def session_ids(self) -> List[str]:
+        pass
+
+    @abstractmethod
+    def resident(self) -> List[Tuple[str, float, int]]:
+        """Agents held in this process as (session_id, last_access, approximate_bytes), least recent first
+
+        Sizes are measured when a session is saved or loaded, not on every call.
+        """
+
+    @abstractmethod
+    def expire_idle(self, cutoff: float) -> List[str]:
+        """Delete sessions not used since the cutoff timestamp; returns their ids"""
+
+    @abstractmethod
+    def evict(self, session_id: str) -> None:
+        """Drop a session from this process's memory (spilling it if the store is persistent)"""
+
+    def create(self, session_id: str, agent: MultiturnResumeAgent) -> None:
+        self.save(session_id, agent)
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.exists(session_id)
+
+
+class InMemorySessionStore(SessionStore):
+    """Sessions held as live agents in this process only"""
+
+    def __init__(self):
+        self._sessions: Dict[str, MultiturnResumeAgent] = {}
+        self._last_access: Dict[str, float] = {}
+        self._sizes: Dict[str, int] = {}
+
+    def get(self, session_id: str) -> Optional[MultiturnResumeAgent]:
+        agent = self._sessions.get(session_id)
+        if agent is not None:
+            self._last_access[session_id] = time.time()
+        return agent
+
+    def save(self, session_id: str, agent: MultiturnResumeAgent) -> None:
+        self._sizes[session_id] = len(state_json(agent))
+        self._sessions[session_id] = agent
+        self._last_access[session_id] = time.time()
+
+    def delete(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+        self._last_access.pop(session_id, None)
+        self._sizes.pop(session_id, None)
+
+    def resident(self) -> List[Tuple[str, float, int]]:
+        entries = [
+            (session_id, self._last_access.get(session_id, 0.0), self._sizes.get(session_id, 0))
+            for session_id in list(self._sessions)
+        ]
+        return sorted(entries, key=lambda entry: entry[1])
+
+    def expire_idle(self, cutoff: float) -> List[str]:
+        expired = [session_id for session_id, last_access, _ in self.resident() if last_access < cutoff]
+        for session_id in expired:
+            self.delete(session_id)
+        return expired
+
+    def evict(self, session_id: str) -> None:
+        # This process holds the only copy, so evicting ends the session
+        self.delete(session_id)
+
+    def exists(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def session_ids(self) -> List[str]:
+        return list(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a SQLite file shared by every worker process on the host
+
+    Each row carries a revision number. Decoded agents are kept in a local cache
+    and reused as long as the stored revision has not moved, so a session is only
+    deserialized when it is first touched in this process or another worker has
+    changed it since. Evicting a session only drops that local copy.
+
+    A save only succeeds against the revision the agent was loaded at; if another
+    worker saved first, the save raises SessionConflictError and the local copy is
+    dropped so the next get() reloads the stored session.
+    """
+
+    persistent = True
+
+    def __init__(self, path: Optional[str] = None, timeout: float = 30.0):
+        self.path = path or os.getenv('SESSION_DB_PATH', os.path.join('cache', 'sessions.db'))
+        self.timeout = timeout
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        # session_id -> (revision, agent, last_access, state size in bytes)
+        self._cache: Dict[str, Tuple[int, MultiturnResumeAgent, float, int]] = {}
+        self._cache_lock = threading.Lock()
+
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    state BLOB NOT NULL,
+                    revision INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections are not shareable across threads; keep one per thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id: str) -> Optional[MultiturnResumeAgent]:
+        conn = self._connection()
+        row = conn.execute("SELECT revision FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            with self._cache_lock:
+                self._cache.pop(session_id, None)
+            return None
+
+        with self._cache_lock:
+            cached = self._cache.get(session_id)
+            if cached and cached[0] == row[0]:
+                self._cache[session_id] = (cached[0], cached[1], time.time(), cached[3])
+                return cached[1]
+
+        row = conn.execute("SELECT revision, state FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        state = zlib.decompress(row[1])
+        agent = MultiturnResumeAgent.from_state(json.loads(state.decode('utf-8')))
+        with self._cache_lock:
+            self._cache[session_id] = (row[0], agent, time.time(), len(state))
+        return agent
+
+    def create(self, session_id: str, agent: MultiturnResumeAgent) -> None:
+        state = state_json(agent)
+        now = time.time()
+        conn = self._connection()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO sessions (session_id, state, revision, created_at, updated_at) VALUES (?, ?, 0, ?, ?)",
+                    (session_id, zlib.compress(state), now, now)
+                )
+        except sqlite3.IntegrityError:
+            raise SessionConflictError(f"Session {session_id} already exists")
+        with self._cache_lock:
+            self._cache[session_id] = (0, agent, now, len(state))
+
+    def save(self, session_id: str, agent: MultiturnResumeAgent) -> None:
+        with self._cache_lock:
+            cached = self._cache.get(session_id)
+        if cached is None or cached[1] is not agent:
+            # Loaded before an eviction or a reload of newer state; its revision is unknown
+            raise SessionConflictError(f"Session {session_id} was reloaded since this agent was read")
+
+        state = state_json(agent)
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            updated = conn.execute(
+                "UPDATE sessions SET state = ?, revision = revision + 1, updated_at = ? WHERE session_id = ? AND revision = ?",
+                (zlib.compress(state), now, session_id, cached[0])
+            ).rowcount
+        with self._cache_lock:
+            if updated:
+                self._cache[session_id] = (cached[0] + 1, agent, now, len(state))
+                return
+            # The local copy holds changes that were never stored
+            if self._cache.get(session_id, (None, None))[1] is agent:
+                del self._cache[session_id]
+        raise SessionConflictError(f"Session {session_id} was saved by another worker since revision {cached[0]}")
+
+    def delete(self, session_id: str) -> None:
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        with self._cache_lock:
+            self._cache.pop(session_id, None)
+
+    def exists(self, session_id: str) -> bool:
+        row = self._connection().execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row is not None
+
+    def session_ids(self) -> List[str]:
+        return [row[0] for row in self._connection().execute("SELECT session_id FROM sessions")]
+
+    def resident(self) -> List[Tuple[str, float, int]]:
+        with self._cache_lock:
+            entries = [(session_id, last_access, size) for session_id, (_, _, last_access, size) in self._cache.items()]
+        return sorted(entries, key=lambda entry: entry[1])
+
+    def expire_idle(self, cutoff: float) -> List[str]:
+        # updated_at is shared by all workers, so a session busy elsewhere is not expired here
+        conn = self._connection()
+        with conn:
+            expired = [row[0] for row in conn.execute("SELECT session_id FROM sessions WHERE updated_at < ?", (cutoff,))]
+            conn.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+        with self._cache_lock:
+            for session_id in expired:
+                self._cache.pop(session_id, None)
+        return expired
+
+    def evict(self, session_id: str) -> None:
+        # Every save is already on disk; just release the decoded agent
+        with self._cache_lock:
+            self._cache.pop(session_id, None)
+
+
+class SessionSweeper:
+    """Expires idle sessions and keeps this process under a session count and memory ceiling"""
+
+    def __init__(self,
+                 store: SessionStore,
+                 idle_ttl: Optional[float] = None,
+                 max_sessions: Optional[int] = None,
+                 max_bytes: Optional[int] = None,
+                 on_remove: Optional[Callable[[str], None]] = None):
+        self.store = store
+        self.idle_ttl = idle_ttl or float(os.getenv('SESSION_IDLE_TTL', 2 * 60 * 60))
+        self.max_sessions = max_sessions or int(os.getenv('SESSION_MAX_COUNT', '1000'))
+        self.max_bytes = max_bytes or int(float(os.getenv('SESSION_MAX_MEMORY_MB', '512')) * 1024 * 1024)
+        self.on_remove = on_remove
+        self.totals = {'expired': 0, 'evicted': 0, 'spilled': 0, 'sweeps': 0}
+
+    def sweep(self) -> Dict[str, int]:
+        """Run one pass; returns how many sessions were expired, evicted or spilled"""
+        result = {'expired': 0, 'evicted': 0, 'spilled': 0}
+
+        expired = self.store.expire_idle(time.time() - self.idle_ttl)
+        result['expired'] = len(expired)
+        for session_id in expired:
+            self._removed(session_id)
+
+        resident = self.store.resident()
+        total_bytes = sum(size for _, _, size in resident)
+        count = len(resident)
+
+        # Least recently used sessions go first until both limits are met
+        for session_id, _, size in resident:
+            if count <= self.max_sessions and total_bytes <= self.max_bytes:
+                break
+            self.store.evict(session_id)
+            count -= 1
+            total_bytes -= size
+            if self.store.persistent:
+                result['spilled'] += 1
+            else:
+                result['evicted'] += 1
+                self._removed(session_id)
+
+        for key, value in result.items():
+            self.totals[key] += value
+        self.totals['sweeps'] += 1
+        if any(result.values()):
+            logger.info(
+                f"Session sweep: {result['expired']} expired, {result['evicted']} evicted, "
+                f"{result['spilled']} spilled to disk; {count} resident (~{total_bytes // 1024} KiB)"
+            )
+        return result
+
+    def _removed(self, session_id: str) -> None:
+        if self.on_remove:
+            self.on_remove(session_id)
+
+
+def create_session_store() -> SessionStore:
+    """Build the store selected by SESSION_STORE ('memory' or 'sqlite')"""
+    backend = os.getenv('SESSION_STORE', 'memory').lower()
+    if backend == 'sqlite':
+        return SQLiteSessionStore()
+    if backend != 'memory':
+        logger.warning(f"Unknown SESSION_STORE '{backend}', using in-memory sessions")
+    return InMemorySessionStore()
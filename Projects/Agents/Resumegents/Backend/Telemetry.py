@@ -0,0 +1,362 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import bisect
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Append one JSON line per finished span to this file; unset disables trace export
+TRACE_EXPORT_PATH = os.getenv('TRACE_EXPORT_PATH')
+
+# Prometheus text exposition format served by /metrics
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; spans sub-millisecond cache hits up to multi-minute model calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """A named metric family with a fixed set of label names"""
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(Metric):
+    """Current values, either set directly or read from a callback at scrape time"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float], **labels: Any) -> None:
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = function()
+            except Exception as e:
+                logger.warning(f"Gauge {self.name}{key} callback failed: {str(e)}")
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: count in each bucket (non-cumulative, last is +Inf), sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def count(self, **labels: Any) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return sum(series[0]) if series else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, list(counts), total[0]) for key, (counts, total) in self._series.items())
+        lines = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """The metric families exposed on /metrics, in registration order"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Modules that share a family get the instance registered first
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    'resume_stage_duration_seconds', 'Time spent in each pipeline stage', ('stage', 'outcome'))
+HTTP_SECONDS = registry.histogram(
+    'resume_http_request_duration_seconds', 'Time to respond per endpoint (until the first byte for streams)',
+    ('app', 'method', 'endpoint'))
+HTTP_REQUESTS = registry.counter(
+    'resume_http_requests_total', 'Requests handled per endpoint and status code', ('app', 'method', 'endpoint', 'status'))
+MODEL_SECONDS = registry.histogram(
+    'resume_model_request_duration_seconds', 'Model call latency per prompt type, including retries', ('prompt_type', 'outcome'))
+MODEL_TOKENS = registry.counter(
+    'resume_model_tokens_total', 'Tokens used per prompt type and kind (input, output, cache_read, cache_creation)',
+    ('prompt_type', 'kind'))
+QUEUE_DEPTH = registry.gauge('resume_queue_depth', 'Work waiting in each queue', ('queue',))
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text format"""
+    return registry.render()
+
+
+def record_tokens(prompt_type: str, counts: Dict[str, int]) -> None:
+    """Add a response's token counts (as returned by ModelRequests.log_usage) to the counters"""
+    for kind in ('input', 'output', 'cache_read', 'cache_creation'):
+        field = f"{kind}_tokens" if kind in ('input', 'output') else f"{kind}_input_tokens"
+        MODEL_TOKENS.inc(counts.get(field, 0), prompt_type=prompt_type, kind=kind)
+
+
+def register_queue_depth(queue: str, depth: Callable[[], float]) -> None:
+    """Sample a queue's depth whenever /metrics is scraped"""
+    QUEUE_DEPTH.set_function(depth, queue=queue)
+
+
+# Trace spans: the innermost open span in this thread or task is the parent of the next
+_current_span: ContextVar[Optional['Span']] = ContextVar('current_span', default=None)
+_export_lock = threading.Lock()
+_export_file = None
+
+
+class Span:
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        parent = _current_span.get()
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration = 0.0
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def end(self, error: Optional[BaseException] = None) -> float:
+        self.duration = time.perf_counter() - self._started
+        if TRACE_EXPORT_PATH:
+            _export({
+                'trace_id': self.trace_id,
+                'span_id': self.span_id,
+                'parent_id': self.parent_id,
+                'name': self.name,
+                'start': self.start,
+                'duration_ms': round(self.duration * 1000, 3),
+                'status': 'error' if error else 'ok',
+                'error': f"{type(error).__name__}: {error}" if error else None,
+                'thread': threading.current_thread().name,
+                'attributes': self.attributes
+            })
+        return self.duration
+
+
+def _export(record: Dict[str, Any]) -> None:
+    global _export_file
+    line = json.dumps(record, default=str) + "\n"
+    with _export_lock:
+        try:
+            if _export_file is None:
+                _export_file = open(TRACE_EXPORT_PATH, 'a', encoding='utf-8', buffering=1)
+            _export_file.write(line)
+        except OSError as e:
+            logger.warning(f"Trace export to {TRACE_EXPORT_PATH} failed: {str(e)}")
+
+
+def start_span(name: str, **attributes: Any) -> Tuple[Span, Any]:
+    """Open a span and make it current, for hooks that cannot wrap the work in `with span()`"""
+    current = Span(name, attributes)
+    return current, _current_span.set(current)
+
+
+def end_span(current: Span, token: Any, error: Optional[BaseException] = None) -> float:
+    _current_span.reset(token)
+    return current.end(error)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """Trace a block as a span, nested under the span open around it"""
+    current = Span(name, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(e)
+        raise
+    else:
+        current.end()
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def stage(name: str, **attributes: Any) -> Iterator[Span]:
+    """Time a pipeline stage into resume_stage_duration_seconds and trace it as a span"""
+    with span(name, **attributes) as current:
+        try:
+            yield current
+        except BaseException:
+            STAGE_SECONDS.observe(time.perf_counter() - current._started, stage=name, outcome='error')
+            raise
+        STAGE_SECONDS.observe(time.perf_counter() - current._started, stage=name, outcome='ok')
+
+
+def timed(name: str) -> Callable:
+    """Decorator form of stage(); generator functions are timed until they are exhausted"""
+    def decorator(function: Callable) -> Callable:
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def generator_wrapper(*args: Any, **kwargs: Any) -> Iterator:
+                # Not made the current span: a generator may be resumed from other threads
+                current = Span(name, {})
+                outcome, error = 'ok', None
+                try:
+                    yield from function(*args, **kwargs)
+                except GeneratorExit:
+                    outcome = 'cancelled'
+                    raise
+                except BaseException as e:
+                    outcome, error = 'error', e
+                    raise
+                finally:
+                    STAGE_SECONDS.observe(current.end(error), stage=name, outcome=outcome)
+            return generator_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def model_call(prompt_type: str) -> Iterator[Span]:
+    """Time one model request (retries included) into resume_model_request_duration_seconds
+
+    The span is a leaf and is never made current, so this is safe inside generators
+    that are resumed from different threads.
+    """
+    current = Span('model_call', {'prompt_type': prompt_type})
+    outcome, error = 'ok', None
+    try:
+        yield current
+    except GeneratorExit:
+        outcome = 'cancelled'
+        raise
+    except BaseException as e:
+        outcome, error = 'error', e
+        raise
+    finally:
+        MODEL_SECONDS.observe(current.end(error), prompt_type=prompt_type, outcome=outcome)
+
+
+def observe_request(app: str, method: str, endpoint: str, status: int, seconds: float) -> None:
+    HTTP_SECONDS.observe(seconds, app=app, method=method, endpoint=endpoint)
+    HTTP_REQUESTS.inc(app=app, method=method, endpoint=endpoint, status=status)